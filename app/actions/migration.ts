@@ -4,6 +4,7 @@ import { s3Client, BUCKET_NAME, checkFileExists, getPublicUrl } from "@/lib/s3-c
 import { PutObjectCommand } from "@aws-sdk/client-s3";
 import { Upload } from "@aws-sdk/lib-storage"; // For efficient streaming uploads (optional, using simple put for now)
 import crypto from 'crypto';
+import { promises as fs } from 'fs';
 import path from 'path';
 
 function generateHash(buffer: Buffer): string {
@@ -84,6 +85,22 @@ async function uploadToS3(buffer: Buffer, key: string, contentType: string): Pro
   }
 }
 
+// Images mirrored by the scrapers (--mirror-images) live under public/ and are read from disk
+async function readMirroredImage(url: string): Promise<{ buffer: Buffer; contentType: string } | null> {
+  const publicDir = path.join(process.cwd(), 'public');
+  const file = path.join(publicDir, url);
+  if (!file.startsWith(publicDir + path.sep)) {
+    return null;
+  }
+  try {
+    const buffer = await fs.readFile(file);
+    const ext = path.extname(file).slice(1).toLowerCase();
+    return { buffer, contentType: `image/${ext === 'jpg' ? 'jpeg' : ext || 'jpeg'}` };
+  } catch {
+    return null;
+  }
+}
+
 export type MigrationResult = {
   success: boolean;
   newUrl?: string;
@@ -104,11 +121,11 @@ export async function migrateImage(
   }
   
   // Skip invalid URLs
-  if (!url || !url.startsWith('http')) {
+  if (!url || !(url.startsWith('http') || url.startsWith('/'))) {
       return { success: false, error: 'Invalid URL' };
   }
 
-  const imageData = await fetchImage(url);
+  const imageData = url.startsWith('/') ? await readMirroredImage(url) : await fetchImage(url);
   if (!imageData) {
     return { success: false, error: 'Failed to download image' };
   }
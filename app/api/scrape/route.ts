@@ -1,5 +1,6 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { spawn } from 'child_process';
+import net from 'net';
 import path from 'path';
 import fs from 'fs';
 
@@ -12,6 +13,143 @@ interface ScraperRequest {
   filename: string;
 }
 
+// Socket of a running `python3 scraper_daemon.py` (keeps Python and a warm browser between requests)
+const SCRAPER_SOCKET = process.env.SCRAPER_SOCKET || '/tmp/product-visualizer-scraper.sock';
+
+// SCRAPER_MIRROR_IMAGES=1: copy scraped images (and thumbnails) into public/mirror instead of hotlinking them
+const MIRROR_IMAGES = process.env.SCRAPER_MIRROR_IMAGES === '1';
+
+const streamHeaders = {
+  'Content-Type': 'text/event-stream',
+  'Cache-Control': 'no-cache',
+  'Connection': 'keep-alive',
+};
+
+// Map a scraper progress event (see EventLog in scraper_common.py) to a client message
+function relayEvent(event: Record<string, unknown>) {
+  switch (event.type) {
+    case 'row_finished':
+      // Partial result: the finished output row, so the client does not have to wait for the whole CSV
+      return event.data ? { type: 'row', row: event.row, data: event.data } : null;
+    case 'progress':
+      return {
+        type: 'progress',
+        done: event.done,
+        total: event.total,
+        rowsPerMinute: event.rows_per_minute,
+        etaSeconds: event.eta_seconds,
+      };
+    case 'captcha':
+    case 'circuit_open':
+    case 'retry':
+    case 'row_retry':
+    case 'error':
+      return { type: 'event', event };
+    default:
+      return null;
+  }
+}
+
+// Parse one NDJSON line; a line that is not JSON (e.g. a stray print) goes to the client as stderr text
+function parseLine(line: string, send: (message: object) => void) {
+  try {
+    return JSON.parse(line);
+  } catch {
+    send({ type: 'stderr', data: line + '\n' });
+    return null;
+  }
+}
+
+// Longest wait for the scraper daemon to accept the probe connection
+const DAEMON_PROBE_TIMEOUT_MS = 1000;
+
+// Whether the scraper daemon accepts connections. Any failure (a socket left by a daemon that died,
+// a file that is not a socket, no permission, no answer) means spawning the scraper instead.
+function daemonAvailable(): Promise<boolean> {
+  if (!fs.existsSync(SCRAPER_SOCKET)) return Promise.resolve(false);
+  return new Promise((resolve) => {
+    const probe = net.createConnection(SCRAPER_SOCKET, () => {
+      probe.end();
+      resolve(true);
+    });
+    probe.setTimeout(DAEMON_PROBE_TIMEOUT_MS, () => {
+      probe.destroy();
+      resolve(false);
+    });
+    probe.on('error', () => resolve(false));
+  });
+}
+
+// Send the job to the scraper daemon and relay its NDJSON replies in the same message format as a spawned scraper
+function streamFromDaemon(scraper: string, csvData: string, filename: string) {
+  const encoder = new TextEncoder();
+  const outputFilename = `${path.parse(filename).name}_updated.csv`;
+
+  const stream = new ReadableStream({
+    start(controller) {
+      let finished = false;
+      let buffer = '';
+      const send = (message: object) => {
+        controller.enqueue(encoder.encode(JSON.stringify(message) + '\n'));
+      };
+      const finish = (socket: net.Socket) => {
+        if (finished) return;
+        finished = true;
+        socket.end();
+        controller.close();
+      };
+
+      const socket = net.createConnection(SCRAPER_SOCKET, () => {
+        const job = { id: filename, scraper, csv: csvData, ...(MIRROR_IMAGES ? { mirror_images: true } : {}) };
+        socket.write(JSON.stringify(job) + '\n');
+      });
+      socket.setEncoding('utf8');
+
+      socket.on('data', (chunk) => {
+        buffer += chunk.toString();
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+          const line = buffer.slice(0, newline);
+          buffer = buffer.slice(newline + 1);
+          if (!line.trim() || finished) continue;
+
+          const reply = parseLine(line, send);
+          if (!reply) continue;
+          if (reply.type === 'row') {
+            send({ type: 'row', row: reply.row, data: reply.data });
+          } else if (reply.type === 'event') {
+            // Progress, CAPTCHA and retry events of the job, as a spawned scraper reports them
+            const message = relayEvent(reply.event);
+            if (message) send(message);
+          } else if (reply.type === 'complete') {
+            send({ type: 'complete', data: reply.csv, filename: outputFilename });
+            finish(socket);
+          } else if (reply.type === 'error') {
+            send({ type: 'error', data: reply.error });
+            finish(socket);
+          }
+        }
+      });
+
+      socket.on('error', (error) => {
+        if (!finished) {
+          send({ type: 'error', data: `Scraper daemon unavailable (${error.message}); start scraper_daemon.py or remove ${SCRAPER_SOCKET}` });
+        }
+        finish(socket);
+      });
+
+      socket.on('close', () => {
+        if (!finished) {
+          send({ type: 'error', data: 'Scraper daemon closed the connection' });
+        }
+        finish(socket);
+      });
+    },
+  });
+
+  return new NextResponse(stream, { headers: streamHeaders });
+}
+
 export async function POST(request: NextRequest) {
   try {
     const body: ScraperRequest = await request.json();
@@ -31,11 +169,17 @@ export async function POST(request: NextRequest) {
       );
     }
 
+    // Prefer the long-lived scraper daemon when it is running; otherwise spawn the scraper
+    if (await daemonAvailable()) {
+      return streamFromDaemon(scraper, csvData, filename);
+    }
+
     // Get the project root (parent of product-visualizer)
     const projectRoot = path.join(process.cwd(), '..');
     const scraperPath = path.join(projectRoot, scraperScript);
     const inputPath = path.join(projectRoot, filename);
     const outputPath = path.join(projectRoot, `${path.parse(filename).name}_updated.csv`);
+    const mirrorDir = path.join(process.cwd(), 'public', 'mirror');
 
     // Check if scraper exists
     if (!fs.existsSync(scraperPath)) {
@@ -60,16 +204,32 @@ export async function POST(request: NextRequest) {
           // Run Python scraper using venv
           const outputFilename = `${path.parse(filename).name}_updated.csv`;
           
-          const pythonProcess = spawn(pythonCmd, [scraperPath, filename, outputFilename], {
+          // stdout carries NDJSON progress events (--events -); the scraper's log lines go to stderr.
+          // Mirrored images go under this app's public/, where they are served and read.
+          const pythonProcess = spawn(pythonCmd, [
+            scraperPath, filename, outputFilename, '--events', '-', '--mirror-dir', mirrorDir,
+            ...(MIRROR_IMAGES ? ['--mirror-images'] : []),
+          ], {
             cwd: projectRoot,
           });
 
+          const send = (message: object) => {
+            controller.enqueue(encoder.encode(JSON.stringify(message) + '\n'));
+          };
+          let eventBuffer = '';
           pythonProcess.stdout.on('data', (data) => {
-            const message = JSON.stringify({
-              type: 'stdout',
-              data: data.toString(),
-            }) + '\n';
-            controller.enqueue(encoder.encode(message));
+            eventBuffer += data.toString();
+            let newline;
+            while ((newline = eventBuffer.indexOf('\n')) >= 0) {
+              const line = eventBuffer.slice(0, newline);
+              eventBuffer = eventBuffer.slice(newline + 1);
+              if (!line.trim()) continue;
+              const event = parseLine(line, send);
+              const message = event && relayEvent(event);
+              if (message) {
+                send(message);
+              }
+            }
           });
 
           pythonProcess.stderr.on('data', (data) => {
@@ -91,10 +251,11 @@ export async function POST(request: NextRequest) {
               }) + '\n';
               controller.enqueue(encoder.encode(message));
               
-              // Clean up files
+              // Clean up files, including the scraper's row journal (<output>.journal.jsonl)
               try {
                 fs.unlinkSync(inputPath);
                 fs.unlinkSync(outputPath);
+                fs.rmSync(`${outputPath}.journal.jsonl`, { force: true });
               } catch (e) {
                 console.error('Error cleaning up files:', e);
               }
@@ -127,13 +288,7 @@ export async function POST(request: NextRequest) {
       },
     });
 
-    return new NextResponse(stream, {
-      headers: {
-        'Content-Type': 'text/event-stream',
-        'Cache-Control': 'no-cache',
-        'Connection': 'keep-alive',
-      },
-    });
+    return new NextResponse(stream, { headers: streamHeaders });
   } catch (error) {
     console.error('Scraper API error:', error);
     return NextResponse.json(
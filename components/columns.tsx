@@ -55,7 +55,7 @@ export const columns: ColumnDef<Product>[] = [
     cell: ({ row }) => {
       const image = row.getValue("Image") as string;
       return image ? (
-        <ImagePreview src={image} alt={row.getValue("Product")} />
+        <ImagePreview src={image} alt={row.getValue("Product")} thumbnail={row.original["Image Thumbnail"]} />
       ) : (
         <div className="h-16 w-16 bg-muted rounded-md border flex items-center justify-center text-xs text-muted-foreground">
           No Img
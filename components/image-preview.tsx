@@ -11,9 +11,10 @@ import {
 interface ImagePreviewProps {
   src: string;
   alt: string;
+  thumbnail?: string; // Small local copy shown in the grid; the dialog still shows src
 }
 
-export function ImagePreview({ src, alt }: ImagePreviewProps) {
+export function ImagePreview({ src, alt, thumbnail }: ImagePreviewProps) {
   const [open, setOpen] = useState(false);
 
   if (!src) return null;
@@ -25,8 +26,9 @@ export function ImagePreview({ src, alt }: ImagePreviewProps) {
         onClick={() => setOpen(true)}
       >
         <img
-          src={src}
+          src={thumbnail || src}
           alt={alt}
+          loading="lazy"
           className="h-full w-full object-contain rounded-md border bg-white hover:ring-2 hover:ring-primary transition-all"
         />
       </div>
@@ -31,7 +31,7 @@ export function ProductCard({ product }: ProductCardProps) {
         return lower !== 'nan' && 
                lower !== 'none' && 
                img !== '' && 
-               (img.startsWith('http://') || img.startsWith('https://')); // Only valid URLs
+               (img.startsWith('http://') || img.startsWith('https://') || img.startsWith('/')); // URLs or mirrored paths
       });
     allImages.push(...additional);
   }
@@ -30,6 +30,21 @@ interface ScrapeDialogProps {
 type ScraperType = 'amazon' | 'amazon_js' | 'additional_images' | 'additional_images_js' | 'migrate_images';
 type ScraperStatus = 'idle' | 'running' | 'success' | 'error';
 
+interface ScraperProgress {
+  done: number;
+  total: number | null;
+  rowsPerMinute: number;
+  etaSeconds: number | null;
+}
+
+const formatProgress = ({ done, total, rowsPerMinute, etaSeconds }: ScraperProgress) => {
+  const parts = [`${done}${total !== null ? `/${total}` : ''} rows`, `${rowsPerMinute.toFixed(1)} rows/min`];
+  if (etaSeconds !== null) {
+    parts.push(etaSeconds < 60 ? `about ${Math.ceil(etaSeconds)}s left` : `about ${Math.ceil(etaSeconds / 60)} min left`);
+  }
+  return parts.join(' · ');
+};
+
 export function ScrapeDialog({ products, onDataChange }: ScrapeDialogProps) {
   const [open, setOpen] = useState(false);
   const [showDevWarning, setShowDevWarning] = useState(true);
@@ -41,6 +56,7 @@ export function ScrapeDialog({ products, onDataChange }: ScrapeDialogProps) {
   const [selectedScraper, setSelectedScraper] = useState<ScraperType>('amazon_js');
   const [scraperStatus, setScraperStatus] = useState<ScraperStatus>('idle');
   const [scraperOutput, setScraperOutput] = useState<string[]>([]);
+  const [scraperProgress, setScraperProgress] = useState<ScraperProgress | null>(null);
   const [showExportInstructions, setShowExportInstructions] = useState(false);
   const [password, setPassword] = useState('');
   const [isAuthenticated, setIsAuthenticated] = useState(false);
@@ -283,10 +299,20 @@ export function ScrapeDialog({ products, onDataChange }: ScrapeDialogProps) {
 
     setScraperStatus('running');
     setScraperOutput([]);
+    setScraperProgress(null);
 
     const controller = new AbortController();
     setAbortController(controller);
 
+    // Rows the scraper has already finished, by input row number, so a stopped or failed run keeps them
+    const finishedRows = new Map<number, Product>();
+    const keepFinishedRows = () => {
+      if (!onDataChange || finishedRows.size === 0) return;
+      const rows = Papa.parse(csvData, { header: true, skipEmptyLines: true }).data as Product[];
+      onDataChange(rows.map((row, index) => finishedRows.get(index) ?? row));
+      setScraperOutput(prev => [...prev, `\nKept ${finishedRows.size} finished rows`]);
+    };
+
     try {
       const timestamp = new Date().toISOString().replace(/[:.]/g, '-').slice(0, -5);
       const filename = sourceType === 'file' && uploadedFile 
@@ -330,19 +356,33 @@ export function ScrapeDialog({ products, onDataChange }: ScrapeDialogProps) {
           throw new Error('No response body');
         }
 
+        let buffer = '';
         while (true) {
           const { done, value } = await reader.read();
           if (done) break;
 
-          const chunk = decoder.decode(value);
-          const lines = chunk.split('\n').filter(Boolean);
+          // Messages can be split across chunks (finished rows are large), so only parse complete lines
+          buffer += decoder.decode(value, { stream: true });
+          const lines = buffer.split('\n');
+          buffer = lines.pop() ?? '';
 
-          for (const line of lines) {
+          for (const line of lines.filter(Boolean)) {
             try {
               const message = JSON.parse(line);
               
               if (message.type === 'stdout' || message.type === 'stderr') {
                 setScraperOutput(prev => [...prev, message.data]);
+              } else if (message.type === 'progress') {
+                setScraperProgress(message);
+              } else if (message.type === 'row') {
+                finishedRows.set(message.row, message.data);
+              } else if (message.type === 'event') {
+                const { event } = message;
+                if (event.type === 'captcha') {
+                  setScraperOutput(prev => [...prev, `⚠ CAPTCHA on ${event.host}, slowing down to ${event.rate} req/s`]);
+                } else if (event.type === 'circuit_open') {
+                  setScraperOutput(prev => [...prev, `⏸ ${event.host} paused for ${event.seconds}s, working on other rows`]);
+                }
               } else if (message.type === 'complete') {
                 setScraperStatus('success');
                 setScraperOutput(prev => [...prev, '\n✓ Scraping completed successfully!']);
@@ -357,6 +397,7 @@ export function ScrapeDialog({ products, onDataChange }: ScrapeDialogProps) {
               } else if (message.type === 'error') {
                 setScraperStatus('error');
                 setScraperOutput(prev => [...prev, `\n✗ Error: ${message.data}`]);
+                keepFinishedRows();
               }
             } catch (e) {
               console.error('Error parsing message:', e);
@@ -366,6 +407,7 @@ export function ScrapeDialog({ products, onDataChange }: ScrapeDialogProps) {
       }
     } catch (error) {
       setScraperStatus('error');
+      keepFinishedRows();
       
       // Check if it's a setup error with instructions
       if (error instanceof Error) {
@@ -425,6 +467,7 @@ export function ScrapeDialog({ products, onDataChange }: ScrapeDialogProps) {
   const resetDialog = () => {
     setScraperStatus('idle');
     setScraperOutput([]);
+    setScraperProgress(null);
     setShowExportInstructions(false);
     setSourceType('table');
     setUploadedFile(null);
@@ -737,7 +780,7 @@ export function ScrapeDialog({ products, onDataChange }: ScrapeDialogProps) {
                         </h4>
                       </div>
                       <p className="text-sm text-muted-foreground">
-                        {scraperStatus === 'running' && 'Please wait while we process your request...'}
+                        {scraperStatus === 'running' && (scraperProgress ? formatProgress(scraperProgress) : 'Please wait while we process your request...')}
                         {scraperStatus === 'success' && 'Data has been updated successfully.'}
                         {scraperStatus === 'error' && 'An error occurred. Check the logs below.'}
                       </p>
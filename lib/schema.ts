@@ -15,7 +15,8 @@ export const productSchema = z.object({
     message: "Invalid Main Category",
   }),
   "Sub-Category (EN)": z.string(),
-  Image: z.string().url().optional().or(z.literal("")),
+  Image: z.string().url().or(z.string().startsWith("/")).optional().or(z.literal("")), // Remote URL or /mirror/... path
+  "Image Thumbnail": z.string().optional(), // Local thumbnail written by the scrapers' --mirror-images
   "Additional Images": z.string().optional(), // Pipe-separated URLs for Magento compatibility
   "Short Description En": z.string().optional(),
   "Long Description En": z.string().optional(),
@@ -1,135 +1,42 @@
 import asyncio
+import argparse
 import pandas as pd
 from playwright.async_api import async_playwright
-import random
 import os
 import urllib.parse
 import re
-import sys
+
+from scraper_common import (
+    AMAZON_DOMAINS, DEFAULT_WORKERS, SEARCH_RESULT_SELECTORS, ColumnBuffer, LazyBrowser, add_asin_cache_args,
+    add_capture_args, add_dedupe_args, add_event_args, add_incremental_args, add_journal_args, add_rate_limit_args,
+    add_recycle_args, add_resource_filter_args, add_stream_args, asin_cache, configure_asin_cache,
+    configure_capture, configure_events, configure_incremental, configure_recycle, configure_resource_filter,
+    context_recycler, events, open_journal, plan_duplicates, product_keys, rate_limiter, resource_filter,
+    run_page_pool, run_stats, scrape_state, start_profiler, stop_profiler, stream_csv,
+)
+from scraper_brands import extract_brand, tag_brands
+from scraper_images import dedupe_image_list_column, is_blank_value, normalize_image_url
+from scraper_image_check import (
+    add_image_check_args, check_file, check_frame, configure_image_check, image_check_cache,
+)
+from scraper_image_hash import add_image_hash_args, collapse_file, collapse_frame, configure_image_hash, hash_index
+from scraper_image_mirror import add_image_mirror_args, configure_image_mirror, mirror_file, mirror_frame, mirror_store
+from scraper_shard import add_shard_args, configure_shard, run_shards, split_input
+from scraper_http import add_engine_args, close_engine, configure_engine, load_product_page, load_search_links
 
 # Constants
 INPUT_FILE = 'products_export_2025-11-27_17-32-35.csv'
 OUTPUT_FILE = 'products_export_2025-11-27_17-32-35_with_additional_images.csv'
-USER_AGENTS = [
-    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-]
-
-# Common brand patterns (case-insensitive matching)
-BRAND_PATTERNS = [
-    r'\b(NATURE REPUBLIC|NATURE REPUBLIC)\b',
-    r'\b(CHICCO)\b',
-    r'\b(ACCU-CHEK|ACCUCHEK)\b',
-    r'\b(JCKOO)\b',
-    r'\b(KARSEELL|KARSEELL®)\b',
-    r'\b(EDG PLANT)\b',
-    r'\b(OLAY)\b',
-    r'\b(NIVEA)\b',
-    r'\b(L\'OREAL|LOREAL)\b',
-    r'\b(GARNIER)\b',
-    r'\b(PANTENE)\b',
-    r'\b(HEAD & SHOULDERS|HEADANDSHOULDERS)\b',
-    r'\b(DOVE)\b',
-    r'\b(SEBAMED)\b',
-    r'\b(VICHY)\b',
-    r'\b(LA ROCHE-POSAY|LAROCHEPOSAY)\b',
-    r'\b(AVENE)\b',
-    r'\b(CETAPHIL)\b',
-    r'\b(BIODERMA)\b',
-    r'\b(CLINIQUE)\b',
-    r'\b(ESTEE LAUDER|ESTEELAUDER)\b',
-    r'\b(MAC)\b',
-    r'\b(MAYBELLINE)\b',
-    r'\b(REVLON)\b',
-    r'\b(RIMMEL)\b',
-]
-
-def extract_brand(product_name):
-    """Extract brand from product name using common patterns."""
-    if not product_name:
-        return None
-    
-    product_upper = product_name.upper()
-    
-    # Try to match brand patterns (without word boundaries to catch embedded brands)
-    for pattern in BRAND_PATTERNS:
-        # Remove word boundaries and try to find brand anywhere in the name
-        pattern_no_boundary = pattern.replace(r'\b', '')
-        match = re.search(pattern_no_boundary, product_upper, re.IGNORECASE)
-        if match:
-            brand = match.group(1)
-            # Normalize brand name
-            brand = brand.replace('®', '').strip()
-            return brand
-    
-    # Also try with word boundaries for exact matches
-    for pattern in BRAND_PATTERNS:
-        match = re.search(pattern, product_upper, re.IGNORECASE)
-        if match:
-            brand = match.group(1)
-            brand = brand.replace('®', '').strip()
-            return brand
-    
-    # If no pattern matches, try to extract first word(s) that look like a brand
-    # (usually capitalized words at the start)
-    words = product_name.split()
-    if len(words) > 0:
-        # Check if first word is all caps or title case (likely a brand)
-        first_word = words[0]
-        if first_word.isupper() or (first_word[0].isupper() and len(first_word) > 2):
-            # Check if second word is also part of brand
-            if len(words) > 1:
-                second_word = words[1]
-                if second_word.isupper() or (second_word[0].isupper() and len(second_word) > 2):
-                    return f"{first_word} {second_word}"
-            return first_word
-    
-    return None
-
-def ensure_image_extension(url):
-    """Ensure image URL has a proper image file extension."""
-    if not url:
-        return None
-    
-    # Common image extensions
-    image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.bmp']
-    
-    # Remove query parameters and fragments first
-    base_url = url.split('?')[0].split('#')[0]
-    
-    # Remove Amazon size parameters (._AC_SX425_, etc.) but preserve extension if it exists
-    # Pattern: ._AC_SX425_.jpg or ._AC_SX425_ (no extension)
-    if '._' in base_url:
-        # Split by ._ to separate base from size params
-        parts = base_url.split('._')
-        # Check if the last part (after ._) has an extension
-        last_part = parts[-1].lower()
-        if any(last_part.endswith(ext) for ext in image_extensions):
-            # Extension exists in size params, extract it
-            for ext in image_extensions:
-                if last_part.endswith(ext):
-                    # Get base without size params, add extension
-                    base_without_params = '._'.join(parts[:-1])
-                    return f"{base_without_params}{ext}"
-        else:
-            # No extension in size params, use base before ._
-            base_url = parts[0]
-    
-    # Check if URL already has an extension
-    url_lower = base_url.lower()
-    has_extension = any(url_lower.endswith(ext) for ext in image_extensions)
-    
-    if has_extension:
-        return base_url
-    
-    # For Amazon images, they typically use .jpg format
-    if any(domain in url_lower for domain in ['amazon.com', 'amazon.sa', 'amazon.ae', 'amazon.eg', 'media-amazon.com']):
-        # Amazon CDN images: add .jpg extension
-        return f"{base_url}.jpg"
-    
-    # For other URLs, default to .jpg (most common format)
-    return f"{base_url}.jpg"
+DOMAIN_SEARCH_MODES = ['sequential', 'parallel', 'combined']
+DOMAIN_SEARCH_MODE = 'sequential'
+MAX_IMAGES = 5
+SCRAPER = 'additional_images'  # Key for this scraper's rows in the scrape state file
+LANGUAGES = ('en', 'ar')
+# Field groups for --incremental: the output columns each one covers and the page language that fills them
+FIELD_GROUPS = {
+    'images': (['Image', 'Additional Images'], 'en'),
+    'arabic_name': (['Name Ar'], 'ar'),
+}
 
 def build_search_query(product_name, brand=None, category=None, subcategory=None):
     """Build a search query that includes brand and category for better matching."""
@@ -158,188 +65,217 @@ def extract_asin(url):
         return match.group(1)
     return None
 
-async def search_amazon_product_via_duckduckgo(page, product_name, brand=None, amazon_domains=['amazon.sa', 'amazon.ae', 'amazon.eg']):
-    """Search for product on Amazon using DuckDuckGo site search, return ASIN and domain."""
+def find_product_url(links, domain=None):
+    """Pick the first Amazon product link from extract_search_links() output, optionally on one domain."""
+    def is_product_link(href):
+        return href and ('/dp/' in href or '/gp/product/' in href) and (domain is None or domain in href.lower())
+
+    # Check the first 5 results of each selector
+    for selector in SEARCH_RESULT_SELECTORS:
+        for href in links[selector][:5]:
+            if is_product_link(href) and 'amazon' in href.lower():
+                return href
+    
+    # Fallback: try to find any Amazon link on the page
+    for href in links['a[href*="amazon"]'][:10]:
+        if is_product_link(href):
+            return href
+    return None
+
+async def run_duckduckgo_search(pages, search_query, slot=0):
+    """Run a DuckDuckGo search and return its result links (slot picks the worker's search page)."""
+    encoded_query = urllib.parse.quote(search_query)
+    search_url = f"https://duckduckgo.com/?q={encoded_query}"
     
+    print(f"  Searching DuckDuckGo: {search_query}")
+    return await load_search_links(pages, search_url, 'a[href*="amazon"]', timeout=20000, slot=slot)
+
+def cached_asin(product_name, brand, domain):
+    """Return (hit, asin) from the ASIN cache, logging hits."""
+    hit, asin = asin_cache.get(product_name, brand, domain)
+    if hit:
+        if asin:
+            print(f"  Cached ASIN for {domain}: {asin}")
+        else:
+            print(f"  Cached: no Amazon results for {domain}")
+    return hit, asin
+
+async def search_domain(pages, product_name, brand, domain, use_cache=True, slot=0):
+    """Search one Amazon domain via DuckDuckGo and return its ASIN, or None if nothing was found.
+
+    Cached results skip the search; errors are raised and not cached.
+    """
+    if use_cache:
+        hit, asin = cached_asin(product_name, brand, domain)
+        if hit:
+            return asin
+
+    # Use DuckDuckGo to search Amazon site
+    if brand:
+        search_query = f'site:{domain} {brand} {product_name}'
+    else:
+        search_query = f'site:{domain} {product_name}'
+    links = await run_duckduckgo_search(pages, search_query, slot)
+    
+    asin = None
+    product_url = find_product_url(links)
+    if product_url:
+        print(f"  Found product URL: {product_url[:100]}...")
+        asin = extract_asin(product_url)
+        if asin:
+            print(f"  Extracted ASIN: {asin}")
+        else:
+            print(f"  Could not extract ASIN from URL")
+    else:
+        print(f"  No Amazon results found on DuckDuckGo for {domain}")
+    asin_cache.set(product_name, brand, domain, asin)
+    return asin
+
+async def race_domains(pages, product_name, brand, amazon_domains):
+    """Search every domain at the same time and return the first ASIN in priority order.
+
+    Each uncached domain gets its own page slot in the worker's English
+    context. Searches of lower-priority domains are cancelled as soon as a
+    higher-priority domain has an answer.
+    """
+    cached = {}
+    for domain in amazon_domains:
+        hit, asin = cached_asin(product_name, brand, domain)
+        if hit:
+            cached[domain] = asin
+            if asin and all(cached.get(d, 'pending') is None for d in amazon_domains[:amazon_domains.index(domain)]):
+                return asin, domain
+
+    uncached = [domain for domain in amazon_domains if domain not in cached]
+    tasks = {
+        domain: asyncio.create_task(search_domain(pages, product_name, brand, domain, use_cache=False, slot=slot))
+        for slot, domain in enumerate(uncached)
+    }
+    try:
+        for domain in amazon_domains:
+            try:
+                asin = cached[domain] if domain in cached else await tasks[domain]
+            except Exception as e:
+                print(f"  Error searching {domain}: {e}")
+                continue
+            if asin:
+                return asin, domain
+        return None, None
+    finally:
+        pending = [task for task in tasks.values() if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+async def search_combined(pages, product_name, brand, amazon_domains):
+    """Search all domains with one combined DuckDuckGo query and pick the best result in priority order.
+
+    Only positive results are cached, since a domain missing from a combined
+    result page does not mean it has no listing.
+    """
+    for domain in amazon_domains:
+        hit, asin = cached_asin(product_name, brand, domain)
+        if hit and asin:
+            return asin, domain
+
+    sites = ' OR '.join(f'site:{domain}' for domain in amazon_domains)
+    search_query = f'({sites}) {brand} {product_name}' if brand else f'({sites}) {product_name}'
+    try:
+        links = await run_duckduckgo_search(pages, search_query)
+    except Exception as e:
+        print(f"  Error searching {', '.join(amazon_domains)}: {e}")
+        return None, None
+
+    for domain in amazon_domains:
+        product_url = find_product_url(links, domain)
+        asin = extract_asin(product_url) if product_url else None
+        if asin:
+            print(f"  Extracted ASIN for {domain}: {asin}")
+            asin_cache.set(product_name, brand, domain, asin)
+            return asin, domain
+    print(f"  No Amazon results found on DuckDuckGo")
+    return None, None
+
+async def search_amazon_product_via_duckduckgo(pages, product_name, brand=None, amazon_domains=AMAZON_DOMAINS, mode=None):
+    """Search for product on Amazon using DuckDuckGo site search, return ASIN and domain.
+
+    mode (default DOMAIN_SEARCH_MODE) is 'sequential' (one domain after the
+    other), 'parallel' (race all domains) or 'combined' (one OR query).
+    """
+    mode = mode or DOMAIN_SEARCH_MODE
+    if mode == 'parallel':
+        return await race_domains(pages, product_name, brand, amazon_domains)
+    if mode == 'combined':
+        return await search_combined(pages, product_name, brand, amazon_domains)
+
     for domain in amazon_domains:
         try:
-            # Use DuckDuckGo to search Amazon site
-            if brand:
-                search_query = f'site:{domain} {brand} {product_name}'
-            else:
-                search_query = f'site:{domain} {product_name}'
-            
-            encoded_query = urllib.parse.quote(search_query)
-            search_url = f"https://duckduckgo.com/?q={encoded_query}"
-            
-            print(f"  Searching DuckDuckGo: {search_query}")
-            await page.goto(search_url, wait_until='domcontentloaded', timeout=20000)
-            await page.wait_for_timeout(random.randint(1500, 2500))
-            
-            # Try multiple selectors for DuckDuckGo results
-            selectors = [
-                'h2 a',
-                'a[data-testid="result-title-a"]',
-                '.result__a',
-                'a.result__a',
-                'a[href*="amazon"]',
-                '.result a[href*="amazon"]'
-            ]
-            
-            product_url = None
-            for selector in selectors:
-                try:
-                    # Try to find all links first
-                    all_links = await page.locator(selector).all()
-                    for link in all_links[:5]:  # Check first 5 results
-                        href = await link.get_attribute('href', timeout=1000)
-                        if href and 'amazon' in href.lower() and ('/dp/' in href or '/gp/product/' in href):
-                            product_url = href
-                            break
-                    if product_url:
-                        break
-                except Exception as e:
-                    continue
-            
-            # Fallback: try to find any Amazon link on the page
-            if not product_url:
-                try:
-                    all_amazon_links = await page.locator('a[href*="amazon"]').all()
-                    for link in all_amazon_links[:10]:
-                        href = await link.get_attribute('href', timeout=1000)
-                        if href and ('/dp/' in href or '/gp/product/' in href):
-                            product_url = href
-                            break
-                except:
-                    pass
-            
-            if product_url:
-                print(f"  Found product URL: {product_url[:100]}...")
-                asin = extract_asin(product_url)
-                if asin:
-                    print(f"  Extracted ASIN: {asin}")
-                    return asin, domain
-                else:
-                    print(f"  Could not extract ASIN from URL")
-            else:
-                print(f"  No Amazon results found on DuckDuckGo for {domain}")
+            asin = await search_domain(pages, product_name, brand, domain)
+            if asin:
+                return asin, domain
         except Exception as e:
             print(f"  Error searching {domain}: {e}")
             continue
     
     return None, None
 
-async def scrape_amazon_images(page, asin, domain, max_images=5):
+def pick_product_images(data, max_images=5):
+    """Pick the cleaned main image and thumbnail URLs from an extract_product_page() payload."""
+    images = []
+
+    # Main product image: first selector with an absolute src
+    for src in data['main_images']:
+        if src and src.startswith('http'):
+            clean_url = normalize_image_url(src)
+            if clean_url and clean_url not in images:
+                images.append(clean_url)
+                print(f"    Main image: {clean_url[:80]}...")
+                break
+
+    # Additional images from thumbnails/gallery (data-old-src or src, without clicking)
+    for thumbnails in data['thumbnails']:
+        if not thumbnails:
+            continue
+        print(f"    Found {len(thumbnails)} thumbnails")
+
+        for thumb in thumbnails[:max_images * 2]:
+            src = thumb['data_old_src']
+            if not src or not src.startswith('http'):
+                src = thumb['src']
+
+            if src and src.startswith('http'):
+                # Skip transparent/placeholder images
+                if 'transparent' in src.lower() or 'pixel' in src.lower() or 'placeholder' in src.lower():
+                    continue
+
+                clean_url = normalize_image_url(src)
+                if clean_url and clean_url not in images and len(images) < max_images:
+                    images.append(clean_url)
+                    print(f"    Image {len(images)}: {clean_url[:80]}...")
+
+        if len(images) >= max_images:
+            break
+
+    return images[:max_images]
+
+async def scrape_amazon_images(pages, asin, domain, max_images=5):
     """Scrape images from Amazon product page using ASIN."""
     # Build Amazon product URL
     product_url = f"https://www.{domain}/-/en/dp/{asin}"
     print(f"  Accessing product page: {product_url}")
     
     try:
-        await page.goto(product_url, wait_until='domcontentloaded', timeout=30000)
-        await page.wait_for_timeout(random.randint(2000, 3000))
+        with run_stats.stage('en_page'):
+            data = await load_product_page(pages, product_url, 'en')
         
         # Check for CAPTCHA
-        try:
-            captcha_check = await page.locator('text=Enter the characters you see below').count(timeout=2000)
-            if "captcha" in page.url.lower() or captcha_check > 0:
-                print(f"  CAPTCHA detected, skipping...")
-                return []
-        except:
-            pass
-        
-        images = []
-        
-        # Try to get main product image with timeout
-        main_image_selectors = [
-            '#landingImage',
-            '#imgTagWrapperId img',
-            '.a-dynamic-image'
-        ]
-        
-        for selector in main_image_selectors:
-            try:
-                img = page.locator(selector).first
-                count = await img.count(timeout=3000)
-                if count > 0:
-                    src = await img.get_attribute('src', timeout=2000)
-                    if src and src.startswith('http'):
-                        # Get high-res version (remove size parameters like ._AC_SX425_)
-                        # But preserve extension if it exists
-                        if '._' in src:
-                            parts = src.split('._')
-                            base = parts[0]
-                            # Check if base already has extension
-                            if not any(base.lower().endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp']):
-                                clean_url = f"{base}.jpg"
-                            else:
-                                clean_url = base
-                        else:
-                            clean_url = src.split('?')[0]
-                        
-                        # Ensure URL has image extension
-                        clean_url = ensure_image_extension(clean_url)
-                        if clean_url and clean_url not in images:
-                            images.append(clean_url)
-                            print(f"    Main image: {clean_url[:80]}...")
-                            break
-            except Exception as e:
-                continue
-        
-        # Try to get additional images from thumbnails/gallery
-        thumbnail_selectors = [
-            '#imageBlock_feature_div ul li img',
-            '.a-button-thumbnail img',
-            '#altImages ul li img'
-        ]
-        
-        for selector in thumbnail_selectors:
-            try:
-                thumbnails = await page.locator(selector).all()
-                if len(thumbnails) > 0:
-                    print(f"    Found {len(thumbnails)} thumbnails")
-                    
-                    # Get image URLs from thumbnails without clicking (faster)
-                    for i, thumb in enumerate(thumbnails[:max_images * 2]):
-                        try:
-                            # Get data-old-src or src attribute
-                            src = await thumb.get_attribute('data-old-src', timeout=1000)
-                            if not src or not src.startswith('http'):
-                                src = await thumb.get_attribute('src', timeout=1000)
-                            
-                            if src and src.startswith('http'):
-                                # Skip transparent/placeholder images
-                                if 'transparent' in src.lower() or 'pixel' in src.lower() or 'placeholder' in src.lower():
-                                    continue
-                                
-                                # Get high-res version (remove size parameters like ._AC_SX425_)
-                                # But preserve extension if it exists
-                                if '._' in src:
-                                    # Split at ._ to remove size params, but check if extension exists before that
-                                    parts = src.split('._')
-                                    base = parts[0]
-                                    # Check if base already has extension
-                                    if not any(base.lower().endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp']):
-                                        clean_url = f"{base}.jpg"
-                                    else:
-                                        clean_url = base
-                                else:
-                                    clean_url = src.split('?')[0]
-                                
-                                # Ensure URL has image extension
-                                clean_url = ensure_image_extension(clean_url)
-                                if clean_url and clean_url not in images and len(images) < max_images:
-                                    images.append(clean_url)
-                                    print(f"    Image {len(images)}: {clean_url[:80]}...")
-                        except:
-                            continue
-                    
-                    if len(images) >= max_images:
-                        break
-            except:
-                continue
+        if data['captcha']:
+            print(f"  CAPTCHA detected, skipping...")
+            rate_limiter.penalize(product_url)
+            return []
         
-        return images[:max_images]
+        with run_stats.stage('image_extraction'):
+            return pick_product_images(data, max_images)
         
     except Exception as e:
         print(f"  Error scraping images: {e}")
@@ -347,45 +283,57 @@ async def scrape_amazon_images(page, asin, domain, max_images=5):
         traceback.print_exc()
         return []
 
-async def get_arabic_title(page, asin, domain):
+async def get_arabic_title(pages, asin, domain):
     """Fetch the product title from the Arabic version of the page."""
     url = f"https://www.{domain}/-/ar/dp/{asin}"
     print(f"  Fetching Arabic title: {url}")
     try:
-        await page.goto(url, wait_until='domcontentloaded', timeout=30000)
-        await page.wait_for_timeout(random.randint(1000, 2000))
+        with run_stats.stage('ar_page'):
+            data = await load_product_page(pages, url, 'ar')
         
         # Try to get title
-        if await page.locator('#productTitle').count() > 0:
-            title = await page.locator('#productTitle').first.inner_text()
-            return title.strip()
+        if data['title']:
+            return data['title'].strip()
         return None
     except Exception as e:
         print(f"  Error fetching Arabic title: {e}")
         return None
 
-async def scrape_additional_images(page, product_name, brand=None, category=None, subcategory=None, max_images=5):
-    """Scrape multiple images from Amazon product pages."""
+async def scrape_additional_images(pages, product_name, brand=None, category=None, subcategory=None, max_images=5,
+                                   languages=LANGUAGES):
+    """Scrape multiple images (EN page) and the Arabic title (AR page) from Amazon product pages.
+
+    The worker's EN and AR pages live in separate contexts, so both product
+    pages are loaded at the same time once the ASIN is known. Only the
+    pages in languages are loaded.
+    """
     print(f"  Searching for images: {product_name}")
     
     try:
         # Search Amazon via DuckDuckGo to find product page
-        asin, domain = await search_amazon_product_via_duckduckgo(page, product_name, brand)
+        with run_stats.stage('search'):
+            asin, domain = await search_amazon_product_via_duckduckgo(pages, product_name, brand)
         
         if not asin:
             print(f"  No product found on Amazon")
-            return []
+            return [], None, None, None
         
-        # Scrape images from the product page using ASIN
-        images = await scrape_amazon_images(page, asin, domain, max_images)
+        # Scrape images and the Arabic title from the product pages using ASIN
+        fetches = {}
+        if 'en' in languages:
+            fetches['en'] = scrape_amazon_images(pages, asin, domain, max_images)
+        if 'ar' in languages:
+            fetches['ar'] = get_arabic_title(pages, asin, domain)
+        fetched = dict(zip(fetches, await asyncio.gather(*fetches.values())))
+        images, arabic_name = fetched.get('en', []), fetched.get('ar')
         
-        return images, asin, domain
+        return images, asin, domain, arabic_name
         
     except Exception as e:
         print(f"  Error searching for images: {e}")
-        return [], None, None
+        return [], None, None, None
 
-async def validate_image_relevance(image_url, brand=None, product_name=None):
+def validate_image_relevance(image_url, brand=None, product_name=None):
     """Basic validation - check if image URL or alt text contains brand/product keywords."""
     if not brand and not product_name:
         return True  # No validation criteria
@@ -415,31 +363,41 @@ async def validate_image_relevance(image_url, brand=None, product_name=None):
     # In production, you might want to be more strict
     return True
 
-async def process_product(row, page, max_images=5):
-    """Process a single product to get additional images."""
+async def scrape_product(row, pages, max_images=5, brand=None, languages=LANGUAGES):
+    """Scrape a product's images (EN page) and Arabic name (AR page); returns (images, arabic_name), or None.
+
+    This is the part shared by duplicate rows of one product; merge_images()
+    turns it into each row's own result.
+    """
     product_name = row.get('Product', '')
     category = row.get('Main Category (EN)', '')
     subcategory = row.get('Sub-Category (EN)', '')
-    existing_image = row.get('Image', '')
-    existing_additional = row.get('Additional Images', '')
     
     print(f"\n--- Processing: {product_name} ---")
     
-    # Extract brand
-    brand = extract_brand(product_name)
+    # Extract brand (pre-tagged for the whole file by main)
+    brand = brand or extract_brand(product_name)
     if brand:
         print(f"  Detected brand: {brand}")
     else:
         print(f"  No brand detected")
     
-    # Scrape images (function now handles search internally)
-    images, asin, domain = await scrape_additional_images(page, product_name, brand, category, subcategory, max_images)
+    # Scrape images and Arabic title (function handles search internally)
+    images, asin, domain, arabic_name = await scrape_additional_images(pages, product_name, brand, category, subcategory,
+                                                                       max_images, languages)
     
-    arabic_name = None
-    if asin and domain:
-        arabic_name = await get_arabic_title(page, asin, domain)
-        if arabic_name:
-            print(f"  ✓ Found Arabic Name: {arabic_name[:50]}...")
+    if arabic_name:
+        print(f"  ✓ Found Arabic Name: {arabic_name[:50]}...")
+    if not images and not arabic_name:
+        return None  # Nothing found: the pool may retry the row
+    return images, arabic_name
+
+def merge_images(row, scraped, brand=None):
+    """Turn scrape_product()'s (images, arabic_name) into row's (main image, additional images, Arabic name)."""
+    images, arabic_name = scraped or ([], None)
+    product_name = row.get('Product', '')
+    existing_image = row.get('Image', '')
+    existing_additional = row.get('Additional Images', '')
 
     if not images:
         print(f"  No images found")
@@ -448,7 +406,7 @@ async def process_product(row, page, max_images=5):
     # Validate images (basic check)
     validated_images = []
     for img in images:
-        if await validate_image_relevance(img, brand, product_name):
+        if validate_image_relevance(img, brand, product_name):
             validated_images.append(img)
         else:
             print(f"  Skipped potentially irrelevant image: {img[:60]}...")
@@ -471,40 +429,17 @@ async def process_product(row, page, max_images=5):
         main_image = existing_image
         additional_images = [img for img in validated_images if img != existing_image]
     
-    # Combine with existing additional images
-    if existing_additional and pd.notna(existing_additional) and str(existing_additional).strip() and str(existing_additional).lower() not in ['nan', 'none']:
-        existing_list = [img.strip() for img in str(existing_additional).split('|') if img.strip() and img.strip().lower() not in ['nan', 'none']]
-        # Merge and deduplicate
-        all_images = existing_list + additional_images
-        unique_images = []
-        seen = set()
-        for img in all_images:
-            if img not in seen:
-                unique_images.append(img)
-                seen.add(img)
-        additional_images = unique_images
-    
-    print(f"  Found {len(additional_images)} additional images")
-    
     print(f"  Found {len(additional_images)} additional images")
-    
-    return main_image, '|'.join(additional_images) if additional_images else None, arabic_name
 
-async def main():
-    global INPUT_FILE, OUTPUT_FILE
+    # Combine with existing additional images; repeats are dropped column-wise when
+    # the result is written back (see dedupe_image_list_column)
+    if not is_blank_value(existing_additional):
+        additional_images = [str(existing_additional)] + additional_images
     
-    if len(sys.argv) > 2:
-        INPUT_FILE = sys.argv[1]
-        OUTPUT_FILE = sys.argv[2]
-        print(f"Using input file: {INPUT_FILE}")
-        print(f"Using output file: {OUTPUT_FILE}")
-
-    if not os.path.exists(INPUT_FILE):
-        print(f"Error: {INPUT_FILE} not found.")
-        return
+    return main_image, '|'.join(additional_images) if additional_images else None, arabic_name
 
-    df = pd.read_csv(INPUT_FILE)
-    
+def prepare_columns(df):
+    """Ensure the image and name columns exist as strings and default Name En to the product name."""
     # Ensure 'Image' column exists as string type
     if 'Image' not in df.columns:
         df['Image'] = ""
@@ -525,6 +460,137 @@ async def main():
     # Initialize Name En with Product if empty
     mask = (df['Name En'] == "") | (df['Name En'].isna())
     df.loc[mask, 'Name En'] = df.loc[mask, 'Product']
+    return df
+
+def due_languages(row):
+    """Product page languages to load for row; with --incremental only those with missing or stale fields."""
+    filled = {
+        group: not any(is_blank_value(row.get(col)) for col in columns)
+        for group, (columns, _) in FIELD_GROUPS.items()
+    }
+    # Name En keeps the English name after Product is replaced by the Arabic one
+    due = scrape_state.due(SCRAPER, row['Name En'], filled)
+    return tuple(lang for lang in LANGUAGES if any(FIELD_GROUPS[group][1] == lang for group in due))
+
+def record_scraped(name_en, result):
+    """Record in the scrape state which field groups a merge_images() result filled."""
+    main_image, additional_images, arabic_name = result or (None, None, None)
+    groups = []
+    if main_image or additional_images:
+        groups.append('images')
+    if arabic_name:
+        groups.append('arabic_name')
+    scrape_state.touch(SCRAPER, name_en, groups)
+
+def has_product_name(row):
+    """False for rows without a product name (those are copied to the output as they are)."""
+    return not (pd.isna(row.get('Product')) or not str(row.get('Product')).strip())
+
+def result_values(row, result):
+    """The output cells a merge_images() result sets for row (a Series or dict), as {column: value}."""
+    main_image, additional_images, arabic_name = result or (None, None, None)
+    values = {}
+
+    # Update Names
+    if arabic_name:
+        # Save original English name if not already saved
+        if is_blank_value(row.get('Name En')):
+            values['Name En'] = row['Product']
+
+        # Save Arabic name
+        values['Name Ar'] = arabic_name
+
+        # Update main Product column to Arabic
+        values['Product'] = arabic_name
+        print(f"  ✓ Updated Product name to Arabic")
+
+    # Update main image if it was missing
+    if main_image and is_blank_value(row.get('Image')):
+        values['Image'] = str(main_image)
+        print(f"  ✓ Assigned main image")
+
+    # Update additional images
+    if additional_images:
+        values['Additional Images'] = str(additional_images)
+        print(f"  ✓ Updated with {len(additional_images.split('|'))} additional images")
+    elif not values:
+        print(f"  ✗ No images found or updated")
+    return values
+
+def apply_result(row, result):
+    """Copy a merge_images() result into row (a Series) and return it."""
+    values = result_values(row, result)
+    if 'Additional Images' in values:
+        values['Additional Images'] = dedupe_image_list_column(pd.Series([values['Additional Images']])).iloc[0]
+    for column, value in values.items():
+        row[column] = value
+    return row
+
+def prepare_chunk(chunk):
+    """Yield (index, row, job item) for every row of an input chunk; rows without a product or fresh rows get no item."""
+    chunk = prepare_columns(chunk)
+    brands = tag_brands(chunk['Product'])
+    for index, row in chunk.iterrows():
+        if not has_product_name(row):
+            print(f"\n--- Row {index+1}: Skipping (no product name) ---")
+            yield index, row, None
+        else:
+            languages = due_languages(row)
+            yield index, row, (row, brands[index], languages) if languages else None
+
+async def handle_job(item, pages):
+    row, brand, languages = item
+    return await scrape_product(row, pages, MAX_IMAGES, brand, languages)
+
+def job_keys(item):
+    """Identity keys of a job for plan_duplicates(): searched name, barcode and ASINs cached for any domain."""
+    row, brand, _ = item
+    return product_keys(row['Product'], row.get('Barcode'),
+                        [asin_cache.peek(row['Product'], brand, domain) for domain in AMAZON_DOMAINS])
+
+def merge_jobs(items):
+    """One job for a group of duplicate rows: the first row's search, loading every language any row needs."""
+    row, brand, _ = items[0]
+    return row, brand, tuple(lang for lang in LANGUAGES if any(lang in languages for _, _, languages in items))
+
+def row_result(row, scraped):
+    """Row's own merge_images() result from the scrape_product() result its group shares."""
+    return merge_images(row, scraped, extract_brand(row.get('Product')))
+
+def journal_entry(result):
+    """What the row journal keeps for a merge_images() result (None = retry on --resume)."""
+    return list(result) if result and any(result) else None
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Scrape additional Amazon images and Arabic names for a product CSV.')
+    parser.add_argument('input_file', nargs='?', default=INPUT_FILE)
+    parser.add_argument('output_file', nargs='?', default=OUTPUT_FILE)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Number of browser pages scraping in parallel (default {DEFAULT_WORKERS})')
+    parser.add_argument('--max-images', type=int, default=MAX_IMAGES,
+                        help=f'Max images per product (default {MAX_IMAGES})')
+    parser.add_argument('--domain-search', choices=DOMAIN_SEARCH_MODES, default=DOMAIN_SEARCH_MODE,
+                        help='How to search amazon.sa/ae/eg: one after the other, all at once, or as one combined query')
+    add_rate_limit_args(parser)
+    add_asin_cache_args(parser)
+    add_journal_args(parser)
+    add_incremental_args(parser)
+    add_dedupe_args(parser)
+    add_stream_args(parser)
+    add_event_args(parser)
+    add_resource_filter_args(parser)
+    add_recycle_args(parser)
+    add_engine_args(parser)
+    add_image_check_args(parser)
+    add_image_mirror_args(parser)
+    add_image_hash_args(parser)
+    add_shard_args(parser)
+    add_capture_args(parser)
+    return parser.parse_args()
+
+async def scrape_file(browser, args, journal):
+    """Scrape the whole input in memory and write the output once at the end; returns the rows scraped."""
+    df = prepare_columns(pd.read_csv(INPUT_FILE))
     
     # Ask user for configuration
     print("=" * 60)
@@ -534,77 +600,180 @@ async def main():
     print("\nConfiguration:")
     
     # Auto-process all products (non-interactive mode)
-    process_all = True
     start_idx = 0
     end_idx = len(df)
-    max_images = 5  # Default max images per product
     
-    print(f"\nProcessing products {start_idx} to {end_idx} (max {max_images} images each)")
+    print(f"\nProcessing products {start_idx} to {end_idx} (max {MAX_IMAGES} images each, {args.workers} workers)")
     print("=" * 60)
+
+    # Product names are overwritten with Arabic ones, so match the journal on the input names
+    input_products = df['Product'].to_dict()
+    rows = dict(zip(df.index, df.to_dict('records')))
+    # Finished rows' new cells, written into df in one pass before saving
+    updates = ColumnBuffer()
+
+    # Replay rows finished by a previous run (--resume)
+    done = journal.load(input_products)
+    for index, result in done.items():
+        updates.add(index, result_values(rows[index], result))
+    if done:
+        print(f"Resuming: {len(done)} rows already done in {journal.path}")
+
+    # Tag every row's brand in one pass instead of per row
+    brands = tag_brands(df['Product'])
+
+    jobs = []
+    for index, row in rows.items():
+        if index in done:
+            continue
+
+        # Skip if product name is missing
+        if not has_product_name(row):
+            print(f"\n--- Row {index+1}: Skipping (no product name) ---")
+            continue
+        # Skip rows whose images and Arabic name are filled and fresh (--incremental)
+        languages = due_languages(row)
+        if not languages:
+            continue
+        jobs.append((index, (row, brands[index], languages)))
+    total = len(jobs)
+
+    members = {}
+    if not args.no_dedupe:
+        # Rows of the same product (name, barcode or cached ASIN) share one scrape
+        jobs, members = plan_duplicates(jobs, job_keys, merge_jobs)
+
+    completed = 0
+
+    def on_result(index, scraped):
+        nonlocal completed
+        for row_index in [index, *members.get(index, [])]:
+            completed += 1
+            print(f"\n--- Row {row_index+1} done ({completed}/{total}) ---")
+            result = row_result(rows[row_index], scraped)
+            values = result_values(rows[row_index], result)
+            updates.add(row_index, values)
+            journal.record(row_index, input_products[row_index], journal_entry(result))
+            record_scraped(rows[row_index]['Name En'], result)
+            events.row_finished(row_index, {**rows[row_index], **values})
+
+    events.start(total=total, workers=args.workers)
+    for index, result in done.items():
+        events.row_finished(index, {**rows[index], **result_values(rows[index], result)}, scraped=False)
+    await run_page_pool(browser, jobs, handle_job, workers=args.workers, on_result=on_result, retries=args.retries)
+    with run_stats.stage('write_back', emit=False):
+        written = updates.apply(df).get('Additional Images', [])
+        df.loc[written, 'Additional Images'] = dedupe_image_list_column(df.loc[written, 'Additional Images'])
+    if args.check_images != 'off':
+        df = await check_frame(df, args.check_images)
+    if args.collapse_images:
+        df = await collapse_frame(df)
+    if args.mirror_images:
+        df = await mirror_frame(df)
+    df.to_csv(OUTPUT_FILE, index=False, encoding='utf-8-sig')
+    return len(jobs)
+
+def stream_on_result(journal=None):
+    """stream_csv()'s on_result hook: log the row, journal it (when there is a journal) and update the scrape state."""
+    def on_result(index, row, result):
+        print(f"\n--- Row {index+1} done ---")
+        if journal is not None:
+            journal.record(index, row['Product'], journal_entry(result))
+        record_scraped(row['Name En'], result)
+    return on_result
+
+async def stream_file(browser, args, journal):
+    """--stream: scrape the input a chunk at a time, writing rows as they finish; returns the rows scraped."""
+
+    print(f"Streaming {INPUT_FILE} in chunks of {args.chunk_size} rows "
+          f"(max {MAX_IMAGES} images each, {args.workers} workers)")
+    events.start(workers=args.workers)
+    scraped = await stream_csv(browser, args, INPUT_FILE, OUTPUT_FILE, journal, handle_job, prepare_chunk,
+                               apply_result, stream_on_result(journal), job_keys=job_keys, merge_jobs=merge_jobs,
+                               row_result=row_result)
+    if args.check_images != 'off':
+        await check_file(OUTPUT_FILE, OUTPUT_FILE, args.check_images, args.chunk_size)
+    if args.collapse_images:
+        await collapse_file(OUTPUT_FILE, OUTPUT_FILE, args.chunk_size)
+    if args.mirror_images:
+        await mirror_file(OUTPUT_FILE, OUTPUT_FILE, args.chunk_size)
+    return scraped
+
+async def main():
+    global INPUT_FILE, OUTPUT_FILE, DOMAIN_SEARCH_MODE, MAX_IMAGES
+
+    args = parse_args()
+    configure_shard(args)
+    if args.shards > 1:
+        await run_shards(os.path.abspath(__file__), args)
+        if args.collapse_images:
+            # Each shard only matched photos among its own rows
+            configure_image_hash(args)
+            await collapse_file(args.output_file, args.output_file, args.chunk_size)
+            hash_index.close()
+        return
+    configure_events(args)
+    profiler = start_profiler(args)
+    INPUT_FILE = args.input_file
+    OUTPUT_FILE = args.output_file
+    DOMAIN_SEARCH_MODE = args.domain_search
+    MAX_IMAGES = args.max_images
+    print(f"Using input file: {INPUT_FILE}")
+    print(f"Using output file: {OUTPUT_FILE}")
+    rate_limiter.configure(rate=args.rate, jitter=args.jitter, share=args.rate_share)
+    configure_asin_cache(args)
+    configure_incremental(args)
+    configure_resource_filter(args)
+    configure_recycle(args)
+    configure_engine(args)
+    configure_image_check(args)
+    configure_image_mirror(args)
+    configure_image_hash(args)
+
+    if not os.path.exists(INPUT_FILE):
+        print(f"Error: {INPUT_FILE} not found.")
+        return
+    if args.shard:
+        print(f"Shard {args.shard[0]} of {args.shard[1]}: {split_input(INPUT_FILE, args.shard_input, *args.shard)} rows")
+        INPUT_FILE = args.shard_input
+    configure_capture(args, INPUT_FILE, args.corpus_input)
+    journal = open_journal(args, OUTPUT_FILE)
     
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)
-        context = await browser.new_context(user_agent=random.choice(USER_AGENTS))
-        page = await context.new_page()
-
-        for index in range(start_idx, min(end_idx + 1, len(df))):
-            row = df.iloc[index]
-            
-            # Skip if product name is missing
-            if pd.isna(row.get('Product')) or not str(row.get('Product')).strip():
-                print(f"\n--- Row {index+1}: Skipping (no product name) ---")
-                continue
-            
-            main_image, additional_images, arabic_name = await process_product(row, page, max_images)
-            
-            updated = False
-
-            # Update Names
-            if arabic_name:
-                # Save original English name if not already saved
-                if pd.isna(row.get('Name En')) or str(row.get('Name En')).strip() == "":
-                    df.at[index, 'Name En'] = row['Product']
-                
-                # Save Arabic name
-                df.at[index, 'Name Ar'] = arabic_name
-                
-                # Update main Product column to Arabic
-                df.at[index, 'Product'] = arabic_name
-                updated = True
-                print(f"  ✓ Updated Product name to Arabic")
-            
-            # Update main image if it was missing
-            if main_image and (pd.isna(row.get('Image')) or not str(row.get('Image', '')).strip() or str(row.get('Image', '')).lower() in ['nan', 'none']):
-                df.at[index, 'Image'] = str(main_image)
-                updated = True
-                print(f"  ✓ Assigned main image")
-            
-            # Update additional images
-            if additional_images:
-                # Ensure column is string type to avoid dtype warnings
-                if 'Additional Images' not in df.columns:
-                    df['Additional Images'] = ''
-                df.at[index, 'Additional Images'] = str(additional_images)
-                print(f"  ✓ Updated with {len(additional_images.split('|'))} additional images")
-                updated = True
-            elif not updated:
-                print(f"  ✗ No images found or updated")
-            
-            # Save periodically (every 5 products)
-            if (index - start_idx + 1) % 5 == 0:
-                df.to_csv(OUTPUT_FILE, index=False, encoding='utf-8-sig')
-                print(f"\n  💾 Progress saved to {OUTPUT_FILE}")
-            
-            # Small delay between products
-            await page.wait_for_timeout(random.randint(1000, 2000))
-
+        browser = LazyBrowser(p, headless=args.headless)
+        if args.stream:
+            scraped = await stream_file(browser, args, journal)
+        else:
+            scraped = await scrape_file(browser, args, journal)
+        await context_recycler.close()
         await browser.close()
+    await close_engine()
+    journal.close()
 
-    df.to_csv(OUTPUT_FILE, index=False, encoding='utf-8-sig')
+    print(f"ASIN cache: {asin_cache.hits} hits, {asin_cache.misses} misses")
+    if run_stats.duplicates:
+        print(f"Deduplicated: {run_stats.duplicates} rows shared another row's scrape "
+              f"(~{run_stats.pages_saved(scraped)} page loads saved)")
+    if scrape_state.incremental:
+        print(f"Incremental: {scrape_state.skipped} rows already fresh, left as they were")
+    scrape_state.close()
+    print(resource_filter.summary())
+    print(context_recycler.summary())
+    asin_cache.close()
+    image_check_cache.close()
+    mirror_store.close()
+    hash_index.close()
+    if args.stats_file:
+        run_stats.write(args.stats_file, scraped)
+    if args.timings:
+        run_stats.report(scraped)
+    stop_profiler(profiler, args)
+    events.close(scraped)
+    if args.shard:
+        os.remove(INPUT_FILE)
     print(f"\n{'=' * 60}")
     print(f"Done! Saved to {OUTPUT_FILE}")
     print(f"{'=' * 60}")
 
 if __name__ == "__main__":
     asyncio.run(main())
-
@@ -1,19 +1,32 @@
 import asyncio
+import argparse
 import pandas as pd
 from playwright.async_api import async_playwright
-import random
 import os
 import re
-import sys
+
+from scraper_common import (
+    DEFAULT_WORKERS, ColumnBuffer, LazyBrowser, add_asin_cache_args, add_capture_args, add_dedupe_args,
+    add_event_args, add_incremental_args, add_journal_args, add_rate_limit_args, add_recycle_args,
+    add_resource_filter_args, add_stream_args, asin_cache, configure_asin_cache, configure_capture,
+    configure_events, configure_incremental, configure_recycle, configure_resource_filter, context_recycler, events,
+    open_journal, plan_duplicates, product_keys, rate_limiter, resource_filter, run_page_pool, run_stats,
+    scrape_state, start_profiler, stop_profiler, stream_csv,
+)
+from scraper_brands import extract_brand, tag_brands
+from scraper_images import is_blank_value
+from scraper_image_check import (
+    add_image_check_args, check_file, check_frame, configure_image_check, image_check_cache,
+)
+from scraper_image_mirror import add_image_mirror_args, configure_image_mirror, mirror_file, mirror_frame, mirror_store
+from scraper_shard import add_shard_args, configure_shard, run_shards, split_input
+from scraper_http import add_engine_args, close_engine, configure_engine, load_product_page, load_search_links
 
 # Constants
 INPUT_FILE = 'products.csv'
 OUTPUT_FILE = 'products_updated.csv'
-USER_AGENTS = [
-    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-]
+SCRAPER = 'amazon'  # Key for this scraper's rows in the scrape state file
+LANGUAGES = ('en', 'ar')
 
 def extract_asin(url):
     # Common patterns: /dp/B0..., /gp/product/B0...
@@ -22,16 +35,17 @@ def extract_asin(url):
         return match.group(1)
     return None
 
-async def get_amazon_content(page, url, lang='en'):
+async def get_amazon_content(pages, url, lang='en'):
     print(f"Visiting ({lang}): {url}")
     try:
-        await page.goto(url, wait_until='domcontentloaded', timeout=60000)
-        await page.wait_for_timeout(random.randint(2000, 5000))
-        print(f"Page Title ({lang}): {await page.title()}")
+        with run_stats.stage(f'{lang}_page'):
+            data = await load_product_page(pages, url, lang, timeout=60000)
+        print(f"Page Title ({lang}): {data['page_title']}")
         
         # Check for captcha
-        if "captcha" in page.url or await page.locator('text=Enter the characters you see below').count() > 0:
+        if data['captcha']:
             print("AMAZON CAPTCHA DETECTED!")
+            rate_limiter.penalize(url)
             # In a real scenario, we might pause or try to solve. 
             # For now, return None to indicate failure.
             return None
@@ -40,25 +54,15 @@ async def get_amazon_content(page, url, lang='en'):
         
         # Image (only needed once, usually from English page)
         if lang == 'en':
-            img_selector = '#landingImage, #imgTagWrapperId img, .a-dynamic-image'
-            if await page.locator(img_selector).count() > 0:
-                content['image'] = await page.locator(img_selector).first.get_attribute('src')
-            else:
-                content['image'] = ""
+            with run_stats.stage('image_extraction'):
+                content['image'] = next((src for src in data['main_images'] if src), "")
 
         # Short Description (Bullet points)
-        bullets_selector = '#feature-bullets ul li span.a-list-item'
-        bullets = await page.locator(bullets_selector).all_inner_texts()
-        content['short_desc'] = "\n".join([b.strip() for b in bullets if b.strip()])
+        content['short_desc'] = "\n".join([b.strip() for b in data['bullets'] if b.strip()])
 
         # Long Description
-        # #productDescription, #aplus, .aplus-v2
-        long_desc = ""
-        if await page.locator('#productDescription').count() > 0:
-            long_desc = await page.locator('#productDescription').inner_text()
-        elif await page.locator('#aplus').count() > 0:
-            long_desc = await page.locator('#aplus').inner_text()
-        
+        # #productDescription, #aplus
+        long_desc = data['description'] or data['aplus'] or ""
         content['long_desc'] = long_desc.strip()
         
         return content
@@ -67,116 +71,342 @@ async def get_amazon_content(page, url, lang='en'):
         print(f"Error fetching {url}: {e}")
         return None
 
-async def search_and_scrape(row, page):
-    product_name = row['Product']
-    print(f"Processing: {product_name}")
+async def search_asin(pages, product_name):
+    """Find the amazon.sa ASIN for a product via DuckDuckGo.
 
-    # 1. DuckDuckGo Search for Amazon SA
+    Returns the ASIN, None when the search found nothing, or False when the
+    search itself failed (so the caller does not cache the miss).
+    """
     search_query = f'site:amazon.sa {product_name}'
     encoded_query = search_query.replace(' ', '+')
     search_url = f"https://duckduckgo.com/?q={encoded_query}"
-    
-    asin = None
-    
+
     try:
-        await page.goto(search_url, wait_until='domcontentloaded')
-        await page.wait_for_timeout(random.randint(2000, 4000))
-
-        # Get first result link
-        link_locator = page.locator('h2 a').first
-        if await link_locator.count() > 0:
-            product_url = await link_locator.get_attribute('href')
-            print(f"Found Search URL: {product_url}")
-            asin = extract_asin(product_url)
-        else:
-            print("No results found on DuckDuckGo.")
-            return None
+        links = await load_search_links(pages, search_url, 'h2 a', selectors=['h2 a'], timeout=30000)
+    except Exception as e:
+        print(f"Error searching DuckDuckGo: {e}")
+        return False
 
+    # Get first result link
+    links = [href for href in links['h2 a'] if href]
+    if links:
+        product_url = links[0]
+        print(f"Found Search URL: {product_url}")
+        asin = extract_asin(product_url)
         if not asin:
             print("Could not extract ASIN from URL.")
-            return None
-            
-        print(f"ASIN: {asin}")
+        return asin
 
-        # 2. Scrape English Content
-        en_url = f"https://www.amazon.sa/-/en/dp/{asin}"
-        en_content = await get_amazon_content(page, en_url, lang='en')
-        
-        if not en_content:
+    print("No results found on DuckDuckGo.")
+    return None
+
+async def search_and_scrape(row, pages, brand=None, languages=LANGUAGES):
+    """Find the product's ASIN and scrape its product page in each of languages.
+
+    The result only has the fields of the pages that were loaded (see
+    RESULT_COLUMNS); None when nothing was found.
+    """
+    product_name = row['Product']
+    brand = brand or extract_brand(product_name)
+    print(f"Processing: {product_name}")
+
+    try:
+        # 1. DuckDuckGo Search for Amazon SA (skipped when the ASIN is cached)
+        hit, asin = asin_cache.get(product_name, brand, 'amazon.sa')
+        if hit:
+            if not asin:
+                print("Cached: no results found on DuckDuckGo.")
+                return None
+            print(f"Cached ASIN: {asin}")
+        else:
+            with run_stats.stage('search'):
+                asin = await search_asin(pages, product_name)
+            if asin is False:
+                return None
+            asin_cache.set(product_name, brand, 'amazon.sa', asin)
+            if not asin:
+                return None
+            print(f"ASIN: {asin}")
+
+        # 2. Scrape English and Arabic Content at the same time (each page has its own locale cookies)
+        contents = await asyncio.gather(*(
+            get_amazon_content(pages, f"https://www.amazon.sa/-/{lang}/dp/{asin}", lang=lang) for lang in languages
+        ))
+        en_content, ar_content = (dict(zip(languages, contents)).get(lang) for lang in LANGUAGES)
+
+        if 'en' in languages and not en_content:
+            return None
+        if not en_content and not ar_content:
             return None
 
-        # 3. Scrape Arabic Content
-        # Clear cookies to ensure language switch works or use the URL to force it
-        await page.context.clear_cookies()
-        
-        ar_url = f"https://www.amazon.sa/-/ar/dp/{asin}"
-        ar_content = await get_amazon_content(page, ar_url, lang='ar')
-        
-        if not ar_content:
-            # If Arabic fails, we still return English content
-            ar_content = {'short_desc': '', 'long_desc': ''}
-
-        return {
-            'image': en_content.get('image', ''),
-            'short_desc_en': en_content.get('short_desc', ''),
-            'long_desc_en': en_content.get('long_desc', ''),
-            'short_desc_ar': ar_content.get('short_desc', ''),
-            'long_desc_ar': ar_content.get('long_desc', '')
-        }
+        result = {}
+        if en_content:
+            result.update({
+                'image': en_content.get('image', ''),
+                'short_desc_en': en_content.get('short_desc', ''),
+                'long_desc_en': en_content.get('long_desc', ''),
+            })
+        if 'ar' in languages:
+            if not ar_content:
+                # If Arabic fails, we still return English content
+                ar_content = {'short_desc': '', 'long_desc': ''}
+            result.update({
+                'short_desc_ar': ar_content.get('short_desc', ''),
+                'long_desc_ar': ar_content.get('long_desc', ''),
+            })
+        return result
 
     except Exception as e:
         print(f"Error processing {product_name}: {e}")
         return None
 
+# Output column for each field of a search_and_scrape() result
+RESULT_COLUMNS = {
+    'Image': 'image',
+    'Short Description En': 'short_desc_en',
+    'Long Description En': 'long_desc_en',
+    'Short Description Ar': 'short_desc_ar',
+    'Long Description Ar': 'long_desc_ar',
+}
+
+# Field groups for --incremental: the output columns each one covers and the page language that fills them
+FIELD_GROUPS = {
+    'images': (['Image'], 'en'),
+    'en': (['Short Description En', 'Long Description En'], 'en'),
+    'ar': (['Short Description Ar', 'Long Description Ar'], 'ar'),
+}
+
+def due_languages(row):
+    """Product page languages to load for row; with --incremental only those with missing or stale fields."""
+    filled = {
+        group: not any(is_blank_value(row.get(col)) for col in columns)
+        for group, (columns, _) in FIELD_GROUPS.items()
+    }
+    due = scrape_state.due(SCRAPER, row['Product'], filled)
+    return tuple(lang for lang in LANGUAGES if any(FIELD_GROUPS[group][1] == lang for group in due))
+
+def record_scraped(product_name, data):
+    """Record in the scrape state which field groups a search_and_scrape() result filled."""
+    if data:
+        scrape_state.touch(SCRAPER, product_name, [
+            group for group, (columns, _) in FIELD_GROUPS.items()
+            if any(data.get(RESULT_COLUMNS[col]) for col in columns)
+        ])
+
+def add_result_columns(df):
+    """Ensure the output columns exist."""
+    for col in RESULT_COLUMNS:
+        if col not in df.columns:
+            df[col] = ""
+    return df
+
+def result_values(data):
+    """The output cells a search_and_scrape() result sets, as {column: value}."""
+    if not data:
+        return {}
+    return {col: data[field] for col, field in RESULT_COLUMNS.items() if field in data}
+
+def apply_result(row, data):
+    """Copy a search_and_scrape() result into the output columns of row (a Series)."""
+    for col, value in result_values(data).items():
+        row[col] = value
+    return row
+
+def prepare_chunk(chunk):
+    """Yield (index, row, job item) for every row of an input chunk (see stream_csv()); fresh rows get no item."""
+    chunk = add_result_columns(chunk)
+    brands = tag_brands(chunk['Product'])
+    for index, row in chunk.iterrows():
+        languages = due_languages(row)
+        yield index, row, (row, brands[index], languages) if languages else None
+
+async def handle_job(item, pages):
+    row, brand, languages = item
+    return await search_and_scrape(row, pages, brand, languages)
+
+def job_keys(item):
+    """Identity keys of a job for plan_duplicates(): product name, barcode and cached ASIN."""
+    row, brand, _ = item
+    return product_keys(row['Product'], row.get('Barcode'), [asin_cache.peek(row['Product'], brand, 'amazon.sa')])
+
+def merge_jobs(items):
+    """One job for a group of duplicate rows: the first row's search, loading every language any row needs."""
+    row, brand, _ = items[0]
+    return row, brand, tuple(lang for lang in LANGUAGES if any(lang in languages for _, _, languages in items))
+
+def row_result(row, data):
+    """A search_and_scrape() result does not depend on the row, so duplicate rows take it as it is."""
+    return data
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Scrape Amazon descriptions and images for a product CSV.')
+    parser.add_argument('input_file', nargs='?', default=INPUT_FILE)
+    parser.add_argument('output_file', nargs='?', default=OUTPUT_FILE)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Number of browser pages scraping in parallel (default {DEFAULT_WORKERS})')
+    add_rate_limit_args(parser)
+    add_asin_cache_args(parser)
+    add_journal_args(parser)
+    add_incremental_args(parser)
+    add_dedupe_args(parser)
+    add_stream_args(parser)
+    add_event_args(parser)
+    add_resource_filter_args(parser)
+    add_recycle_args(parser)
+    add_engine_args(parser)
+    add_image_check_args(parser)
+    add_image_mirror_args(parser)
+    add_shard_args(parser)
+    add_capture_args(parser)
+    return parser.parse_args()
+
+async def scrape_file(browser, args, journal):
+    """Scrape the whole input in memory and write the output once at the end; returns the rows scraped."""
+    df = add_result_columns(pd.read_csv(INPUT_FILE))
+    rows = dict(zip(df.index, df.to_dict('records')))
+    # Finished rows' new cells, written into df in one pass before saving
+    updates = ColumnBuffer()
+
+    # Replay rows finished by a previous run (--resume)
+    done = journal.load(df['Product'].to_dict())
+    for index, data in done.items():
+        updates.add(index, result_values(data))
+    if done:
+        print(f"Resuming: {len(done)} rows already done in {journal.path}")
+
+    # Tag every row's brand in one pass instead of per row
+    brands = tag_brands(df['Product'])
+
+    jobs = []
+    for index, row in rows.items():
+        if index in done:
+            continue
+        # Skip rows whose fields are all filled and fresh (--incremental)
+        languages = due_languages(row)
+        if not languages:
+            continue
+        jobs.append((index, (row, brands[index], languages)))
+    total = len(jobs)
+
+    members = {}
+    if not args.no_dedupe:
+        # Rows of the same product (name, barcode or cached ASIN) share one scrape
+        jobs, members = plan_duplicates(jobs, job_keys, merge_jobs)
+
+    completed = 0
+
+    def on_result(index, data):
+        nonlocal completed
+        values = result_values(data)
+        for row_index in [index, *members.get(index, [])]:
+            completed += 1
+            print(f"--- Row {row_index+1} done ({completed}/{total}) ---")
+            updates.add(row_index, values)
+            journal.record(row_index, rows[row_index]['Product'], data)
+            record_scraped(rows[row_index]['Product'], data)
+            events.row_finished(row_index, {**rows[row_index], **values})
+
+    print(f"Scraping {total} rows with {args.workers} workers"
+          + (f" ({len(jobs)} distinct products)" if members else ""))
+    events.start(total=total, workers=args.workers)
+    for index, data in done.items():
+        events.row_finished(index, {**rows[index], **result_values(data)}, scraped=False)
+    await run_page_pool(browser, jobs, handle_job, workers=args.workers, on_result=on_result, retries=args.retries)
+    with run_stats.stage('write_back', emit=False):
+        updates.apply(df)
+    if args.check_images != 'off':
+        df = await check_frame(df, args.check_images)
+    if args.mirror_images:
+        df = await mirror_frame(df)
+    df.to_csv(OUTPUT_FILE, index=False, encoding='utf-8-sig')
+    return len(jobs)
+
+def stream_on_result(journal=None):
+    """stream_csv()'s on_result hook: log the row, journal it (when there is a journal) and update the scrape state."""
+    def on_result(index, row, data):
+        print(f"--- Row {index+1} done ---")
+        if journal is not None:
+            journal.record(index, row['Product'], data)
+        record_scraped(row['Product'], data)
+    return on_result
+
+async def stream_file(browser, args, journal):
+    """--stream: scrape the input a chunk at a time, writing rows as they finish; returns the rows scraped."""
+
+    print(f"Streaming {INPUT_FILE} in chunks of {args.chunk_size} rows with {args.workers} workers")
+    events.start(workers=args.workers)
+    scraped = await stream_csv(browser, args, INPUT_FILE, OUTPUT_FILE, journal, handle_job, prepare_chunk,
+                               apply_result, stream_on_result(journal), job_keys=job_keys, merge_jobs=merge_jobs,
+                               row_result=row_result)
+    if args.check_images != 'off':
+        await check_file(OUTPUT_FILE, OUTPUT_FILE, args.check_images, args.chunk_size)
+    if args.mirror_images:
+        await mirror_file(OUTPUT_FILE, OUTPUT_FILE, args.chunk_size)
+    return scraped
+
 async def main():
     global INPUT_FILE, OUTPUT_FILE
-    
-    if len(sys.argv) > 2:
-        INPUT_FILE = sys.argv[1]
-        OUTPUT_FILE = sys.argv[2]
-        print(f"Using input file: {INPUT_FILE}")
-        print(f"Using output file: {OUTPUT_FILE}")
+
+    args = parse_args()
+    configure_shard(args)
+    if args.shards > 1:
+        await run_shards(os.path.abspath(__file__), args)
+        return
+    configure_events(args)
+    profiler = start_profiler(args)
+    INPUT_FILE = args.input_file
+    OUTPUT_FILE = args.output_file
+    print(f"Using input file: {INPUT_FILE}")
+    print(f"Using output file: {OUTPUT_FILE}")
+    rate_limiter.configure(rate=args.rate, jitter=args.jitter, share=args.rate_share)
+    configure_asin_cache(args)
+    configure_incremental(args)
+    configure_resource_filter(args)
+    configure_recycle(args)
+    configure_engine(args)
+    configure_image_check(args)
+    configure_image_mirror(args)
 
     if not os.path.exists(INPUT_FILE):
         print(f"Error: {INPUT_FILE} not found.")
         return
-
-    df = pd.read_csv(INPUT_FILE)
-    
-    # Ensure columns exist
-    new_cols = ['Image', 'Short Description En', 'Long Description En', 'Short Description Ar', 'Long Description Ar']
-    for col in new_cols:
-        if col not in df.columns:
-            df[col] = ""
+    if args.shard:
+        print(f"Shard {args.shard[0]} of {args.shard[1]}: {split_input(INPUT_FILE, args.shard_input, *args.shard)} rows")
+        INPUT_FILE = args.shard_input
+    configure_capture(args, INPUT_FILE, args.corpus_input)
+    journal = open_journal(args, OUTPUT_FILE)
 
     async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)
-        context = await browser.new_context(user_agent=random.choice(USER_AGENTS))
-        page = await context.new_page()
-
-        for index, row in df.iterrows():
-            # Skip if already has info (optional)
-            # if pd.notna(row['Long Description En']) and row['Long Description En'] != "":
-            #     continue
-
-            print(f"--- Row {index+1} ---")
-            data = await search_and_scrape(row, page)
-            
-            if data:
-                df.at[index, 'Image'] = data['image']
-                df.at[index, 'Short Description En'] = data['short_desc_en']
-                df.at[index, 'Long Description En'] = data['long_desc_en']
-                df.at[index, 'Short Description Ar'] = data['short_desc_ar']
-                df.at[index, 'Long Description Ar'] = data['long_desc_ar']
-            
-            # Save periodically
-            if index % 5 == 0:
-                df.to_csv(OUTPUT_FILE, index=False, encoding='utf-8-sig')
-                print("Progress saved.")
-
+        browser = LazyBrowser(p, headless=args.headless)
+        if args.stream:
+            scraped = await stream_file(browser, args, journal)
+        else:
+            scraped = await scrape_file(browser, args, journal)
+        await context_recycler.close()
         await browser.close()
+    await close_engine()
+    journal.close()
 
-    df.to_csv(OUTPUT_FILE, index=False, encoding='utf-8-sig')
+    print(f"ASIN cache: {asin_cache.hits} hits, {asin_cache.misses} misses")
+    if run_stats.duplicates:
+        print(f"Deduplicated: {run_stats.duplicates} rows shared another row's scrape "
+              f"(~{run_stats.pages_saved(scraped)} page loads saved)")
+    if scrape_state.incremental:
+        print(f"Incremental: {scrape_state.skipped} rows already fresh, left as they were")
+    scrape_state.close()
+    print(resource_filter.summary())
+    print(context_recycler.summary())
+    asin_cache.close()
+    image_check_cache.close()
+    mirror_store.close()
+    if args.stats_file:
+        run_stats.write(args.stats_file, scraped)
+    if args.timings:
+        run_stats.report(scraped)
+    stop_profiler(profiler, args)
+    events.close(scraped)
+    if args.shard:
+        os.remove(INPUT_FILE)
     print(f"Done. Saved to {OUTPUT_FILE}")
 
 if __name__ == "__main__":
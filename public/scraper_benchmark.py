@@ -0,0 +1,156 @@
+"""Replay a snapshot corpus through both scrapers and report throughput, stage latency and memory.
+
+Record a corpus with a normal run plus --snapshot-dir, e.g.:
+
+    python scraper_amazon.py products.csv out.csv --snapshot-dir snapshots/
+
+then benchmark offline against a local stand-in server:
+
+    python scraper_benchmark.py snapshots/ --workers 4 --engine http
+
+A corpus recorded with the browser engine replays with --engine http too:
+the stand-in server answers the HTTP engine's html.duckduckgo.com searches
+with the recorded duckduckgo.com/?q= pages, so searches do not fall back to
+the browser. Recording with --engine http stores exactly what it replays.
+
+A corpus recorded by a --shards run keeps one input per shard; they are put
+back together in input order for the benchmark.
+"""
+import argparse
+import http.server
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from scraper_common import CORPUS_INPUT, DEFAULT_WORKERS, SnapshotStore, original_url, peak_rss_mb
+from scraper_http import DUCKDUCKGO_HTML_URL, DUCKDUCKGO_SEARCH_URL
+from scraper_shard import merge_shard_inputs
+
+SCRAPERS = {
+    'amazon': 'scraper_amazon.py',
+    'additional_images': 'scraper_additional_images.py',
+}
+STAGES = ['row', 'search', 'en_page', 'ar_page', 'image_extraction', 'sleep', 'navigate', 'http_fetch', 'evaluate', 'wait',
+          'write_back', 'image_check', 'image_hash', 'image_mirror', 'new_context']
+
+class SnapshotHandler(http.server.BaseHTTPRequestHandler):
+    """Serves /<host>/<path>?<query> from the snapshot store, 404 for pages not in the corpus.
+
+    A DuckDuckGo HTML-endpoint search (--engine http) missing from the corpus
+    is answered with the same search's duckduckgo.com/?q= page when the
+    corpus has that, as recorded with the browser engine.
+    """
+
+    store = None
+    misses = []
+
+    def do_GET(self):
+        url = original_url(self.path)
+        html = self.store.load(url)
+        if html is None and url.startswith(DUCKDUCKGO_HTML_URL):
+            html = self.store.load(DUCKDUCKGO_SEARCH_URL + url[len(DUCKDUCKGO_HTML_URL):])
+        if html is None:
+            self.misses.append(url)
+            self.send_error(404)
+            return
+        body = html.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(store):
+    """Start the stand-in server on a free local port and return (server, base_url)."""
+    handler = type('Handler', (SnapshotHandler,), {'store': store, 'misses': []})
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def run_scraper(name, input_file, base_url, args, workdir):
+    """Run one scraper against the stand-in server and return its stats plus wall time."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), SCRAPERS[name])
+    output_file = os.path.join(workdir, f'{name}_out.csv')
+    stats_file = os.path.join(workdir, f'{name}_stats.json')
+    command = [
+        sys.executable, script, input_file, output_file,
+        '--replay-server', base_url,
+        '--stats-file', stats_file,
+        '--workers', str(args.workers),
+        '--engine', args.engine,
+        '--rate', '1000', '--jitter', '0',
+        '--no-cache',
+        '--journal', os.path.join(workdir, f'{name}.journal.jsonl'),
+        '--headless',
+    ]
+    started = time.monotonic()
+    result = subprocess.run(command, stdout=subprocess.DEVNULL if not args.verbose else None)
+    wall = time.monotonic() - started
+    if result.returncode != 0 or not os.path.exists(stats_file):
+        print(f"{name}: scraper exited with code {result.returncode}")
+        return None
+    with open(stats_file, encoding='utf-8') as f:
+        stats = json.load(f)
+    stats['wall'] = wall
+    return stats
+
+def print_report(name, stats, misses):
+    print(f"\n=== {name} ===")
+    print(f"Rows: {stats['rows']}  Pages: {stats['pages']}  Wall: {stats['wall']:.1f}s")
+    print(f"Throughput: {stats['pages_per_second']:.2f} pages/s, {stats['rows'] / stats['elapsed']:.2f} rows/s")
+    print(f"Peak RSS (scraper process): {stats['peak_rss_mb']:.0f} MB")
+    print(f"Row time: {stats['work_seconds']:.1f}s working, {stats['sleep_seconds']:.1f}s sleeping on rate limits")
+    print(f"{'stage':<18}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for stage in STAGES:
+        timing = stats['stages'].get(stage)
+        if timing:
+            print(f"{stage:<18}{timing['count']:>7}{timing['mean']:>9.3f}s{timing['p50']:>9.3f}s"
+                  f"{timing['p95']:>9.3f}s{timing['max']:>9.3f}s")
+    if misses:
+        print(f"Pages missing from the corpus: {len(misses)} (e.g. {misses[0][:80]})")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the scrapers offline against a snapshot corpus.')
+    parser.add_argument('snapshot_dir')
+    parser.add_argument('--input', default=None,
+                        help='Input CSV (default <snapshot_dir>/input.csv, or its input.shard-I-of-K.csv merged)')
+    parser.add_argument('--scrapers', nargs='+', choices=list(SCRAPERS), default=list(SCRAPERS))
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--engine', choices=['browser', 'http'], default='browser')
+    parser.add_argument('--verbose', action='store_true', help='Show scraper output')
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.snapshot_dir)
+    input_file = args.input or os.path.join(args.snapshot_dir, CORPUS_INPUT)
+    print(f"Corpus: {len(store.urls())} pages in {args.snapshot_dir}")
+
+    server, base_url = start_server(store)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            if not args.input and not os.path.exists(input_file):
+                shards = merge_shard_inputs(args.snapshot_dir, os.path.join(workdir, CORPUS_INPUT))
+                if shards:
+                    input_file = os.path.join(workdir, CORPUS_INPUT)
+                    print(f"Input: {shards} shard inputs of a sharded recording, merged")
+            if not os.path.exists(input_file):
+                print(f"Error: {input_file} not found.")
+                return
+            for name in args.scrapers:
+                server.RequestHandlerClass.misses.clear()
+                stats = run_scraper(name, input_file, base_url, args, workdir)
+                if stats:
+                    print_report(name, stats, list(server.RequestHandlerClass.misses))
+    finally:
+        server.shutdown()
+    print(f"\nPeak RSS of any scraper process tree member: {peak_rss_mb(resource.RUSAGE_CHILDREN):.0f} MB")
+
+if __name__ == "__main__":
+    main()
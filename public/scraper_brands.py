@@ -0,0 +1,120 @@
+"""Brand detection for product names, shared by both scrapers.
+
+Brands and their aliases live in brands.txt next to this file. They are
+compiled once into a trie-shaped regular expression, so matching costs one
+regex search per name no matter how many brands the file lists.
+"""
+import os
+import re
+
+BRANDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'brands.txt')
+
+def normalize_name(text):
+    """Uppercase, drop trademark signs and collapse whitespace so names and aliases compare equal."""
+    text = re.sub(r'[®™]', '', str(text).upper())
+    return re.sub(r'\s+', ' ', text).strip()
+
+def trie_pattern(words):
+    """Build a regex alternation of words factored as a trie (longest alternative tried first)."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        alternatives = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+        body = alternatives[0] if len(alternatives) == 1 else f"(?:{'|'.join(alternatives)})"
+        return f"(?:{body})?" if '' in node else body
+
+    return build(trie)
+
+def load_brands(path=BRANDS_FILE):
+    """Read brands.txt into {alias: canonical brand}. Lines are CANONICAL|ALIAS|...; # starts a comment."""
+    aliases = {}
+    if not os.path.exists(path):
+        print(f"Warning: brand file {path} not found, only guessing brands from the first words")
+        return aliases
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            names = [normalize_name(name) for name in line.split('|') if name.strip()]
+            for alias in names:
+                aliases.setdefault(alias, names[0])
+    return aliases
+
+def guess_brand_from_words(product_name):
+    """Fallback when no known brand matches: leading capitalized word(s) are usually the brand."""
+    if not isinstance(product_name, str):
+        return None
+    words = product_name.split()
+    if len(words) > 0:
+        # Check if first word is all caps or title case (likely a brand)
+        first_word = words[0]
+        if first_word.isupper() or (first_word[0].isupper() and len(first_word) > 2):
+            # Check if second word is also part of brand
+            if len(words) > 1:
+                second_word = words[1]
+                if second_word.isupper() or (second_word[0].isupper() and len(second_word) > 2):
+                    return f"{first_word} {second_word}"
+            return first_word
+    return None
+
+class BrandIndex:
+    """Compiled matcher over every brand alias.
+
+    A whole-word match wins over a brand embedded in another word (so
+    "MAC" in "MAC LIPSTICK" beats "MAC" inside "STOMACH"); otherwise the
+    leftmost, longest alias wins. Embedded matches are still accepted, as
+    names like "KARSEELLMACA" glue the brand to the product.
+    """
+
+    def __init__(self, aliases):
+        self.aliases = aliases
+        pattern = trie_pattern(aliases) if aliases else r'(?!)'
+        self._bounded = re.compile(rf'(?<!\w)(?:{pattern})(?!\w)')
+        self._embedded = re.compile(pattern)
+
+    @classmethod
+    def load(cls, path=BRANDS_FILE):
+        return cls(load_brands(path))
+
+    def match(self, product_name):
+        """Return the canonical brand found in product_name, or None."""
+        text = normalize_name(product_name)
+        match = self._bounded.search(text) or self._embedded.search(text)
+        return self.aliases[match.group(0)] if match else None
+
+    def tag(self, names):
+        """Batch extract_brand() over a pandas Series of product names; returns a Series (None = no brand).
+
+        Each distinct name is matched once, so repeated names across a catalog cost nothing extra.
+        """
+        distinct = names.dropna().unique()
+        brands = {name: self.match(name) or guess_brand_from_words(name) for name in distinct if isinstance(name, str)}
+        tagged = names.map(brands).astype(object)
+        return tagged.where(tagged.notna(), None)
+
+_brand_index = None
+
+def brand_index():
+    """The BrandIndex for BRANDS_FILE, built on first use."""
+    global _brand_index
+    if _brand_index is None:
+        _brand_index = BrandIndex.load()
+    return _brand_index
+
+def extract_brand(product_name):
+    """Extract brand from product name using the brand index, falling back to the leading words."""
+    if not product_name or not isinstance(product_name, str):
+        return None
+    return brand_index().match(product_name) or guess_brand_from_words(product_name)
+
+def tag_brands(names):
+    """Batch version of extract_brand() for a whole DataFrame column."""
+    return brand_index().tag(names)
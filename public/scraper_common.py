@@ -0,0 +1,1906 @@
+"""Shared helpers for scraper_amazon.py and scraper_additional_images.py.
+
+Keep this file next to the scraper scripts; they import it as a sibling module.
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import contextvars
+import cProfile
+import gzip
+import hashlib
+import json
+import os
+import pstats
+import random
+import re
+import resource
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import urllib.parse
+
+import pandas as pd
+
+DEFAULT_WORKERS = 3
+USER_AGENTS = [
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+]
+
+
+AMAZON_DOMAINS = ['amazon.sa', 'amazon.ae', 'amazon.eg']
+# Per-language browser locale and Amazon language cookie (lc-acb<tld>) for the EN/AR contexts
+CONTEXT_LOCALES = {'en': 'en-US', 'ar': 'ar-SA'}
+AMAZON_LANGUAGE_COOKIES = {'en': 'en_AE', 'ar': 'ar_AE'}
+
+# Rate limiting (requests per second per host, burst size, max extra jitter in seconds)
+DEFAULT_RATE = 0.5
+DEFAULT_BURST = 2
+DEFAULT_JITTER = 1.0
+HOST_RATES = {
+    'duckduckgo.com': 0.3,
+}
+CAPTCHA_SLOWDOWN = 0.5  # Multiply a host's rate by this on every CAPTCHA
+MIN_RATE = 0.05
+RECOVERY_SECONDS = 120  # Double a slowed-down host's rate after this long without CAPTCHAs
+# Circuit breaker: this many CAPTCHAs from one host within the window pause the host for everyone
+BREAKER_CAPTCHAS = 3
+BREAKER_WINDOW_SECONDS = 300
+BREAKER_SECONDS = 60  # First pause; doubles each time the breaker opens again before the host recovers
+BREAKER_MAX_SECONDS = 900
+
+# Rows that hit a CAPTCHA or an error go back to the end of the queue after an exponential backoff
+MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 15
+
+# Request filtering: the scrapers only read DOM text and src attributes
+BLOCKED_RESOURCE_TYPES = ('image', 'font', 'media')
+FIRST_PARTY_SCRIPT_HOSTS = ('duckduckgo.com', 'amazon.', 'media-amazon.com', 'ssl-images-amazon.com')
+# Typical transfer sizes used to estimate what a blocked request would have cost
+ESTIMATED_RESOURCE_BYTES = {
+    'image': 40_000,
+    'font': 30_000,
+    'media': 250_000,
+    'script': 60_000,
+}
+
+# Selectors read by the in-page extraction scripts (in priority order)
+MAIN_IMAGE_SELECTORS = ['#landingImage', '#imgTagWrapperId img', '.a-dynamic-image']
+THUMBNAIL_SELECTORS = ['#imageBlock_feature_div ul li img', '.a-button-thumbnail img', '#altImages ul li img']
+SEARCH_RESULT_SELECTORS = [
+    'h2 a',
+    'a[data-testid="result-title-a"]',
+    '.result__a',
+    'a.result__a',
+    'a[href*="amazon"]',
+    '.result a[href*="amazon"]'
+]
+CAPTCHA_TEXT = 'Enter the characters you see below'
+
+# ASIN resolution cache (shared by both scrapers)
+ASIN_CACHE_FILE = 'asin_cache.sqlite'
+ASIN_CACHE_TTL_DAYS = 30
+ASIN_CACHE_NEGATIVE_TTL_DAYS = 3  # "No result" entries expire sooner so new listings get picked up
+
+# Incremental re-scrapes (--incremental): days before each field group is scraped again
+SCRAPE_STATE_FILE = 'scrape_state.sqlite'
+FRESHNESS_DAYS = {
+    'images': 30,
+    'en': 90,  # English descriptions
+    'ar': 90,  # Arabic descriptions
+    'arabic_name': 180,
+}
+
+# Streaming mode (--stream)
+DEFAULT_CHUNK_SIZE = 500
+STREAM_WINDOW_PER_WORKER = 4  # Rows per worker that may be in flight or waiting for their turn in the output
+ROW_ID_COLUMN = 'Row'
+
+# Browser context recycling, so Chromium's memory does not grow over a long run
+RECYCLE_NAVIGATIONS = 200  # Page loads before a context is replaced (--recycle-after)
+SPARE_CONTEXTS = 1  # Fresh contexts per language kept open for recycling workers
+RSS_CHECK_SECONDS = 15  # How often the browser's memory is read when --max-browser-rss is set
+
+# Progress events (--events)
+EVENT_FLUSH_SECONDS = 0.5  # Buffered events are written at most this late (row_finished right away)
+EVENT_BUFFER_LINES = 200
+THROUGHPUT_WINDOW_SECONDS = 60  # rows_per_minute counts the rows finished in this trailing window
+
+async def new_scraper_context(browser, user_agent, language=None):
+    """Create a context with request filtering and, if given, the language's locale and Amazon cookies."""
+    options = {'user_agent': user_agent}
+    if language:
+        options['locale'] = CONTEXT_LOCALES[language]
+    context = await browser.new_context(**options)
+    if language:
+        await context.add_cookies([
+            {
+                'name': f"lc-acb{domain.split('.')[-1]}",
+                'value': AMAZON_LANGUAGE_COOKIES[language],
+                'domain': f'.{domain}',
+                'path': '/',
+            }
+            for domain in AMAZON_DOMAINS
+        ])
+    await resource_filter.install(context)
+    return context
+
+class LazyBrowser:
+    """Stands in for a Playwright browser and launches Chromium only when the first context is needed.
+
+    Runs served entirely by the HTTP engine (scraper_http.py) never start a browser.
+    """
+
+    def __init__(self, playwright, headless=False):
+        self._playwright = playwright
+        self._headless = headless
+        self._browser = None
+        self._lock = asyncio.Lock()
+
+    async def new_context(self, **options):
+        async with self._lock:
+            if self._browser is None:
+                print("Launching browser...")
+                self._browser = await self._playwright.chromium.launch(headless=self._headless)
+        return await self._browser.new_context(**options)
+
+    async def close(self):
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+
+def browser_rss_mb():
+    """Resident memory in MB summed over this process's descendants (Playwright's driver and Chromium).
+
+    Read from /proc, so None where there is none (macOS). Memory shared by
+    Chromium's processes is counted once per process, so this overstates the
+    real footprint; it only has to grow with it.
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    children = collections.defaultdict(list)
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces and ')'; the parent pid is the second field after its last ')'
+        children[int(stat.rpartition(')')[2].split()[1])].append(int(entry))
+    pages = 0
+    pending = list(children[os.getpid()])
+    while pending:
+        pid = pending.pop()
+        pending.extend(children[pid])
+        try:
+            with open(f'/proc/{pid}/statm') as f:
+                pages += int(f.read().split()[1])
+        except OSError:
+            continue
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1_048_576
+
+class ContextRecycler:
+    """Opens the workers' browser contexts and says when each one is due to be replaced.
+
+    Chromium's memory grows with every page a context loads, so a context is
+    retired between jobs once it has made `navigations` page loads, or, with
+    max_rss_mb set, once the browser's memory was seen above that ceiling
+    after the context was opened (every context then, a generation at a
+    time). Each new context takes the next of the user agents in turn.
+
+    Once contexts start coming due (half a navigation budget used, or a
+    recycle or memory ceiling reached), `spares` fresh contexts per language
+    are opened in the background, so a worker replacing its context takes a
+    ready one instead of waiting for Chromium; retired contexts are closed in
+    the background too.
+    """
+
+    def __init__(self, navigations=RECYCLE_NAVIGATIONS, max_rss_mb=None, spares=SPARE_CONTEXTS, user_agents=USER_AGENTS):
+        self.navigations = navigations
+        self.max_rss_mb = max_rss_mb
+        self.spares = spares
+        self.user_agents = list(user_agents)
+        self.recycled = 0
+        self.memory_recycles = 0
+        self.peak_rss_mb = None
+        self._next_agent = random.randrange(len(self.user_agents))
+        self._generation = 0
+        self._rss_checked = 0.0
+        self._contexts = {}  # context -> {'key': (browser, language), 'loads': n, 'generation': n}
+        self._spares = {}  # (browser, language) -> deque of ready (context, page)
+        self._filling = {}  # (browser, language) -> task opening spares
+        self._closing = set()
+
+    def configure(self, navigations=None, max_rss_mb=None, spares=None):
+        if navigations is not None:
+            self.navigations = navigations
+        if max_rss_mb is not None:
+            self.max_rss_mb = max_rss_mb
+        if spares is not None:
+            self.spares = spares
+
+    def next_user_agent(self):
+        user_agent = self.user_agents[self._next_agent]
+        self._next_agent = (self._next_agent + 1) % len(self.user_agents)
+        return user_agent
+
+    async def _new(self, browser, language):
+        context = await new_scraper_context(browser, self.next_user_agent(), language)
+        self._contexts[context] = {'key': (browser, language), 'loads': 0, 'generation': self._generation}
+        return context, await context.new_page()
+
+    async def open(self, browser, language=None):
+        """A (context, first page) for language: a ready spare when there is one, else opened now."""
+        key = (browser, language)
+        spares = self._spares.get(key)
+        with run_stats.stage('new_context'):
+            while spares:
+                context, page = spares.popleft()
+                if not self.due(context):
+                    break
+                self.retire(context)
+            else:
+                context, page = await self._new(browser, language)
+        if self.recycled:
+            self._fill(key)
+        return context, page
+
+    def _fill(self, key):
+        """Open spares for key in the background, unless that is already under way."""
+        if self.spares > 0 and key not in self._filling:
+            self._filling[key] = asyncio.ensure_future(self._top_up(key))
+
+    async def _top_up(self, key):
+        spares = self._spares.setdefault(key, collections.deque())
+        try:
+            while len(spares) < self.spares:
+                spares.append(await self._new(*key))
+        except Exception as e:
+            print(f"Could not open a spare browser context: {e}")
+        finally:
+            del self._filling[key]
+
+    def navigated(self, context):
+        """Count a page load in context (see goto())."""
+        info = self._contexts.get(context)
+        if info is None:
+            return
+        info['loads'] += 1
+        if self.navigations and info['loads'] == self.navigations // 2:
+            self._fill(info['key'])
+
+    def due(self, context):
+        """Why context should be replaced ('navigations' or 'memory'), or None."""
+        info = self._contexts.get(context)
+        if info is None:
+            return None
+        if info['generation'] < self._generation:
+            return 'memory'
+        if self.navigations and info['loads'] >= self.navigations:
+            return 'navigations'
+        return None
+
+    def check_memory(self):
+        """Read the browser's memory (at most every RSS_CHECK_SECONDS) and start a new generation above the ceiling."""
+        if not self.max_rss_mb or not self._contexts or time.monotonic() - self._rss_checked < RSS_CHECK_SECONDS:
+            return
+        self._rss_checked = time.monotonic()
+        rss = browser_rss_mb()
+        if rss is None:
+            return
+        self.peak_rss_mb = max(self.peak_rss_mb or 0.0, rss)
+        if rss > self.max_rss_mb:
+            print(f"Browser memory at {rss:.0f} MB (over {self.max_rss_mb} MB): recycling every context")
+            self._generation += 1
+            for key in {info['key'] for info in self._contexts.values()}:
+                self._fill(key)
+
+    def forget(self, context):
+        resource_filter.report(context)
+        self._contexts.pop(context, None)
+
+    def retire(self, context, reason=None):
+        """Stop tracking context and close it in the background; reason (from due()) counts it as recycled."""
+        if reason is not None:
+            self.recycled += 1
+            self.memory_recycles += reason == 'memory'
+        self.forget(context)
+        task = asyncio.ensure_future(context.close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def summary(self):
+        text = f"Browser contexts: {self.recycled} recycled ({self.memory_recycles} for memory)"
+        if self.peak_rss_mb is not None:
+            text += f", browser memory peaked at {self.peak_rss_mb:.0f} MB"
+        return text
+
+    async def close(self):
+        """Close the spares and wait for retired contexts to finish closing; call before closing the browser."""
+        for task in list(self._filling.values()):
+            task.cancel()
+        await asyncio.gather(*self._filling.values(), return_exceptions=True)
+        for spares in self._spares.values():
+            while spares:
+                self.retire(spares.popleft()[0])
+        self._spares.clear()
+        await asyncio.gather(*self._closing, return_exceptions=True)
+
+context_recycler = ContextRecycler()
+
+def add_recycle_args(parser):
+    """Register the --recycle-after/--max-browser-rss/--spare-contexts flags shared by the scrapers and the daemon."""
+    parser.add_argument('--recycle-after', type=int, default=RECYCLE_NAVIGATIONS,
+                        help=f'Page loads before a browser context is replaced by a fresh one with the next user agent '
+                             f'(default {RECYCLE_NAVIGATIONS}, 0 = never)')
+    parser.add_argument('--max-browser-rss', type=int, default=None, metavar='MB',
+                        help='Replace every browser context when Chromium uses more than this much memory (default off)')
+    parser.add_argument('--spare-contexts', type=int, default=SPARE_CONTEXTS,
+                        help=f'Fresh contexts per language kept ready for recycling workers (default {SPARE_CONTEXTS})')
+
+def configure_recycle(args):
+    """Apply the flags registered by add_recycle_args()."""
+    if args.max_browser_rss and browser_rss_mb() is None:
+        print("Warning: --max-browser-rss needs /proc (Linux); only --recycle-after applies here")
+    context_recycler.configure(navigations=args.recycle_after, max_rss_mb=args.max_browser_rss,
+                               spares=args.spare_contexts)
+
+class WorkerPages:
+    """A pool worker's pages, one per language, each in its own context and created on first use.
+
+    Separate contexts keep each language's locale cookies, so the EN and AR
+    variants of a product page can be fetched at the same time. Contexts come
+    from context_recycler, and recycle() replaces the ones it says are due.
+    """
+
+    def __init__(self, browser):
+        self.browser = browser
+        self._contexts = {}
+        self._pages = {}
+        self._lock = asyncio.Lock()
+
+    async def get(self, language='en', slot=0):
+        """Return the worker's page for language; slots > 0 are extra pages in the same context."""
+        async with self._lock:
+            if (language, slot) not in self._pages:
+                if language not in self._contexts:
+                    self._contexts[language], self._pages[(language, 0)] = await context_recycler.open(
+                        self.browser, language)
+                if (language, slot) not in self._pages:
+                    self._pages[(language, slot)] = await self._contexts[language].new_page()
+        return self._pages[(language, slot)]
+
+    async def recycle(self):
+        """Retire the contexts that are due (see ContextRecycler); get() opens fresh ones. Call between jobs."""
+        context_recycler.check_memory()
+        async with self._lock:
+            for language, context in list(self._contexts.items()):
+                reason = context_recycler.due(context)
+                if reason is None:
+                    continue
+                del self._contexts[language]
+                for key in [key for key in self._pages if key[0] == language]:
+                    del self._pages[key]
+                context_recycler.retire(context, reason)
+
+    async def close(self):
+        for context in self._contexts.values():
+            context_recycler.forget(context)
+            await context.close()
+        self._contexts.clear()
+        self._pages.clear()
+
+class PagePool:
+    """WorkerPages kept open between runs, for a long-lived process that reuses warm pages.
+
+    run_page_pool() and stream_page_pool() check a worker's pages out with
+    acquire() and hand them back with release() instead of closing them.
+    """
+
+    def __init__(self, browser, size=DEFAULT_WORKERS):
+        self.browser = browser
+        self.size = size
+        self._idle = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(WorkerPages(browser))
+
+    async def warm(self, languages=('en', 'ar')):
+        """Open every worker's contexts and pages now so the first job does not wait for Chromium."""
+        idle = [self._idle.get_nowait() for _ in range(self._idle.qsize())]
+        try:
+            await asyncio.gather(*(pages.get(language) for pages in idle for language in languages))
+        finally:
+            for pages in idle:
+                self._idle.put_nowait(pages)
+
+    async def acquire(self):
+        return await self._idle.get()
+
+    def release(self, pages):
+        self._idle.put_nowait(pages)
+
+    async def close(self):
+        while not self._idle.empty():
+            await self._idle.get_nowait().close()
+
+@contextlib.asynccontextmanager
+async def worker_pages(browser, page_pool=None):
+    """A pool worker's WorkerPages: borrowed from page_pool if given, else opened and closed here."""
+    if page_pool is not None:
+        pages = await page_pool.acquire()
+        try:
+            yield pages
+        finally:
+            page_pool.release(pages)
+    else:
+        pages = WorkerPages(browser)
+        try:
+            yield pages
+        finally:
+            await pages.close()
+
+# Retry state of the pool job running in the current task (see request_retry())
+job_retry = contextvars.ContextVar('job_retry', default=None)
+
+def request_retry(reason, delay=0.0):
+    """Have the running pool job tried again later, after at least delay seconds.
+
+    Called where a row fails for a reason that may go away (a CAPTCHA, a
+    navigation error, a host paused by its circuit breaker); the scrapers
+    still return their usual None result and the pool re-queues the row.
+    Outside a pool job this does nothing.
+    """
+    state = job_retry.get()
+    if state is not None:
+        state['reason'] = reason
+        state['delay'] = max(state.get('delay', 0.0), delay)
+
+class JobQueue:
+    """Jobs for the page pool workers; failed jobs are put back at the end after a delay.
+
+    put() waits while maxsize jobs are queued (0 = no limit). A job counts
+    as pending from put() until done(), including while it waits to be
+    retried, and get() returns None once close() was called and nothing is
+    pending, which tells the worker to stop.
+    """
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self._jobs = collections.deque()
+        self._changed = asyncio.Condition()
+        self._pending = 0
+        self._closed = False
+        self._requeues = set()  # Jobs waiting out their retry delay
+
+    def __len__(self):
+        return len(self._jobs)
+
+    async def put(self, job):
+        async with self._changed:
+            await self._changed.wait_for(lambda: not self.maxsize or len(self._jobs) < self.maxsize)
+            self._jobs.append(job)
+            self._pending += 1
+            self._changed.notify_all()
+
+    async def get(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._jobs or (self._closed and not self._pending))
+            job = self._jobs.popleft() if self._jobs else None
+            self._changed.notify_all()
+            return job
+
+    def retry(self, job, delay):
+        """Queue a job taken with get() again, at the end, after delay seconds."""
+        async def requeue():
+            await asyncio.sleep(delay)
+            async with self._changed:
+                self._jobs.append(job)
+                self._changed.notify_all()
+
+        task = asyncio.ensure_future(requeue())
+        self._requeues.add(task)
+        task.add_done_callback(self._requeues.discard)
+
+    async def done(self):
+        async with self._changed:
+            self._pending -= 1
+            self._changed.notify_all()
+
+    async def close(self):
+        """No more put() calls will come."""
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+async def run_job(handler, key, item, pages, worker_id):
+    """Run one pool job and return (result, retry).
+
+    An exception is logged and becomes a None result. retry is None, or
+    {'reason', 'delay'} when the job asked to be tried again (see
+    request_retry()); exceptions ask for a retry too. Events emitted while
+    the job runs carry its key (see EventLog).
+    """
+    current_row.set(key)
+    retry = {}
+    job_retry.set(retry)
+    events.row_started(key, worker_id)
+    result = None
+    try:
+        with run_stats.stage('row', emit=False):
+            result = await handler(item, pages)
+    except Exception as e:
+        print(f"[worker {worker_id}] Error on job {key}: {e}")
+        events.emit('error', error=str(e))
+        if not retry:
+            request_retry(f"error ({e})")
+    return result, retry or None
+
+async def pool_worker(browser, queue, handler, on_result, retries, worker_id, page_pool=None):
+    """Take (key, item, attempt) jobs from queue until it is finished, calling on_result(key, result) for each.
+
+    Between jobs the worker's contexts that are due are recycled (see ContextRecycler).
+
+    A job that failed (returned None or raised) and asked for a retry goes
+    back to the end of the queue after an exponential backoff (at least as
+    long as the delay it asked for) until it has been retried `retries`
+    times; its last result is kept then. A retry asked for by a sub-request
+    of a job that still returned a result (e.g. a CAPTCHA on the HTTP fast
+    path before the browser fallback worked) is ignored.
+    """
+    async with worker_pages(browser, page_pool) as pages:
+        while True:
+            job = await queue.get()
+            if job is None:
+                break
+            key, item, attempt = job
+            await pages.recycle()
+            result, retry = await run_job(handler, key, item, pages, worker_id)
+            if result is not None:
+                retry = None
+            if retry and attempt < retries:
+                backoff = RETRY_BACKOFF_SECONDS * 2 ** attempt
+                delay = max(retry['delay'], backoff) * random.uniform(1, 1.25)
+                print(f"[worker {worker_id}] Row {key}: {retry['reason']}, "
+                      f"retrying in {delay:.0f}s ({attempt + 1}/{retries})")
+                events.emit('row_retry', row=key, reason=retry['reason'], attempt=attempt + 1, delay=round(delay, 1))
+                queue.retry((key, item, attempt + 1), delay)
+                continue
+            if retry:
+                print(f"[worker {worker_id}] Row {key}: giving up after {retries} retries ({retry['reason']})")
+            if on_result:
+                on_result(key, result)
+            await queue.done()
+
+async def run_page_pool(browser, jobs, handler, workers=DEFAULT_WORKERS, on_result=None, page_pool=None,
+                        retries=MAX_RETRIES):
+    """Run handler(item, pages) for every (key, item) in jobs on a pool of workers.
+
+    Each worker owns a WorkerPages (its browser contexts and pages, borrowed
+    from page_pool when one is given) and pulls jobs from a shared JobQueue.
+    Results are returned as a {key: result} dict; on_result(key, result)
+    is called as soon as each job finishes so callers can merge and checkpoint.
+    Jobs that hit a CAPTCHA or an error are retried at the end of the queue
+    up to `retries` times (see pool_worker()).
+    """
+    queue = JobQueue()
+    for key, item in jobs:
+        await queue.put((key, item, 0))
+    await queue.close()
+
+    results = {}
+    workers = max(1, min(workers, len(queue) or 1))
+
+    def finish(key, result):
+        results[key] = result
+        if on_result:
+            on_result(key, result)
+
+    await asyncio.gather(*(
+        pool_worker(browser, queue, handler, finish, retries, i + 1, page_pool) for i in range(workers)
+    ))
+    return results
+
+async def stream_page_pool(browser, jobs, handler, workers=DEFAULT_WORKERS, on_result=None, page_pool=None,
+                           retries=MAX_RETRIES):
+    """run_page_pool() over an async iterable of (key, item) jobs, without collecting results.
+
+    The queue only holds as many jobs as there are workers, so jobs are
+    pulled from the iterable as workers free up rather than all up front.
+    """
+    queue = JobQueue(maxsize=workers)
+
+    async def feed():
+        try:
+            async for key, item in jobs:
+                await queue.put((key, item, 0))
+        finally:
+            await queue.close()
+
+    await asyncio.gather(feed(), *(
+        pool_worker(browser, queue, handler, on_result, retries, i + 1, page_pool) for i in range(workers)
+    ))
+
+def host_key(url):
+    """Normalize a URL to the host used for rate limiting (www.amazon.sa -> amazon.sa)."""
+    host = urllib.parse.urlparse(url).hostname or ''
+    if host.startswith('www.'):
+        host = host[4:]
+    return host
+
+class HostBlocked(Exception):
+    """Raised by HostRateLimiter.acquire() while the host's circuit breaker is open."""
+
+    def __init__(self, host, seconds):
+        super().__init__(f"{host} paused for another {seconds:.0f}s after repeated CAPTCHAs")
+        self.host = host
+        self.seconds = seconds
+
+class HostRateLimiter:
+    """Token-bucket scheduler keyed by host, shared by every worker in the process.
+
+    Workers only sleep when a host's bucket is empty; the sleep gets a random
+    jitter so requests do not fall into a fixed cadence. penalize() slows a
+    host down after a CAPTCHA and the rate recovers on its own over time.
+
+    After BREAKER_CAPTCHAS CAPTCHAs within BREAKER_WINDOW_SECONDS the host's
+    circuit breaker opens: acquire() raises HostBlocked for every worker
+    until the pause is over, so rows for that host fail fast and are retried
+    later (see request_retry()) while the workers move on to other rows.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, jitter=DEFAULT_JITTER, host_rates=None, share=1.0):
+        self.rate = rate
+        self.burst = burst
+        self.jitter = jitter
+        self.host_rates = dict(HOST_RATES if host_rates is None else host_rates)
+        self.share = share  # Fraction of every host's rate this process uses (processes sharing one IP)
+        self._buckets = {}
+
+    def configure(self, rate=None, jitter=None, share=None):
+        """Override the default rate, jitter and rate share (e.g. from command line flags)."""
+        if rate is not None:
+            self.rate = rate
+            # An explicit rate also caps the per-host defaults
+            self.host_rates = {host: min(r, rate) for host, r in self.host_rates.items()}
+        if jitter is not None:
+            self.jitter = jitter
+        if share is not None:
+            self.share = share
+        self._buckets.clear()
+
+    def _bucket(self, host):
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            base_rate = self.host_rates.get(host, self.rate) * self.share
+            bucket = {
+                'base_rate': base_rate,
+                'rate': base_rate,
+                'tokens': float(self.burst),
+                'updated': time.monotonic(),
+                'penalized_at': None,
+                'captchas': collections.deque(),
+                'open_until': 0.0,
+                'openings': 0,
+                'lock': asyncio.Lock(),
+            }
+            self._buckets[host] = bucket
+        return bucket
+
+    def _refill(self, bucket):
+        now = time.monotonic()
+        if bucket['penalized_at'] and bucket['rate'] < bucket['base_rate'] and now - bucket['penalized_at'] >= RECOVERY_SECONDS:
+            bucket['rate'] = min(bucket['base_rate'], bucket['rate'] * 2)
+            bucket['penalized_at'] = now
+            if bucket['rate'] == bucket['base_rate']:
+                bucket['openings'] = 0
+        bucket['tokens'] = min(self.burst, bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+        bucket['updated'] = now
+
+    async def acquire(self, url):
+        """Wait until the URL's host has budget for one more request (timed as the 'sleep' stage)."""
+        host = host_key(url)
+        bucket = self._bucket(host)
+        with run_stats.stage('sleep', emit=False):
+            self._check_circuit(host, bucket)
+            async with bucket['lock']:
+                self._refill(bucket)
+                while bucket['tokens'] < 1:
+                    wait = (1 - bucket['tokens']) / bucket['rate']
+                    await asyncio.sleep(wait + random.uniform(0, self.jitter))
+                    self._check_circuit(host, bucket)
+                    self._refill(bucket)
+                bucket['tokens'] -= 1
+
+    def _check_circuit(self, host, bucket):
+        remaining = bucket['open_until'] - time.monotonic()
+        if remaining > 0:
+            request_retry(f"{host} paused", remaining)
+            raise HostBlocked(host, remaining)
+
+    def penalize(self, url):
+        """Slow down the URL's host after a CAPTCHA and drop its remaining budget."""
+        host = host_key(url)
+        bucket = self._bucket(host)
+        bucket['rate'] = max(MIN_RATE * self.share, bucket['rate'] * CAPTCHA_SLOWDOWN)
+        bucket['tokens'] = 0.0
+        now = time.monotonic()
+        bucket['penalized_at'] = now
+        print(f"Slowing down {host} to {bucket['rate']:.2f} req/s after CAPTCHA")
+        events.emit('captcha', host=host, url=url, rate=round(bucket['rate'], 3))
+
+        captchas = bucket['captchas']
+        captchas.append(now)
+        while now - captchas[0] > BREAKER_WINDOW_SECONDS:
+            captchas.popleft()
+        if len(captchas) >= BREAKER_CAPTCHAS and now >= bucket['open_until']:
+            bucket['openings'] += 1
+            seconds = min(BREAKER_MAX_SECONDS, BREAKER_SECONDS * 2 ** (bucket['openings'] - 1))
+            bucket['open_until'] = now + seconds
+            print(f"Pausing {host} for {seconds}s after {len(captchas)} CAPTCHAs")
+            events.emit('circuit_open', host=host, seconds=seconds)
+            captchas.clear()
+        request_retry(f"CAPTCHA on {host}", max(0.0, bucket['open_until'] - now))
+
+rate_limiter = HostRateLimiter()
+
+def add_rate_limit_args(parser):
+    """Register the --rate/--jitter/--retries/--rate-share flags shared by both scrapers."""
+    parser.add_argument('--rate', type=float, default=None,
+                        help=f'Max requests per second per host (default {DEFAULT_RATE}, DuckDuckGo {HOST_RATES["duckduckgo.com"]})')
+    parser.add_argument('--jitter', type=float, default=None,
+                        help=f'Max random extra delay in seconds when a host is throttled (default {DEFAULT_JITTER})')
+    parser.add_argument('--retries', type=int, default=MAX_RETRIES,
+                        help=f'Times a row that hit a CAPTCHA or an error is queued again (default {MAX_RETRIES})')
+    parser.add_argument('--rate-share', type=float, default=1.0,
+                        help='Fraction of every host rate this process uses, when several processes share one IP '
+                             '(--shards sets 1/K)')
+
+class ResourceFilter:
+    """Aborts image, font, media and third-party script requests via context routing.
+
+    Counts blocked requests per context (one page each in the pool) and
+    reports them per page load with an estimate of the bytes saved.
+    """
+
+    def __init__(self, blocked_types=BLOCKED_RESOURCE_TYPES, script_hosts=FIRST_PARTY_SCRIPT_HOSTS, enabled=True):
+        self.blocked_types = set(blocked_types)
+        self.script_hosts = tuple(script_hosts)
+        self.enabled = enabled
+        self.total_blocked = 0
+        self.total_bytes_saved = 0
+        self._pages = {}
+
+    def configure(self, allow=None, enabled=None):
+        """Let the given resource types through (e.g. ['image']) or switch filtering off."""
+        if allow:
+            self.blocked_types -= set(allow)
+            if 'script' in allow:
+                self.script_hosts = ('',)  # Every host matches, so no script is third-party
+        if enabled is not None:
+            self.enabled = enabled
+
+    def should_block(self, request):
+        resource_type = request.resource_type
+        if resource_type in self.blocked_types:
+            return True
+        if resource_type == 'script':
+            host = host_key(request.url)
+            return not any(allowed in host for allowed in self.script_hosts)
+        return False
+
+    async def install(self, context):
+        if not self.enabled and not replay_base:
+            return
+        stats = {'url': None, 'blocked': 0, 'bytes': 0}
+        self._pages[context] = stats
+
+        async def handle(route):
+            request = route.request
+            if replay_base and not request.url.startswith(replay_base):
+                # Replaying snapshots: nothing may leave the local stand-in server
+                await route.abort()
+            elif self.enabled and self.should_block(request):
+                size = ESTIMATED_RESOURCE_BYTES.get(request.resource_type, 10_000)
+                stats['blocked'] += 1
+                stats['bytes'] += size
+                self.total_blocked += 1
+                self.total_bytes_saved += size
+                await route.abort()
+            else:
+                await route.continue_()
+
+        await context.route('**/*', handle)
+
+    def report(self, context, next_url=None):
+        """Print what was blocked on the context's previous page load and start counting for next_url."""
+        stats = self._pages.get(context)
+        if stats is None:
+            return
+        if stats['url'] and stats['blocked']:
+            print(f"  Blocked {stats['blocked']} requests (~{stats['bytes'] // 1024} KB saved) on {stats['url'][:80]}")
+        stats.update(url=next_url, blocked=0, bytes=0)
+        if next_url is None:
+            del self._pages[context]
+
+    def summary(self):
+        return f"Blocked {self.total_blocked} requests (~{self.total_bytes_saved / 1_048_576:.1f} MB saved)"
+
+resource_filter = ResourceFilter()
+
+def add_resource_filter_args(parser):
+    """Register the --allow-resources/--no-block flags shared by both scrapers."""
+    parser.add_argument('--allow-resources', default='',
+                        help=f'Comma-separated resource types to load anyway (blocked: {", ".join(BLOCKED_RESOURCE_TYPES)}, third-party script)')
+    parser.add_argument('--no-block', action='store_true', help='Load every resource (disables request filtering)')
+
+def configure_resource_filter(args):
+    """Apply the flags registered by add_resource_filter_args()."""
+    allow = [t.strip() for t in args.allow_resources.split(',') if t.strip()]
+    resource_filter.configure(allow=allow, enabled=not args.no_block)
+
+# Base URL of a local snapshot server (scraper_benchmark.py); when set, every page is loaded from it
+replay_base = None
+
+def replay_url(url):
+    """Map https://host/path?query to <replay_base>/host/path?query when replaying snapshots."""
+    if not replay_base:
+        return url
+    parsed = urllib.parse.urlparse(url)
+    rewritten = f"{replay_base}/{parsed.netloc}{parsed.path}"
+    return f"{rewritten}?{parsed.query}" if parsed.query else rewritten
+
+def replaying():
+    """True when pages are loaded from a snapshot server (--replay-server)."""
+    return bool(replay_base)
+
+def original_url(path):
+    """Inverse of replay_url() for a request path received by the snapshot server."""
+    return f"https://{path.lstrip('/')}"
+
+async def goto(page, url, **kwargs):
+    """page.goto() that first waits for the host's rate limit budget."""
+    await rate_limiter.acquire(url)
+    resource_filter.report(page.context, url)
+    context_recycler.navigated(page.context)
+    run_stats.pages += 1
+    with run_stats.stage('navigate'):
+        try:
+            return await page.goto(replay_url(url), **kwargs)
+        except Exception as e:
+            request_retry(f"navigation failed ({type(e).__name__})")
+            raise
+
+def normalize_query(text):
+    """Normalize a product name or brand for cache keys (case, punctuation, whitespace)."""
+    if text is None or (isinstance(text, float) and text != text):
+        return ''
+    text = re.sub(r'[^\w\s]', ' ', str(text).lower())
+    return re.sub(r'\s+', ' ', text).strip()
+
+class AsinCache:
+    """On-disk SQLite cache mapping (product name, brand, domain) to an ASIN.
+
+    A stored ASIN of None is a negative entry ("searched, nothing found") and
+    expires after negative_ttl_days instead of ttl_days. The file can be shared
+    by both scrapers and by concurrent runs.
+    """
+
+    def __init__(self, path=ASIN_CACHE_FILE, ttl_days=ASIN_CACHE_TTL_DAYS,
+                 negative_ttl_days=ASIN_CACHE_NEGATIVE_TTL_DAYS, enabled=True):
+        self.path = path
+        self.ttl_days = ttl_days
+        self.negative_ttl_days = negative_ttl_days
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+
+    def configure(self, path=None, ttl_days=None, enabled=None):
+        """Override the cache location, TTL or on/off switch (e.g. from command line flags)."""
+        self.close()
+        if path is not None:
+            self.path = path
+        if ttl_days is not None:
+            self.ttl_days = ttl_days
+        if enabled is not None:
+            self.enabled = enabled
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS asin_cache ('
+                ' name TEXT NOT NULL, brand TEXT NOT NULL, domain TEXT NOT NULL,'
+                ' asin TEXT, updated_at REAL NOT NULL,'
+                ' PRIMARY KEY (name, brand, domain))'
+            )
+        return self._conn
+
+    def get(self, product_name, brand, domain):
+        """Return (hit, asin). asin is None on a negative hit."""
+        if not self.enabled:
+            return False, None
+        row = self._connect().execute(
+            'SELECT asin, updated_at FROM asin_cache WHERE name = ? AND brand = ? AND domain = ?',
+            (normalize_query(product_name), normalize_query(brand), domain),
+        ).fetchone()
+        if row:
+            asin, updated_at = row
+            ttl_days = self.ttl_days if asin else self.negative_ttl_days
+            if time.time() - updated_at < ttl_days * 86400:
+                self.hits += 1
+                events.emit('cache', hit=True, domain=domain, asin=asin)
+                return True, asin
+        self.misses += 1
+        events.emit('cache', hit=False, domain=domain)
+        return False, None
+
+    def peek(self, product_name, brand, domain):
+        """The fresh cached ASIN for a product, or None; unlike get() not counted as a hit or miss."""
+        if not self.enabled:
+            return None
+        row = self._connect().execute(
+            'SELECT asin, updated_at FROM asin_cache WHERE name = ? AND brand = ? AND domain = ?',
+            (normalize_query(product_name), normalize_query(brand), domain),
+        ).fetchone()
+        if row and row[0] and time.time() - row[1] < self.ttl_days * 86400:
+            return row[0]
+        return None
+
+    def set(self, product_name, brand, domain, asin):
+        """Store a resolved ASIN, or None to record that the search found nothing."""
+        if not self.enabled:
+            return
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO asin_cache (name, brand, domain, asin, updated_at) VALUES (?, ?, ?, ?, ?)',
+            (normalize_query(product_name), normalize_query(brand), domain, asin, time.time()),
+        )
+        conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+asin_cache = AsinCache()
+
+def add_asin_cache_args(parser):
+    """Register the --cache-file/--cache-ttl-days/--no-cache flags shared by both scrapers."""
+    parser.add_argument('--cache-file', default=ASIN_CACHE_FILE,
+                        help=f'SQLite file for cached ASIN lookups (default {ASIN_CACHE_FILE})')
+    parser.add_argument('--cache-ttl-days', type=float, default=ASIN_CACHE_TTL_DAYS,
+                        help=f'Days before a cached ASIN is looked up again (default {ASIN_CACHE_TTL_DAYS})')
+    parser.add_argument('--no-cache', action='store_true', help='Always search DuckDuckGo, ignoring the ASIN cache')
+
+def configure_asin_cache(args):
+    """Apply the cache flags registered by add_asin_cache_args()."""
+    asin_cache.configure(path=args.cache_file, ttl_days=args.cache_ttl_days, enabled=not args.no_cache)
+
+class ScrapeState:
+    """On-disk SQLite record of when each field group of a product was last scraped.
+
+    A field group (see FRESHNESS_DAYS) is the set of output columns one page
+    fetch fills, e.g. 'images' or 'ar'. With incremental=True, due() only
+    returns the groups that are missing (blank and never scraped) or stale
+    (scraped longer ago than their max age), so a refresh of a full catalog
+    only loads the pages that changed. Filled cells with no record (e.g.
+    imported data) count as fresh. Timestamps are recorded on every run.
+    """
+
+    def __init__(self, path=SCRAPE_STATE_FILE, max_age_days=None, incremental=False):
+        self.path = path
+        self.max_age_days = dict(FRESHNESS_DAYS if max_age_days is None else max_age_days)
+        self.incremental = incremental
+        self.skipped = 0
+        self._conn = None
+        self._scraped = {}
+
+    def configure(self, path=None, max_age_days=None, incremental=None):
+        """Override the state file, per-group max ages or incremental switch (e.g. from command line flags)."""
+        self.close()
+        if path is not None:
+            self.path = path
+        if max_age_days:
+            self.max_age_days.update(max_age_days)
+        if incremental is not None:
+            self.incremental = incremental
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS scrape_state ('
+                ' scraper TEXT NOT NULL, name TEXT NOT NULL, field TEXT NOT NULL, scraped_at REAL NOT NULL,'
+                ' PRIMARY KEY (scraper, name, field))'
+            )
+        return self._conn
+
+    def _load(self, scraper):
+        """{name: {field: scraped_at}} for one scraper, read once per run."""
+        if scraper not in self._scraped:
+            scraped = {}
+            for name, field, scraped_at in self._connect().execute(
+                'SELECT name, field, scraped_at FROM scrape_state WHERE scraper = ?', (scraper,)
+            ):
+                scraped.setdefault(name, {})[field] = scraped_at
+            self._scraped[scraper] = scraped
+        return self._scraped[scraper]
+
+    def due(self, scraper, product_name, groups):
+        """Return the field groups to scrape for a product; groups maps each group to whether it is filled."""
+        if not self.incremental:
+            return set(groups)
+        scraped = self._load(scraper).get(normalize_query(product_name), {})
+        now = time.time()
+        due = set()
+        for group, filled in groups.items():
+            scraped_at = scraped.get(group)
+            if scraped_at is None:
+                if not filled:
+                    due.add(group)
+            elif now - scraped_at >= self.max_age_days[group] * 86400:
+                due.add(group)
+        if not due:
+            self.skipped += 1
+        return due
+
+    def touch(self, scraper, product_name, groups):
+        """Record that the given field groups of a product were just scraped."""
+        if not groups:
+            return
+        name = normalize_query(product_name)
+        now = time.time()
+        conn = self._connect()
+        conn.executemany(
+            'INSERT OR REPLACE INTO scrape_state (scraper, name, field, scraped_at) VALUES (?, ?, ?, ?)',
+            [(scraper, name, group, now) for group in groups],
+        )
+        conn.commit()
+        if scraper in self._scraped:
+            self._scraped[scraper].setdefault(name, {}).update(dict.fromkeys(groups, now))
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._scraped.clear()
+
+scrape_state = ScrapeState()
+
+def parse_max_age(text):
+    """Parse --max-age 'images=7,ar=30' into {'images': 7.0, 'ar': 30.0}."""
+    max_age = {}
+    for part in filter(None, (part.strip() for part in text.split(','))):
+        group, _, days = part.partition('=')
+        if group not in FRESHNESS_DAYS or not days:
+            raise argparse.ArgumentTypeError(
+                f"expected GROUP=DAYS with GROUP one of {', '.join(FRESHNESS_DAYS)}, got {part!r}")
+        max_age[group] = float(days)
+    return max_age
+
+def add_incremental_args(parser):
+    """Register the --incremental/--max-age/--state-file flags shared by both scrapers."""
+    defaults = ','.join(f'{group}={days}' for group, days in FRESHNESS_DAYS.items())
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only scrape fields that are missing or older than their max age')
+    parser.add_argument('--max-age', type=parse_max_age, default={}, metavar='GROUP=DAYS,...',
+                        help=f'Days before a field group is scraped again with --incremental (default {defaults})')
+    parser.add_argument('--state-file', default=SCRAPE_STATE_FILE,
+                        help=f'SQLite file recording when each field was last scraped (default {SCRAPE_STATE_FILE})')
+
+def configure_incremental(args):
+    """Apply the flags registered by add_incremental_args()."""
+    scrape_state.configure(path=args.state_file, max_age_days=args.max_age, incremental=args.incremental)
+
+class RowJournal:
+    """Append-only JSONL journal with one line per finished row.
+
+    Each line holds the row key, the product name it was scraped for and the
+    handler's result, so a crashed run can be resumed without rewriting the
+    whole CSV every few rows.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.resume = resume
+        self._file = None
+        self._reader = None
+
+    def offsets(self):
+        """Scan the journal once and return {key: (product, offset)} for each row's latest entry.
+
+        Only the byte offset of the entry is kept (read it back with read());
+        rows whose latest entry has a None result (nothing found or an error)
+        are left out so a resumed run retries them.
+        """
+        if not self.resume or not os.path.exists(self.path):
+            return {}
+        entries = {}
+        offset = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = {}  # Partial last line from a crash
+                key = entry.get('row')
+                if entry.get('result') is None:
+                    entries.pop(key, None)
+                else:
+                    entries[key] = (entry.get('product'), offset)
+                offset += len(line)
+        return entries
+
+    def read(self, offset):
+        """Return the result journaled at offset (from offsets())."""
+        if self._reader is None:
+            self._reader = open(self.path, 'rb')
+        self._reader.seek(offset)
+        return json.loads(self._reader.readline())['result']
+
+    def load(self, products):
+        """Return {key: result} for journaled rows whose product still matches products[key]."""
+        return {
+            key: self.read(offset)
+            for key, (product, offset) in self.offsets().items()
+            if key in products and str(products[key]) == product
+        }
+
+    def record(self, key, product, result):
+        """Append one finished row and flush it to disk."""
+        if self._file is None:
+            self._file = open(self.path, 'a' if self.resume else 'w', encoding='utf-8')
+        self._file.write(json.dumps({'row': key, 'product': str(product), 'result': result}, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+def add_journal_args(parser):
+    """Register the --resume/--journal flags shared by both scrapers."""
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip rows already finished in the journal of a previous run')
+    parser.add_argument('--journal', default=None,
+                        help='Row journal file (default <output>.journal.jsonl)')
+
+def open_journal(args, output_file):
+    """Create the RowJournal configured by add_journal_args()."""
+    return RowJournal(args.journal or f'{output_file}.journal.jsonl', resume=args.resume)
+
+def normalize_barcode(value):
+    """Barcode as digits-only text ('' when blank); numeric cells read as floats lose their '.0'."""
+    if value is None or (isinstance(value, float) and (value != value or not value.is_integer())):
+        return ''
+    if isinstance(value, float):
+        value = int(value)
+    return re.sub(r'\D', '', str(value))
+
+def product_keys(product_name, barcode=None, asins=()):
+    """Identity keys of a product for plan_duplicates(): normalized name, barcode and any known ASINs."""
+    keys = [('name', normalize_query(product_name)), ('barcode', normalize_barcode(barcode))]
+    keys.extend(('asin', asin) for asin in asins)
+    return [(kind, value) for kind, value in keys if value]
+
+def plan_duplicates(jobs, job_keys, merge_jobs):
+    """Group jobs that scrape the same product so each product is scraped once.
+
+    jobs is a list of (index, item); job_keys(item) returns the item's identity
+    keys (see product_keys()) and jobs sharing any key end up in one group.
+    merge_jobs(items) combines a group's items into the one job scraped for
+    all of them. Returns (jobs, members): one (leader index, merged item) job
+    per group, in input order, and {leader index: [other indexes]} for the
+    groups with more than one row.
+    """
+    parent = {}
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    owners = {}
+    items = dict(jobs)
+    position = {index: n for n, (index, _) in enumerate(jobs)}
+    for index, item in jobs:
+        parent[index] = index
+        for key in job_keys(item):
+            first, second = sorted((find(owners.setdefault(key, index)), find(index)), key=position.get)
+            # The earliest row of a group is its root, and so its leader
+            parent[second] = first
+
+    groups = {}
+    for index, _ in jobs:
+        groups.setdefault(find(index), []).append(index)
+    planned = []
+    members = {}
+    for indexes in groups.values():
+        planned.append((indexes[0], merge_jobs([items[index] for index in indexes])))
+        if len(indexes) > 1:
+            members[indexes[0]] = indexes[1:]
+    run_stats.duplicates += sum(len(indexes) for indexes in members.values())
+    return planned, members
+
+def add_dedupe_args(parser):
+    """Register the --no-dedupe flag shared by both scrapers."""
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help='Scrape every row, even rows with the same product name, barcode or cached ASIN')
+
+class ColumnBuffer:
+    """Finished rows' new cell values, kept column by column until they are written into the DataFrame.
+
+    add() takes one row's {column: value} updates as the row finishes;
+    apply() writes everything collected into the frame with one assignment
+    per column, so workers finishing rows never touch the frame itself.
+    """
+
+    def __init__(self):
+        self._columns = {}
+        self.rows = set()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, index, values):
+        for column, value in values.items():
+            indexes, column_values = self._columns.setdefault(column, ([], []))
+            indexes.append(index)
+            column_values.append(value)
+        self.rows.add(index)
+
+    def apply(self, df):
+        """Write the buffered values into df (adding missing columns) and empty the buffer.
+
+        Returns {column: row indexes written} so callers can post-process just those cells.
+        """
+        written = {}
+        for column, (indexes, values) in self._columns.items():
+            if column not in df.columns:
+                df[column] = ""
+            elif not (pd.api.types.is_object_dtype(df[column]) or pd.api.types.is_string_dtype(df[column])):
+                df[column] = df[column].astype(object)  # e.g. an all-empty column read as float
+            df.loc[indexes, column] = values
+            written[column] = indexes
+        self._columns.clear()
+        self.rows.clear()
+        return written
+
+class CsvStreamWriter:
+    """Writes finished rows to the output CSV while the run is still going.
+
+    With ordered=True rows come out in input order, so a row that finishes
+    early waits for the rows before it. Otherwise rows are written as they
+    finish, with their input row number in a leading Row column. Await
+    reserve() before handing a row out: it blocks once `window` rows are in
+    flight or waiting, which bounds memory by the window, not the catalog.
+    """
+
+    def __init__(self, path, ordered=True, window=DEFAULT_WORKERS * STREAM_WINDOW_PER_WORKER):
+        self.path = path
+        self.ordered = ordered
+        self.written = 0
+        self._slots = asyncio.Semaphore(window)
+        self._pending = {}
+        self._next_key = 0
+        self._columns = None
+        self._file = open(path, 'w', encoding='utf-8-sig', newline='')
+
+    async def reserve(self):
+        await self._slots.acquire()
+
+    def write(self, key, row):
+        """Hand over the finished row (a Series) for input row number key."""
+        if not self.ordered:
+            self._flush([(key, row)])
+            return
+        self._pending[key] = row
+        ready = []
+        while self._next_key in self._pending:
+            ready.append((self._next_key, self._pending.pop(self._next_key)))
+            self._next_key += 1
+        if ready:
+            self._flush(ready)
+
+    def _flush(self, rows):
+        if self._columns is None:
+            self._columns = list(rows[0][1].index)
+        frame = pd.DataFrame([row for _, row in rows], columns=self._columns)
+        if not self.ordered:
+            frame.insert(0, ROW_ID_COLUMN, [key for key, _ in rows])
+        frame.to_csv(self._file, header=self.written == 0, index=False)
+        self._file.flush()
+        self.written += len(rows)
+        for _ in rows:
+            self._slots.release()
+
+    def close(self):
+        if self._pending:
+            print(f"Warning: row {self._next_key} never finished, writing {len(self._pending)} later rows after it")
+            self._flush(sorted(self._pending.items()))
+            self._pending.clear()
+        self._file.close()
+
+async def stream_csv(browser, args, input_file, output_file, journal, handler, prepare_chunk, apply_result,
+                     on_result=None, writer=None, page_pool=None, job_keys=None, merge_jobs=None, row_result=None):
+    """--stream: scrape input_file a chunk at a time and write rows to output_file as they finish.
+
+    prepare_chunk(chunk) yields (index, row, item) for each row of a DataFrame
+    chunk; handler(item, pages) scrapes it, and rows with item None are copied
+    to the output unchanged. on_result(index, row, result) is called for each
+    scraped row (for logging and the journal) before apply_result(row, result)
+    merges the result into the row that gets written. Rows journaled by a
+    previous run are merged from the journal instead. input_file may also be
+    a file object; writer replaces the CsvStreamWriter for output_file with
+    any object that has the same reserve()/write()/close() methods.
+
+    With job_keys and merge_jobs (see plan_duplicates()), rows of a chunk
+    that are the same product are scraped once and every row of the group
+    gets row_result(row, result) of that scrape (the result itself without
+    row_result). Returns the number of rows scraped.
+    """
+    if writer is None:
+        writer = CsvStreamWriter(output_file, ordered=not args.unordered,
+                                 window=args.workers * STREAM_WINDOW_PER_WORKER)
+    journaled = journal.offsets() if journal else {}
+    in_flight = {}
+    # Duplicate rows: their group's leader, how many the reader has not reached yet, the ones
+    # reached before their leader finished, and finished leaders' results kept for the rest
+    leader_of = {}
+    unreached = {}
+    waiting = {}
+    shared = {}
+    scraped = 0
+    resumed = 0
+
+    async def jobs():
+        nonlocal scraped, resumed
+        for chunk in pd.read_csv(input_file, chunksize=args.chunk_size):
+            prepared = list(prepare_chunk(chunk))
+            resumable = {}
+            pending = []
+            for index, row, item in prepared:
+                product, offset = journaled.pop(index, (None, None))
+                if item is None:
+                    continue
+                if product is not None and product == str(row['Product']):
+                    resumable[index] = offset
+                else:
+                    pending.append((index, item))
+            if job_keys and not args.no_dedupe:
+                pending, members = plan_duplicates(pending, job_keys, merge_jobs)
+                for leader, indexes in members.items():
+                    leader_of.update(dict.fromkeys(indexes, leader))
+                    unreached[leader] = len(indexes)
+                    waiting[leader] = []
+            leaders = dict(pending)
+
+            for index, row, item in prepared:
+                await writer.reserve()
+                if index in leaders:
+                    in_flight[index] = row
+                    scraped += 1
+                    yield index, leaders[index]
+                elif index in leader_of:
+                    in_flight[index] = row
+                    leader = leader_of.pop(index)
+                    unreached[leader] -= 1
+                    if not unreached[leader]:
+                        del unreached[leader]
+                    if leader in shared:
+                        finish_row(index, shared[leader] if leader in unreached else shared.pop(leader))
+                    else:
+                        waiting[leader].append(index)
+                elif index in resumable:
+                    row = apply_result(row, journal.read(resumable[index]))
+                    events.row_finished(index, row, scraped=False)
+                    writer.write(index, row)
+                    resumed += 1
+                else:
+                    events.row_finished(index, row, scraped=False)
+                    writer.write(index, row)
+
+    def finish_row(index, result):
+        row = in_flight.pop(index)
+        if row_result:
+            result = row_result(row, result)
+        if on_result:
+            on_result(index, row, result)
+        with run_stats.stage('write_back', emit=False):
+            row = apply_result(row, result)
+            writer.write(index, row)
+        events.row_finished(index, row)
+
+    def finish(index, result):
+        finish_row(index, result)
+        for member in waiting.pop(index, []):
+            finish_row(member, result)
+        if index in unreached:
+            shared[index] = result
+
+    try:
+        await stream_page_pool(browser, jobs(), handler, workers=args.workers, on_result=finish, page_pool=page_pool,
+                               retries=args.retries)
+    finally:
+        writer.close()
+    if resumed:
+        print(f"Resumed {resumed} rows from {journal.path}")
+    print(f"Streamed {writer.written} rows to {output_file or 'the client'} ({scraped} scraped)")
+    return scraped
+
+async def rewrite_csv(input_file, output_file, transform, chunk_size=None):
+    """Rewrite a CSV through `await transform(chunk)`, chunk_size rows at a time (all at once when None).
+
+    The output goes to a temporary file next to output_file that replaces it
+    at the end, so output_file may be input_file.
+    """
+    fd, temp_path = tempfile.mkstemp(suffix='.csv', dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8-sig', newline='') as out:
+            chunks = pd.read_csv(input_file, chunksize=chunk_size) if chunk_size else [pd.read_csv(input_file)]
+            header = True
+            for chunk in chunks:
+                chunk = await transform(chunk)
+                chunk.to_csv(out, index=False, header=header)
+                header = False
+        os.replace(temp_path, output_file)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+def add_stream_args(parser):
+    """Register the --stream/--chunk-size/--unordered flags shared by both scrapers."""
+    parser.add_argument('--stream', action='store_true',
+                        help='Read the input in chunks and write rows as they finish, keeping memory bounded')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Rows read from the input at a time with --stream (default {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--unordered', action='store_true',
+                        help=f'With --stream, write rows as soon as they finish, numbered in a {ROW_ID_COLUMN} column')
+
+# Runs in the browser and returns everything we read from an Amazon product page in one round trip
+PRODUCT_PAGE_SCRIPT = """
+({mainImageSelectors, thumbnailSelectors, captchaText}) => {
+    const text = (selector) => {
+        const el = document.querySelector(selector);
+        return el ? el.innerText : null;
+    };
+    return {
+        url: location.href,
+        page_title: document.title,
+        captcha: location.href.toLowerCase().includes('captcha')
+            || (document.body ? document.body.textContent.includes(captchaText) : false),
+        title: text('#productTitle'),
+        bullets: Array.from(document.querySelectorAll('#feature-bullets ul li span.a-list-item'), el => el.innerText),
+        description: text('#productDescription'),
+        aplus: text('#aplus'),
+        main_images: mainImageSelectors.map(selector => {
+            const el = document.querySelector(selector);
+            return el ? el.getAttribute('src') : null;
+        }),
+        thumbnails: thumbnailSelectors.map(selector =>
+            Array.from(document.querySelectorAll(selector), el => ({
+                data_old_src: el.getAttribute('data-old-src'),
+                src: el.getAttribute('src'),
+            }))
+        ),
+    };
+}
+"""
+
+# Returns the hrefs of every search result selector (first 10 matches each) in one round trip
+SEARCH_PAGE_SCRIPT = """
+(selectors) => selectors.map(selector =>
+    Array.from(document.querySelectorAll(selector), el => el.getAttribute('href')).slice(0, 10)
+)
+"""
+
+async def extract_product_page(page):
+    """Read title, bullets, descriptions, image candidates and CAPTCHA state of an Amazon product page.
+
+    main_images has one src (or None) per MAIN_IMAGE_SELECTORS entry and thumbnails
+    one list of {data_old_src, src} per THUMBNAIL_SELECTORS entry.
+    """
+    with run_stats.stage('evaluate'):
+        return await page.evaluate(PRODUCT_PAGE_SCRIPT, {
+            'mainImageSelectors': MAIN_IMAGE_SELECTORS,
+            'thumbnailSelectors': THUMBNAIL_SELECTORS,
+            'captchaText': CAPTCHA_TEXT,
+        })
+
+async def extract_search_links(page, selectors=SEARCH_RESULT_SELECTORS):
+    """Return {selector: [href, ...]} for the result links on a DuckDuckGo page."""
+    with run_stats.stage('evaluate'):
+        hrefs = await page.evaluate(SEARCH_PAGE_SCRIPT, selectors)
+    return dict(zip(selectors, hrefs))
+
+class SnapshotStore:
+    """Directory of gzip-compressed HTML snapshots keyed by page URL.
+
+    Files are named after the SHA-1 of the URL; index.jsonl lists what was
+    saved so a corpus can be inspected or replayed by scraper_benchmark.py.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, url):
+        return os.path.join(self.path, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.html.gz')
+
+    def save(self, url, html):
+        with gzip.open(self._file(url), 'wt', encoding='utf-8') as f:
+            f.write(html)
+        with open(os.path.join(self.path, 'index.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'url': url, 'saved_at': time.time()}) + '\n')
+
+    def load(self, url):
+        """Return the saved HTML for url, or None."""
+        try:
+            with gzip.open(self._file(url), 'rt', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def urls(self):
+        path = os.path.join(self.path, 'index.jsonl')
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding='utf-8') as f:
+            return list(dict.fromkeys(json.loads(line)['url'] for line in f if line.strip()))
+
+snapshot_store = None
+CORPUS_INPUT = 'input.csv'  # Copy of the run's input kept in the snapshot store
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident memory in MB (ru_maxrss is bytes on macOS, KB elsewhere)."""
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / 1_048_576 if sys.platform == 'darwin' else rss / 1024
+
+def percentile(durations, q):
+    """q-th percentile (0-100) of a non-empty list, interpolated between samples."""
+    if len(durations) == 1:
+        return durations[0]
+    return statistics.quantiles(durations, n=100, method='inclusive')[q - 1]
+
+class RunStats:
+    """Per-stage wall-clock timings and page counts for a scraper run.
+
+    Stages are timed with `with run_stats.stage('search'):` and written as
+    JSON by write() for scraper_benchmark.py. Besides the scrapers' own
+    stages (search, en_page, ar_page, image_extraction) the shared helpers
+    time:
+
+        row          one pool job, from start to result
+        sleep        waiting for the rate limiter (lock and token bucket)
+        navigate     page.goto() in the browser
+        http_fetch   a GET on the HTTP fast path
+        evaluate     the in-page extraction scripts
+        wait         waiting for search results to render
+        write_back   merging a result into the output rows
+        image_check  checking the output's image URLs (--check-images)
+        image_hash   downloading and hashing images (--collapse-images)
+        image_mirror downloading images into the local mirror (--mirror-images)
+        new_context  a worker waiting for a browser context (short when a spare was ready)
+
+    Stages overlap (en_page includes navigate and evaluate), so only
+    row = sleep + work adds up; report() prints that split.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.pages = 0
+        self.duplicates = 0  # Rows that took another row's result (plan_duplicates())
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name, emit=True):
+        """Time the block as one sample of stage name; emit=False keeps it out of the event stream."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - started
+            self.stages.setdefault(name, []).append(duration)
+            if emit:
+                events.emit('stage', stage=name, seconds=round(duration, 3))
+
+    def pages_saved(self, rows):
+        """Estimated page loads the duplicate rows did not make, at this run's average pages per scraped row."""
+        return round(self.duplicates * self.pages / rows) if rows else 0
+
+    def summary(self, rows):
+        elapsed = time.monotonic() - self.started
+        row_seconds = sum(self.stages.get('row', []))
+        sleep_seconds = sum(self.stages.get('sleep', []))
+        return {
+            'rows': rows,
+            'elapsed': elapsed,
+            'pages': self.pages,
+            'pages_per_second': self.pages / elapsed if elapsed else 0.0,
+            'duplicates': self.duplicates,
+            'pages_saved': self.pages_saved(rows),
+            'peak_rss_mb': peak_rss_mb(),
+            'sleep_seconds': sleep_seconds,
+            'work_seconds': max(0.0, row_seconds - sleep_seconds),
+            'stages': {
+                name: {
+                    'count': len(durations),
+                    'total': sum(durations),
+                    'mean': statistics.fmean(durations),
+                    'p50': statistics.median(durations),
+                    'p95': percentile(durations, 95),
+                    'max': max(durations),
+                }
+                for name, durations in self.stages.items()
+            },
+        }
+
+    def report(self, rows):
+        """Print the per-stage p50/p95 table and how row time splits between sleeping and working."""
+        summary = self.summary(rows)
+        print(f"\n{'stage':<18}{'count':>7}{'p50':>10}{'p95':>10}{'total':>10}")
+        for name, timing in sorted(summary['stages'].items(), key=lambda item: -item[1]['total']):
+            print(f"{name:<18}{timing['count']:>7}{timing['p50']:>9.3f}s{timing['p95']:>9.3f}s{timing['total']:>9.1f}s")
+        busy = summary['sleep_seconds'] + summary['work_seconds']
+        if busy:
+            print(f"Row time: {summary['work_seconds']:.1f}s working, {summary['sleep_seconds']:.1f}s sleeping on "
+                  f"rate limits ({summary['sleep_seconds'] / busy:.0%}), summed over workers")
+
+    def write(self, path, rows):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(rows), f, indent=2)
+
+run_stats = RunStats()
+
+# Key of the pool job running in the current task, attached to the events it emits
+current_row = contextvars.ContextVar('current_row', default=None)
+# EventLog of the daemon job running in the current task; the global log hands its events to it
+job_events = contextvars.ContextVar('job_events', default=None)
+
+def row_data(row):
+    """A finished row (a Series or dict) as a JSON-ready {column: value} dict, NaN as null."""
+    if isinstance(row, dict):
+        row = pd.Series(row, dtype=object)
+    return json.loads(row.to_json(force_ascii=False))
+
+class EventLog:
+    """Machine-readable progress for the UI: one JSON object per line (NDJSON).
+
+    Every event has a 'type' and 't' (seconds since the run started), plus
+    'row' when it was emitted while a row was being scraped:
+
+        start         total rows to scrape (null when streaming), workers
+        row_started   worker
+        stage         stage, seconds (one RunStats stage)
+        cache         hit, domain, asin (ASIN cache lookup)
+        captcha       host, url, rate (the host's new request rate)
+        retry         url, reason, via (HTTP fast path handing a page to the browser)
+        row_retry     reason, attempt, delay (the row goes back to the end of the queue)
+        circuit_open  host, seconds (every row for the host is paused)
+        error         error (the row's job raised)
+        row_finished  seconds, scraped (false for resumed/copied rows), data (the output row)
+        progress      done, total, rows_per_minute (over the last minute), eta_seconds
+        complete      done, scraped, elapsed
+
+    While a task runs under job_events (a scraper_daemon.py job), the
+    events emitted through this log go to the job's own EventLog instead.
+
+    Events go through one buffer that is written within EVENT_FLUSH_SECONDS
+    of its first event (on a timer, so a quiet stretch does not hold them
+    back), and right away after row_finished, so the UI gets each finished
+    row as soon as it is merged without a write per event.
+    """
+
+    def __init__(self, count_copied=False, types=None):
+        """count_copied: rows finished without a scrape count towards done too (total counts every row).
+        types: the event types to write (default all).
+        """
+        self.started = time.monotonic()
+        self.count_copied = count_copied
+        self.types = types
+        self.total = None
+        self.done = 0
+        self._file = None
+        self._owns_file = False
+        self._buffer = []
+        self._flushed = self.started
+        self._flush_timer = None
+        self._rate_started = self.started
+        self._row_started = {}
+        self._finished_at = collections.deque()
+
+    @property
+    def enabled(self):
+        return self._file is not None
+
+    def open(self, path, stdout=None):
+        """Write events to path ('-' for stdout)."""
+        if path == '-':
+            self._file = stdout or sys.stdout
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+            self._owns_file = True
+
+    def _job_log(self):
+        """The EventLog of the daemon job running in this task, when it is not this one."""
+        log = job_events.get()
+        return log if log is not self else None
+
+    def emit(self, type, flush=False, **fields):
+        job_log = self._job_log()
+        if job_log is not None:
+            return job_log.emit(type, flush, **fields)
+        if self._file is None or (self.types is not None and type not in self.types):
+            return
+        event = {'type': type, 't': round(time.monotonic() - self.started, 3), 'row': current_row.get()}
+        event.update(fields)
+        if event['row'] is None:
+            del event['row']
+        self._buffer.append(json.dumps(event, ensure_ascii=False, default=str) + '\n')
+        if flush or len(self._buffer) >= EVENT_BUFFER_LINES or time.monotonic() - self._flushed >= EVENT_FLUSH_SECONDS:
+            self.flush()
+        elif self._flush_timer is None:
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        """Flush the buffer EVENT_FLUSH_SECONDS after the last flush, even if no event comes in the meantime."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()  # Not on the event loop, so nothing would run the timer
+            return
+        delay = max(0.0, EVENT_FLUSH_SECONDS - (time.monotonic() - self._flushed))
+        self._flush_timer = loop.call_later(delay, self.flush)
+
+    def start(self, total=None, workers=None):
+        self.total = total
+        self._rate_started = time.monotonic()
+        self.emit('start', total=total, workers=workers)
+
+    def row_started(self, key, worker_id=None):
+        job_log = self._job_log()
+        if job_log is not None:
+            return job_log.row_started(key, worker_id)
+        if self._file is None:
+            return
+        self._row_started[key] = time.monotonic()
+        self.emit('row_started', row=key, worker=worker_id)
+
+    def row_finished(self, key, row=None, scraped=True):
+        """Emit the finished output row, then the updated progress, and flush both."""
+        job_log = self._job_log()
+        if job_log is not None:
+            return job_log.row_finished(key, row, scraped)
+        if self._file is None:
+            return
+        now = time.monotonic()
+        started = self._row_started.pop(key, None)
+        if self.types is None or 'row_finished' in self.types:
+            self.emit('row_finished', row=key, scraped=scraped,
+                      seconds=round(now - started, 3) if started is not None else None,
+                      data=row_data(row) if row is not None else None)
+        if scraped or self.count_copied:
+            self.done += 1
+            self._finished_at.append(now)
+            self.progress(now)
+        self.flush()
+
+    def rows_per_minute(self, now=None):
+        """Rows finished per minute over the last THROUGHPUT_WINDOW_SECONDS (or since the start, if sooner)."""
+        now = now or time.monotonic()
+        while self._finished_at and now - self._finished_at[0] > THROUGHPUT_WINDOW_SECONDS:
+            self._finished_at.popleft()
+        window = min(THROUGHPUT_WINDOW_SECONDS, now - self._rate_started)
+        return len(self._finished_at) * 60 / window if window > 0 else 0.0
+
+    def progress(self, now=None):
+        rate = self.rows_per_minute(now)
+        eta = None
+        if self.total is not None and rate > 0:
+            eta = round(max(0, self.total - self.done) * 60 / rate, 1)
+        self.emit('progress', row=None, done=self.done, total=self.total,
+                  rows_per_minute=round(rate, 2), eta_seconds=eta)
+
+    def flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._file is not None and self._buffer:
+            self._file.write(''.join(self._buffer))
+            self._file.flush()
+            self._buffer.clear()
+        self._flushed = time.monotonic()
+
+    def close(self, scraped=None):
+        """Emit the closing 'complete' event and flush."""
+        if self._file is None:
+            return
+        self.emit('complete', row=None, done=self.done, scraped=scraped,
+                  elapsed=round(time.monotonic() - self.started, 3), flush=True)
+        if self._owns_file:
+            self._file.close()
+        self._file = None
+
+events = EventLog()
+
+def add_event_args(parser):
+    """Register the --events flag shared by both scrapers."""
+    parser.add_argument('--events', default=None, metavar='PATH',
+                        help="Write NDJSON progress events to PATH ('-' for stdout; logs then go to stderr)")
+
+def configure_events(args):
+    """Apply --events. With '-', stdout carries the events and everything printed goes to stderr."""
+    if not args.events:
+        return
+    if args.events == '-':
+        events.open('-', stdout=sys.stdout)
+        sys.stdout = sys.stderr
+    else:
+        events.open(args.events)
+
+def add_capture_args(parser):
+    """Register the snapshot, replay and stats flags shared by both scrapers."""
+    parser.add_argument('--headless', action='store_true', help='Run Chromium without a window')
+    parser.add_argument('--snapshot-dir', default=None,
+                        help='Save the HTML of every visited page to this compressed snapshot store')
+    parser.add_argument('--replay-server', default=None,
+                        help='Load every page from this local snapshot server instead of the internet')
+    parser.add_argument('--stats-file', default=None, help='Write per-stage timings and page counts as JSON')
+    parser.add_argument('--timings', action='store_true', help='Print per-stage p50/p95 timings at the end of the run')
+    parser.add_argument('--profile', default=None, metavar='PATH',
+                        help='Profile the run with cProfile and save the stats to PATH (view with snakeviz or pstats)')
+
+def configure_capture(args, input_file, corpus_input=CORPUS_INPUT):
+    """Apply the flags registered by add_capture_args(); input_file (if any) is copied into the snapshot store.
+
+    A --shard run copies its rows to its own corpus_input, as its sibling
+    shards record into the same store at once.
+    """
+    global snapshot_store, replay_base
+    if args.snapshot_dir:
+        snapshot_store = SnapshotStore(args.snapshot_dir)
+    if args.snapshot_dir and input_file:
+        # Keep the input next to the corpus so the benchmark can replay the same rows
+        with open(input_file, 'rb') as src, open(os.path.join(args.snapshot_dir, corpus_input), 'wb') as dst:
+            dst.write(src.read())
+    if args.replay_server:
+        replay_base = args.replay_server.rstrip('/')
+
+def start_profiler(args):
+    """Start cProfile for --profile. It runs on the event loop thread, so it sees every worker coroutine."""
+    if not args.profile:
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def stop_profiler(profiler, args):
+    """Save the --profile stats and print the functions with the most cumulative time."""
+    if profiler is None:
+        return
+    profiler.disable()
+    profiler.dump_stats(args.profile)
+    print(f"\nProfile saved to {args.profile}; top functions by cumulative time:")
+    pstats.Stats(profiler, stream=sys.stdout).sort_stats('cumulative').print_stats(15)
+
+async def save_snapshot(url, page=None, html=None):
+    """Save a visited page (from the browser page or raw HTML) when --snapshot-dir is set."""
+    if snapshot_store is None:
+        return
+    if html is None:
+        html = await page.content()
+    snapshot_store.save(url, html)
@@ -0,0 +1,312 @@
+"""Long-lived scraper service, so a job does not pay for Python start-up, imports and a Chromium launch.
+
+    python scraper_daemon.py --headless            # serve jobs on a Unix socket (SCRAPER_SOCKET)
+    python scraper_daemon.py --headless --stdio    # read jobs from stdin, reply on stdout
+
+A job is one JSON line:
+
+    {"id": "job-1", "scraper": "amazon", "csv": "ID,Product\\n1,Nivea Cream\\n"}
+
+An optional "mirror_images": true|false overrides --mirror-images for the
+job: its images are then copied into --mirror-dir (see scraper_image_mirror.py)
+and the final CSV points at the copies. Start the daemon with
+--mirror-dir <app>/public/mirror when the app should serve them.
+
+The reply is NDJSON on the same connection: one {"type": "row", "row": n,
+"data": {...}} line per row as soon as it is finished, then one
+{"type": "complete", "csv": "..."} line with the whole output in input order,
+or {"type": "error", "error": "..."}. In between, {"type": "event", "event":
+{...}} lines carry the job's progress, captcha, retry, row_retry,
+circuit_open and error events (see EventLog). Every line carries the job's id.
+
+The browser with its warm pages, the HTTP client and the ASIN cache stay open
+between jobs. With --stdio, scraper logs go to stderr. --snapshot-dir saves
+the pages of every job (jobs have no input file, so the corpus has no
+input.csv), and --stats-file is written when the daemon stops.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import signal
+import sys
+
+import pandas as pd
+from playwright.async_api import async_playwright
+
+import scraper_additional_images
+import scraper_amazon
+from scraper_common import (
+    DEFAULT_CHUNK_SIZE, DEFAULT_WORKERS, STREAM_WINDOW_PER_WORKER, EventLog, LazyBrowser, PagePool,
+    add_asin_cache_args, add_capture_args, add_dedupe_args, add_incremental_args, add_rate_limit_args,
+    add_recycle_args, add_resource_filter_args, asin_cache, configure_asin_cache, configure_capture,
+    configure_incremental, configure_recycle, configure_resource_filter, context_recycler, job_events, rate_limiter,
+    row_data, run_stats, scrape_state, start_profiler, stop_profiler, stream_csv,
+)
+from scraper_http import add_engine_args, close_engine, configure_engine
+from scraper_image_mirror import Image, add_image_mirror_args, configure_image_mirror, mirror_frame, mirror_store
+
+DEFAULT_SOCKET = os.environ.get('SCRAPER_SOCKET', '/tmp/product-visualizer-scraper.sock')
+SCRAPERS = {
+    'amazon': scraper_amazon,
+    'additional_images': scraper_additional_images,
+}
+JOB_EVENT_TYPES = {'progress', 'captcha', 'retry', 'row_retry', 'circuit_open', 'error'}  # Sent to the client
+
+class NdjsonEventSink:
+    """File-like target of a job's EventLog that sends each event to the client as an 'event' line."""
+
+    def __init__(self, send):
+        self.send = send
+
+    def write(self, text):
+        for line in text.splitlines():
+            self.send({'type': 'event', 'event': json.loads(line)})
+
+    def flush(self):
+        pass
+
+class NdjsonRowWriter:
+    """stream_csv() writer that sends each finished row to the client and keeps it for the final CSV."""
+
+    def __init__(self, send, window):
+        self.send = send
+        self.rows = {}
+        self.written = 0
+        self._slots = asyncio.Semaphore(window)
+
+    async def reserve(self):
+        await self._slots.acquire()
+
+    def write(self, key, row):
+        self.rows[key] = row
+        self.written += 1
+        self.send({'type': 'row', 'row': int(key), 'data': row_data(row)})
+        self._slots.release()
+
+    def close(self):
+        pass
+
+    def frame(self):
+        return pd.DataFrame([self.rows[key] for key in sorted(self.rows)])
+
+class ScraperDaemon:
+    """Runs jobs against one browser and PagePool shared by every connection."""
+
+    def __init__(self, args, browser):
+        self.args = args
+        self.browser = browser
+        self.page_pool = PagePool(browser, args.workers)
+        self.jobs = 0
+        self.scraped = 0  # Rows scraped by every job so far, for --timings and --stats-file
+
+    async def run_job(self, request, send):
+        scraper = SCRAPERS.get(request.get('scraper'))
+        if scraper is None:
+            raise ValueError(f"Unknown scraper {request.get('scraper')!r} (expected one of {', '.join(SCRAPERS)})")
+        if not isinstance(request.get('csv'), str):
+            raise ValueError("Job has no 'csv' payload")
+        mirror_images = request.get('mirror_images', self.args.mirror_images)
+        if mirror_images and Image is None:
+            raise ValueError("mirror_images needs httpx and pillow (pip install httpx pillow)")
+
+        self.jobs += 1
+        print(f"Job {request.get('id')}: {request['scraper']} ({self.jobs} since start)")
+        job_args = argparse.Namespace(workers=self.args.workers, chunk_size=self.args.chunk_size, unordered=True,
+                                      retries=self.args.retries, no_dedupe=self.args.no_dedupe)
+        writer = NdjsonRowWriter(send, window=self.args.workers * STREAM_WINDOW_PER_WORKER)
+        # The job's own progress: every row counts, as the total is every row of its CSV
+        job_log = EventLog(count_copied=True, types=JOB_EVENT_TYPES)
+        job_log.open('-', stdout=NdjsonEventSink(send))
+        job_log.start(total=len(pd.read_csv(io.StringIO(request['csv']), dtype=str, keep_default_na=False)),
+                      workers=self.args.workers)
+        token = job_events.set(job_log)
+        scraped = None
+        try:
+            scraped = await stream_csv(
+                self.browser, job_args, io.StringIO(request['csv']), None, None,
+                scraper.handle_job, scraper.prepare_chunk, scraper.apply_result, scraper.stream_on_result(),
+                writer=writer, page_pool=self.page_pool,
+                job_keys=scraper.job_keys, merge_jobs=scraper.merge_jobs, row_result=scraper.row_result,
+            )
+        finally:
+            job_events.reset(token)
+            job_log.close(scraped)
+        self.scraped += scraped
+        df = writer.frame()
+        if mirror_images:
+            df = await mirror_frame(df)
+        send({'type': 'complete', 'rows': writer.written, 'scraped': scraped, 'csv': df.to_csv(index=False)})
+
+    async def handle_line(self, line, write_line):
+        """Run the job in one request line, replying through write_line(str)."""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            write_line(json.dumps({'id': None, 'type': 'error', 'error': f'Invalid JSON: {e}'}))
+            return
+        job_id = request.get('id') if isinstance(request, dict) else None
+
+        def send(message):
+            write_line(json.dumps({'id': job_id, **message}, ensure_ascii=False))
+
+        try:
+            if not isinstance(request, dict):
+                raise ValueError('A job must be a JSON object')
+            await self.run_job(request, send)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            send({'type': 'error', 'error': str(e)})
+
+    async def serve_connection(self, reader, writer):
+        def write_line(text):
+            writer.write(text.encode('utf-8') + b'\n')
+
+        try:
+            while True:
+                line = await read_line(reader)
+                if not line:
+                    break
+                if line.strip():
+                    await self.handle_line(line, write_line)
+                    await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_socket(self, path, stopped):
+        if os.path.exists(path):
+            os.unlink(path)  # Left behind by a daemon that did not shut down cleanly
+        server = await asyncio.start_unix_server(self.serve_connection, path=path)
+        os.chmod(path, 0o600)
+        print(f"Scraper daemon listening on {path} ({self.args.workers} workers)")
+        try:
+            async with server:
+                await stopped.wait()
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+
+    async def serve_stdio(self, stdout):
+        def write_line(text):
+            stdout.write(text + '\n')
+            stdout.flush()
+
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        try:
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+            next_line = lambda: read_line(reader)
+        except ValueError:
+            # A regular file (--stdio < jobs.ndjson) is no pipe; read its lines in a thread instead
+            next_line = lambda: loop.run_in_executor(None, sys.stdin.readline)
+        print(f"Scraper daemon reading jobs from stdin ({self.args.workers} workers)")
+        while True:
+            line = await next_line()
+            if not line:
+                break
+            if line.strip():
+                await self.handle_line(line, write_line)
+
+    async def close(self):
+        await self.page_pool.close()
+        await context_recycler.close()
+        await self.browser.close()
+
+async def read_line(reader):
+    """Read one newline-terminated line of any length ('' at end of stream).
+
+    Jobs carry whole CSVs, which easily exceed the StreamReader's 64 KiB line limit.
+    """
+    chunks = []
+    while True:
+        try:
+            chunk = await reader.readuntil(b'\n')
+        except asyncio.IncompleteReadError as e:
+            chunks.append(e.partial)
+            break
+        except asyncio.LimitOverrunError as e:
+            chunks.append(await reader.readexactly(e.consumed))
+            continue
+        chunks.append(chunk)
+        break
+    return b''.join(chunks).decode('utf-8')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Keep the scrapers and a warm browser running and serve jobs.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f'Unix socket to listen on (default {DEFAULT_SOCKET})')
+    parser.add_argument('--stdio', action='store_true', help='Read jobs from stdin and reply on stdout instead')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Browser pages kept open and shared by all jobs (default {DEFAULT_WORKERS})')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help=argparse.SUPPRESS)
+    parser.add_argument('--max-images', type=int, default=scraper_additional_images.MAX_IMAGES,
+                        help='Max images per product for additional_images jobs')
+    parser.add_argument('--domain-search', choices=scraper_additional_images.DOMAIN_SEARCH_MODES,
+                        default=scraper_additional_images.DOMAIN_SEARCH_MODE,
+                        help='How additional_images jobs search amazon.sa/ae/eg')
+    add_rate_limit_args(parser)
+    add_asin_cache_args(parser)
+    add_incremental_args(parser)
+    add_dedupe_args(parser)
+    add_resource_filter_args(parser)
+    add_recycle_args(parser)
+    add_engine_args(parser)
+    add_image_mirror_args(parser)
+    add_capture_args(parser)
+    return parser.parse_args()
+
+async def main():
+    args = parse_args()
+    stdout = sys.stdout
+    if args.stdio:
+        # stdout carries the NDJSON replies; everything the scrapers print goes to stderr
+        sys.stdout = sys.stderr
+    rate_limiter.configure(rate=args.rate, jitter=args.jitter, share=args.rate_share)
+    configure_asin_cache(args)
+    configure_incremental(args)
+    configure_resource_filter(args)
+    configure_recycle(args)
+    configure_engine(args)
+    configure_image_mirror(args)
+    configure_capture(args, None)
+    profiler = start_profiler(args)
+    scraper_additional_images.MAX_IMAGES = args.max_images
+    scraper_additional_images.DOMAIN_SEARCH_MODE = args.domain_search
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopped.set)
+
+    async with async_playwright() as p:
+        daemon = ScraperDaemon(args, LazyBrowser(p, headless=args.headless))
+        try:
+            if args.engine == 'browser':
+                await daemon.page_pool.warm()
+            if args.stdio:
+                serve = asyncio.ensure_future(daemon.serve_stdio(stdout))
+                await asyncio.wait([serve, asyncio.ensure_future(stopped.wait())],
+                                   return_when=asyncio.FIRST_COMPLETED)
+                serve.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await serve
+            else:
+                await daemon.serve_socket(args.socket, stopped)
+        finally:
+            await daemon.close()
+            await close_engine()
+            asin_cache.close()
+            scrape_state.close()
+            mirror_store.close()
+    if args.stats_file:
+        run_stats.write(args.stats_file, daemon.scraped)
+    if args.timings:
+        run_stats.report(daemon.scraped)
+    stop_profiler(profiler, args)
+    print("Scraper daemon stopped")
+
+if __name__ == "__main__":
+    asyncio.run(main())
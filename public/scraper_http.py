@@ -0,0 +1,216 @@
+"""HTTP-only fast path for the scrapers: pooled httpx client + selectolax parsing.
+
+Product pages and DuckDuckGo searches are fetched without a browser and parsed
+into the same payloads as extract_product_page() / extract_search_links().
+When the HTML is incomplete, blocked, or a CAPTCHA comes back, the page is
+loaded with Playwright instead. Needs `pip install httpx selectolax`.
+"""
+import random
+import urllib.parse
+
+from scraper_common import (
+    AMAZON_DOMAINS, AMAZON_LANGUAGE_COOKIES, CAPTCHA_TEXT, CONTEXT_LOCALES, MAIN_IMAGE_SELECTORS,
+    SEARCH_RESULT_SELECTORS, THUMBNAIL_SELECTORS, USER_AGENTS, events, extract_product_page, extract_search_links,
+    goto, host_key, rate_limiter, replay_url, replaying, run_stats, save_snapshot,
+)
+
+try:
+    import httpx
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    httpx = None
+    HTMLParser = None
+
+ENGINES = ['browser', 'http']
+HTTP_MAX_CONNECTIONS = 20
+HTTP_TIMEOUT = 20  # Seconds
+DUCKDUCKGO_HTML_URL = 'https://html.duckduckgo.com/html/'
+DUCKDUCKGO_SEARCH_URL = 'https://duckduckgo.com/'  # The page the browser searches on, same query string
+
+def node_text(node, separator='\n'):
+    return node.text(separator=separator, strip=True) if node else None
+
+def parse_product_page(html, url):
+    """Parse an Amazon product page into the extract_product_page() payload."""
+    tree = HTMLParser(html)
+    title_node = tree.css_first('title')
+    captcha = 'captcha' in url.lower() or CAPTCHA_TEXT in html
+    # Descriptions and A+ content embed scripts and styles that innerText would not show
+    tree.strip_tags(['script', 'style', 'noscript'])
+    return {
+        'url': url,
+        'page_title': node_text(title_node, '') or '',
+        'captcha': captcha,
+        'title': node_text(tree.css_first('#productTitle'), ''),
+        'bullets': [node_text(node, '') for node in tree.css('#feature-bullets ul li span.a-list-item')],
+        'description': node_text(tree.css_first('#productDescription')),
+        'aplus': node_text(tree.css_first('#aplus')),
+        'main_images': [
+            node.attributes.get('src') if node else None
+            for node in (tree.css_first(selector) for selector in MAIN_IMAGE_SELECTORS)
+        ],
+        'thumbnails': [
+            [{'data_old_src': node.attributes.get('data-old-src'), 'src': node.attributes.get('src')}
+             for node in tree.css(selector)]
+            for selector in THUMBNAIL_SELECTORS
+        ],
+    }
+
+def is_complete(data):
+    """True when the server HTML already had what the scrapers read (title and main image)."""
+    return bool(data['title']) and any(data['main_images'])
+
+def decode_result_href(href):
+    """Resolve DuckDuckGo's //duckduckgo.com/l/?uddg=<url> redirect links to the target URL."""
+    if href and 'uddg=' in href:
+        target = urllib.parse.parse_qs(urllib.parse.urlparse(href).query).get('uddg')
+        if target:
+            return target[0]
+    return href
+
+def parse_search_page(html, selectors=SEARCH_RESULT_SELECTORS, rendered=False):
+    """Parse a DuckDuckGo HTML results page into the extract_search_links() payload.
+
+    Returns None when the page is not a results page (e.g. a bot challenge).
+    rendered: html may also be a duckduckgo.com/?q= page as the browser
+    rendered it, taken as it is, like the browser would.
+    """
+    tree = HTMLParser(html)
+    if not rendered and not tree.css_first('.results, #links, .no-results'):
+        return None
+    return {
+        selector: [decode_result_href(node.attributes.get('href')) for node in tree.css(selector)][:10]
+        for selector in selectors
+    }
+
+class HttpEngine:
+    """Pooled keep-alive HTTP client that serves product and search pages without a browser."""
+
+    def __init__(self, max_connections=HTTP_MAX_CONNECTIONS, timeout=HTTP_TIMEOUT):
+        self._client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            headers={
+                'User-Agent': random.choice(USER_AGENTS),
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            },
+        )
+        self.served = 0
+        self.fallbacks = 0
+
+    async def fetch(self, url, language='en'):
+        """GET url through the shared rate limiter with the language's Accept-Language and Amazon cookie."""
+        await rate_limiter.acquire(url)
+        headers = {'Accept-Language': CONTEXT_LOCALES[language]}
+        host = host_key(url)
+        if host in AMAZON_DOMAINS:
+            headers['Cookie'] = f"lc-acb{host.split('.')[-1]}={AMAZON_LANGUAGE_COOKIES[language]}"
+        run_stats.pages += 1
+        with run_stats.stage('http_fetch'):
+            response = await self._client.get(replay_url(url), headers=headers)
+        if response.status_code == 200:
+            await save_snapshot(url, html=response.text)
+        return response
+
+    def _fallback(self, url, reason):
+        self.fallbacks += 1
+        print(f"  HTTP fast path: {reason}, using browser for {url[:80]}")
+        events.emit('retry', url=url, reason=reason, via='browser')
+        return None
+
+    async def product_page(self, url, language='en'):
+        """Return the parsed product page, or None when the browser should load it instead."""
+        try:
+            response = await self.fetch(url, language)
+        except httpx.HTTPError as e:
+            return self._fallback(url, f"request failed ({e})")
+        if response.status_code == 503:
+            rate_limiter.penalize(url)
+            return self._fallback(url, "blocked (503)")
+        if response.status_code != 200:
+            return self._fallback(url, f"HTTP {response.status_code}")
+
+        data = parse_product_page(response.text, str(response.url))
+        if data['captcha']:
+            print("  CAPTCHA in HTTP response")
+            rate_limiter.penalize(url)
+            return self._fallback(url, "CAPTCHA")
+        if not is_complete(data):
+            return self._fallback(url, "incomplete HTML")
+        self.served += 1
+        return data
+
+    async def search_links(self, search_url, selectors=SEARCH_RESULT_SELECTORS):
+        """Run a duckduckgo.com/?q= search on the HTML endpoint; None when the browser should run it instead."""
+        query = urllib.parse.urlparse(search_url).query
+        html_url = f"{DUCKDUCKGO_HTML_URL}?{query}"
+        try:
+            response = await self.fetch(html_url)
+        except httpx.HTTPError as e:
+            return self._fallback(search_url, f"request failed ({e})")
+        if response.status_code != 200:
+            return self._fallback(search_url, f"HTTP {response.status_code}")
+        # A snapshot server may answer with the search page as the browser recorded it (see scraper_benchmark.py)
+        links = parse_search_page(response.text, selectors, rendered=replaying())
+        if links is None:
+            return self._fallback(search_url, "no results page")
+        self.served += 1
+        return links
+
+    def summary(self):
+        return f"HTTP fast path: {self.served} pages served, {self.fallbacks} browser fallbacks"
+
+    async def close(self):
+        await self._client.aclose()
+
+http_engine = None
+
+def add_engine_args(parser):
+    """Register the --engine flag shared by both scrapers."""
+    parser.add_argument('--engine', choices=ENGINES, default='browser',
+                        help='browser: Playwright only; http: fetch over HTTP and fall back to Playwright when needed')
+
+def configure_engine(args):
+    """Create the HTTP engine if --engine http was given."""
+    global http_engine
+    if args.engine != 'http':
+        return
+    if httpx is None:
+        raise SystemExit("Error: --engine http needs httpx and selectolax (pip install httpx selectolax)")
+    http_engine = HttpEngine()
+
+async def close_engine():
+    if http_engine is not None:
+        print(http_engine.summary())
+        await http_engine.close()
+
+async def load_product_page(pages, url, language='en', timeout=30000):
+    """Return the extract_product_page() payload for url, over HTTP when possible, else in the browser."""
+    if http_engine is not None:
+        data = await http_engine.product_page(url, language)
+        if data:
+            return data
+    page = await pages.get(language)
+    await goto(page, url, wait_until='domcontentloaded', timeout=timeout)
+    data = await extract_product_page(page)
+    await save_snapshot(url, page)
+    return data
+
+async def load_search_links(pages, search_url, wait_selector, selectors=SEARCH_RESULT_SELECTORS, timeout=20000, slot=0):
+    """Return the extract_search_links() payload for a DuckDuckGo search, over HTTP when possible."""
+    if http_engine is not None:
+        links = await http_engine.search_links(search_url, selectors)
+        if links is not None:
+            return links
+    page = await pages.get('en', slot)
+    await goto(page, search_url, wait_until='domcontentloaded', timeout=timeout)
+    # Results are rendered client-side; wait for them instead of sleeping
+    try:
+        with run_stats.stage('wait'):
+            await page.wait_for_selector(wait_selector, timeout=5000)
+    except Exception:
+        pass
+    links = await extract_search_links(page, selectors)
+    await save_snapshot(search_url, page)
+    return links
@@ -0,0 +1,265 @@
+"""Post-scrape check that the image URLs in a product CSV actually resolve.
+
+Every URL in the Image and Additional Images columns is checked at once over
+a pooled keep-alive HTTP client: a HEAD request, or a one-byte range GET for
+servers that do not answer HEAD. The status, content type and size of each
+URL are cached in SQLite, so re-runs only check new or expired URLs. Dead
+URLs (an error status, or a page that is not an image) are dropped from the
+cells or listed in a Broken Images column:
+
+    python scraper_image_check.py export.csv export_checked.csv --check-images drop
+
+Both scrapers run the same check on their output with --check-images.
+--replay-server points the checks at a local stand-in image server. Needs
+`pip install httpx`.
+"""
+import argparse
+import asyncio
+import collections
+import random
+import sqlite3
+import time
+
+from scraper_common import USER_AGENTS, add_capture_args, configure_capture, replay_url, rewrite_csv, run_stats
+from scraper_images import (
+    IMAGE_COLUMN, IMAGE_LIST_COLUMN, IMAGE_LIST_SEPARATOR, image_list_positions, image_positions, image_urls,
+    join_image_positions,
+)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+CHECK_MODES = ['off', 'flag', 'drop']
+CHECK_CACHE_FILE = 'image_check.sqlite'
+CHECK_TTL_DAYS = 7
+CHECK_DEAD_TTL_DAYS = 1  # Dead URLs are checked again sooner, in case the CDN was having a bad moment
+CHECK_CONNECTIONS = 32
+CHECK_TIMEOUT = 10  # Seconds
+BROKEN_COLUMN = 'Broken Images'
+HEAD_UNSUPPORTED = (403, 405, 501)  # Statuses some CDNs give HEAD but not GET
+
+# status 0 = the server could not be reached (not cached, and never counted as dead)
+ImageStatus = collections.namedtuple('ImageStatus', 'status content_type size')
+
+def is_dead(result):
+    """True for URLs the server answered with an error or with something that is not an image."""
+    if result.status == 0:
+        return False
+    if result.status not in (200, 206):
+        return True
+    return bool(result.content_type) and not result.content_type.startswith('image/')
+
+class ImageCheckCache:
+    """On-disk SQLite cache of ImageStatus per URL, in the same shape as AsinCache."""
+
+    def __init__(self, path=CHECK_CACHE_FILE, ttl_days=CHECK_TTL_DAYS, dead_ttl_days=CHECK_DEAD_TTL_DAYS, enabled=True):
+        self.path = path
+        self.ttl_days = ttl_days
+        self.dead_ttl_days = dead_ttl_days
+        self.enabled = enabled
+        self.hits = 0
+        self._conn = None
+
+    def configure(self, path=None, enabled=None):
+        self.close()
+        if path is not None:
+            self.path = path
+        if enabled is not None:
+            self.enabled = enabled
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS image_check ('
+                ' url TEXT PRIMARY KEY, status INTEGER NOT NULL, content_type TEXT, size INTEGER,'
+                ' checked_at REAL NOT NULL)'
+            )
+        return self._conn
+
+    def get_many(self, urls, batch=500):
+        """Return {url: ImageStatus} for the URLs with a fresh cached result."""
+        if not self.enabled:
+            return {}
+        found = {}
+        urls = list(urls)
+        now = time.time()
+        for start in range(0, len(urls), batch):
+            part = urls[start:start + batch]
+            rows = self._connect().execute(
+                f"SELECT url, status, content_type, size, checked_at FROM image_check"
+                f" WHERE url IN ({','.join('?' * len(part))})", part,
+            )
+            for url, status, content_type, size, checked_at in rows:
+                result = ImageStatus(status, content_type, size)
+                ttl_days = self.dead_ttl_days if is_dead(result) else self.ttl_days
+                if now - checked_at < ttl_days * 86400:
+                    found[url] = result
+        self.hits += len(found)
+        return found
+
+    def set_many(self, results):
+        """Store {url: ImageStatus}; unreachable URLs are left out so the next run tries them again."""
+        if not self.enabled:
+            return
+        now = time.time()
+        conn = self._connect()
+        conn.executemany(
+            'INSERT OR REPLACE INTO image_check (url, status, content_type, size, checked_at) VALUES (?, ?, ?, ?, ?)',
+            [(url, *result, now) for url, result in results.items() if result.status],
+        )
+        conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+image_check_cache = ImageCheckCache()
+
+class ImageChecker:
+    """Checks image URLs concurrently over one pooled keep-alive client."""
+
+    def __init__(self, connections=CHECK_CONNECTIONS, timeout=CHECK_TIMEOUT):
+        self._client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+            headers={'User-Agent': random.choice(USER_AGENTS), 'Accept': 'image/*,*/*;q=0.8'},
+        )
+        self._slots = asyncio.Semaphore(connections)
+
+    async def _range_get(self, url):
+        """GET just the first byte; the full size comes from Content-Range (or Content-Length on a 200)."""
+        async with self._client.stream('GET', url, headers={'Range': 'bytes=0-0'}) as response:
+            size = response.headers.get('Content-Range', '').rpartition('/')[2]
+            if not size.isdigit():
+                size = response.headers.get('Content-Length', '')
+            return ImageStatus(response.status_code, response.headers.get('Content-Type'),
+                               int(size) if size.isdigit() else None)
+
+    async def check(self, url):
+        """Return the ImageStatus of url (status 0 when the server could not be reached)."""
+        async with self._slots:
+            try:
+                response = await self._client.head(replay_url(url))
+                if response.status_code in HEAD_UNSUPPORTED or 'Content-Length' not in response.headers:
+                    return await self._range_get(replay_url(url))
+                return ImageStatus(response.status_code, response.headers.get('Content-Type'),
+                                   int(response.headers['Content-Length']))
+            except (httpx.HTTPError, ValueError):
+                return ImageStatus(0, None, None)
+
+    async def check_all(self, urls):
+        """Return {url: ImageStatus} for urls, from the cache where possible and checking the rest at once."""
+        results = image_check_cache.get_many(urls)
+        missing = [url for url in urls if url not in results]
+        with run_stats.stage('image_check'):
+            checked = await asyncio.gather(*(self.check(url) for url in missing))
+        checked = dict(zip(missing, checked))
+        image_check_cache.set_many(checked)
+        results.update(checked)
+        return results
+
+    async def close(self):
+        await self._client.aclose()
+
+def apply_checks(df, dead, mode):
+    """Drop the dead URLs from df's image columns (mode 'drop') or list them in BROKEN_COLUMN ('flag')."""
+    if mode == 'flag':
+        positions = image_positions(df)
+        df[BROKEN_COLUMN] = join_image_positions(positions.where(positions.isin(dead), None))
+        return df
+    if IMAGE_COLUMN in df.columns:
+        images = df[IMAGE_COLUMN]
+        df[IMAGE_COLUMN] = images.astype(object).where(~images.astype(str).str.strip().isin(dead), None)
+    if IMAGE_LIST_COLUMN in df.columns:
+        blank, positions = image_list_positions(df[IMAGE_LIST_COLUMN])
+        result = df[IMAGE_LIST_COLUMN].astype(object).where(~blank, None)
+        result[~blank] = join_image_positions(positions.where(~positions.isin(dead), None), IMAGE_LIST_SEPARATOR)
+        df[IMAGE_LIST_COLUMN] = result
+    return df
+
+class CheckStats:
+    """Counts of the URLs checked over a run, for the summary line."""
+
+    def __init__(self):
+        self.urls = 0
+        self.dead = 0
+        self.unreachable = 0
+
+    def add(self, results):
+        self.urls += len(results)
+        self.dead += sum(is_dead(result) for result in results.values())
+        self.unreachable += sum(result.status == 0 for result in results.values())
+
+    def summary(self, mode):
+        action = 'dropped' if mode == 'drop' else f'listed in {BROKEN_COLUMN}'
+        return (f"Image check: {self.urls} URLs ({image_check_cache.hits} cached), {self.dead} dead ({action}), "
+                f"{self.unreachable} unreachable (kept)")
+
+async def check_images(df, checker, mode, stats=None):
+    """Check every image URL in df and drop or flag the dead ones in place; returns df."""
+    results = await checker.check_all(image_urls(df))
+    if stats is not None:
+        stats.add(results)
+    return apply_checks(df, {url for url, result in results.items() if is_dead(result)}, mode)
+
+async def check_frame(df, mode):
+    """check_images() for one in-memory DataFrame with a checker of its own; prints the summary."""
+    checker = ImageChecker()
+    stats = CheckStats()
+    try:
+        df = await check_images(df, checker, mode, stats)
+    finally:
+        await checker.close()
+    print(stats.summary(mode))
+    return df
+
+async def check_file(input_file, output_file, mode, chunk_size=None):
+    """Run check_images() over a CSV, a chunk at a time when chunk_size is given; output may be the input."""
+    checker = ImageChecker()
+    stats = CheckStats()
+    try:
+        await rewrite_csv(input_file, output_file, lambda chunk: check_images(chunk, checker, mode, stats), chunk_size)
+    finally:
+        await checker.close()
+    print(stats.summary(mode))
+
+def add_image_check_args(parser):
+    """Register the --check-images/--image-check-file flags shared by both scrapers."""
+    parser.add_argument('--check-images', choices=CHECK_MODES, default='off',
+                        help='After scraping, HEAD-check every image URL and drop the dead ones or flag them '
+                             f'in a {BROKEN_COLUMN} column (default off)')
+    parser.add_argument('--image-check-file', default=CHECK_CACHE_FILE,
+                        help=f'SQLite file caching image check results (default {CHECK_CACHE_FILE})')
+
+def configure_image_check(args):
+    """Apply the flags registered by add_image_check_args()."""
+    if args.check_images != 'off' and httpx is None:
+        raise SystemExit("Error: --check-images needs httpx (pip install httpx)")
+    image_check_cache.configure(path=args.image_check_file, enabled=not getattr(args, 'no_cache', False))
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the image URLs of a product CSV and drop or flag dead ones.')
+    parser.add_argument('input_file')
+    parser.add_argument('output_file', nargs='?', default=None, help='Output CSV (default: overwrite input)')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Check the file this many rows at a time')
+    parser.add_argument('--no-cache', action='store_true', help='Check every URL, ignoring cached results')
+    add_image_check_args(parser)
+    add_capture_args(parser)
+    parser.set_defaults(check_images='flag')
+    args = parser.parse_args()
+    if args.check_images == 'off':
+        parser.error('--check-images off has nothing to do here')
+
+    configure_image_check(args)
+    configure_capture(args, None)
+    asyncio.run(check_file(args.input_file, args.output_file or args.input_file, args.check_images, args.chunk_size))
+    image_check_cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""Perceptual-hash deduplication of product images.
+
+The same photo often comes back at several Amazon sizes or CDN paths, which
+exact URL comparison cannot see. This stage downloads every image once, in a
+bounded async pool, and computes a 64-bit difference hash (dHash) in a
+process pool. Photos whose hashes differ in at most HASH_DISTANCE bits are
+treated as one photo:
+
+- within a row, repeats of the main image or of an earlier additional image
+  are dropped from Additional Images;
+- across rows, every copy is rewritten to the first URL seen for the photo,
+  so the storefront stores it once.
+
+Hashes are kept in a SQLite index, so each URL is downloaded once across
+runs. Runs on an existing export too:
+
+    python scraper_image_hash.py export.csv export_deduped.csv
+
+Needs `pip install httpx pillow`.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import io
+import random
+import sqlite3
+import time
+
+from scraper_common import USER_AGENTS, add_capture_args, configure_capture, replay_url, rewrite_csv, run_stats
+from scraper_images import image_urls, rename_images
+
+try:
+    import httpx
+    from PIL import Image
+except ImportError:
+    httpx = None
+    Image = None
+
+HASH_INDEX_FILE = 'image_hashes.sqlite'
+HASH_DISTANCE = 6  # Max differing bits (of 64) between two copies of one photo
+HASH_DOWNLOADS = 16  # Images downloading at once
+HASH_TIMEOUT = 20  # Seconds
+HASH_MAX_BYTES = 10 * 1024 * 1024  # Larger downloads are abandoned (not hashed)
+HASH_SIZE = 8  # dHash grid: HASH_SIZE x HASH_SIZE bits
+
+def image_hash(data):
+    """64-bit dHash of an encoded image, or None if it cannot be decoded. Runs in the hashing processes.
+
+    The image is shrunk to a (HASH_SIZE + 1) x HASH_SIZE grayscale grid and
+    each bit says whether a pixel is brighter than its right-hand neighbour,
+    so resizing and recompression barely change the hash.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            grid = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+            pixels = grid.tobytes()
+    except Exception:
+        return None
+    bits = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            offset = row * (HASH_SIZE + 1) + col
+            bits = (bits << 1) | (pixels[offset] > pixels[offset + 1])
+    return bits
+
+class HashIndex:
+    """On-disk SQLite index of image hashes per URL, shared by runs and by both scrapers.
+
+    An image behind a URL does not change, so entries never expire.
+    """
+
+    def __init__(self, path=HASH_INDEX_FILE, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self.hits = 0
+        self._conn = None
+
+    def configure(self, path=None, enabled=None):
+        self.close()
+        if path is not None:
+            self.path = path
+        if enabled is not None:
+            self.enabled = enabled
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS image_hashes ('
+                ' url TEXT PRIMARY KEY, hash TEXT NOT NULL, hashed_at REAL NOT NULL)'
+            )
+        return self._conn
+
+    def get_many(self, urls, batch=500):
+        """Return {url: hash} for the URLs already in the index."""
+        if not self.enabled:
+            return {}
+        found = {}
+        urls = list(urls)
+        for start in range(0, len(urls), batch):
+            part = urls[start:start + batch]
+            rows = self._connect().execute(
+                f"SELECT url, hash FROM image_hashes WHERE url IN ({','.join('?' * len(part))})", part,
+            )
+            found.update((url, int(value, 16)) for url, value in rows)
+        self.hits += len(found)
+        return found
+
+    def set_many(self, hashes):
+        """Store {url: hash} (64-bit hashes are kept as hex, as SQLite integers are signed)."""
+        if not self.enabled or not hashes:
+            return
+        now = time.time()
+        conn = self._connect()
+        conn.executemany(
+            'INSERT OR REPLACE INTO image_hashes (url, hash, hashed_at) VALUES (?, ?, ?)',
+            [(url, f'{value:016x}', now) for url, value in hashes.items()],
+        )
+        conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+hash_index = HashIndex()
+
+class PhotoIndex:
+    """The first URL seen for each photo, looked up by hash within HASH_DISTANCE bits.
+
+    Hashes are split into distance + 1 bands; two hashes within the distance
+    agree on at least one whole band, so only the hashes sharing a band with
+    the new one are compared instead of every photo seen so far.
+    """
+
+    def __init__(self, distance=HASH_DISTANCE):
+        self.distance = distance
+        bands = distance + 1
+        bits = HASH_SIZE * HASH_SIZE
+        edges = [round(bits * band / bands) for band in range(bands + 1)]
+        self._bands = [(edges[band], (1 << (edges[band + 1] - edges[band])) - 1) for band in range(bands)]
+        self._tables = [{} for _ in self._bands]
+        self._photos = []  # (hash, first URL)
+
+    def __len__(self):
+        return len(self._photos)
+
+    def canonical(self, url, value):
+        """The URL to use for the image at url: the first URL seen with a matching hash, else url itself."""
+        keys = [(value >> shift) & mask for shift, mask in self._bands]
+        for table, key in zip(self._tables, keys):
+            for photo in table.get(key, ()):
+                known, first_url = self._photos[photo]
+                if (known ^ value).bit_count() <= self.distance:
+                    return first_url
+        self._photos.append((value, url))
+        for table, key in zip(self._tables, keys):
+            table.setdefault(key, []).append(len(self._photos) - 1)
+        return url
+
+class ImageDownloader:
+    """Bounded pool of image downloads over one pooled keep-alive client."""
+
+    def __init__(self, downloads=HASH_DOWNLOADS, timeout=HASH_TIMEOUT, max_bytes=HASH_MAX_BYTES):
+        self._client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=downloads, max_keepalive_connections=downloads),
+            headers={'User-Agent': random.choice(USER_AGENTS), 'Accept': 'image/*,*/*;q=0.8'},
+        )
+        self._slots = asyncio.Semaphore(downloads)
+        self.max_bytes = max_bytes
+
+    async def download(self, url):
+        """The image bytes at url, or None on an error status, a failed request or an oversized file."""
+        async with self._slots:
+            try:
+                async with self._client.stream('GET', replay_url(url)) as response:
+                    if response.status_code != 200:
+                        return None
+                    chunks = []
+                    size = 0
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            return None
+                        chunks.append(chunk)
+                    return b''.join(chunks)
+            except httpx.HTTPError:
+                return None
+
+    async def close(self):
+        await self._client.aclose()
+
+class ImageHasher:
+    """Downloads images in a bounded pool and hashes them in a process pool."""
+
+    def __init__(self, downloads=HASH_DOWNLOADS, processes=None):
+        self._downloader = ImageDownloader(downloads)
+        self._processes = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+        self.photos = PhotoIndex()
+        self.downloaded = 0
+        self.failed = 0
+
+    async def hash_url(self, url):
+        data = await self._downloader.download(url)
+        if data is None:
+            self.failed += 1
+            return None
+        self.downloaded += 1
+        return await asyncio.get_running_loop().run_in_executor(self._processes, image_hash, data)
+
+    async def hash_all(self, urls):
+        """Return {url: hash} for the urls that could be hashed, downloading only those not in the index."""
+        hashes = hash_index.get_many(urls)
+        missing = [url for url in urls if url not in hashes]
+        with run_stats.stage('image_hash'):
+            hashed = await asyncio.gather(*(self.hash_url(url) for url in missing))
+        hashed = {url: value for url, value in zip(missing, hashed) if value is not None}
+        hash_index.set_many(hashed)
+        hashes.update(hashed)
+        return hashes
+
+    async def collapse(self, df):
+        """Drop near-duplicate images within each row and give each photo one URL across rows; returns df."""
+        urls = image_urls(df)
+        hashes = await self.hash_all(urls)
+        # urls are in order of first appearance, so the first row to show a photo keeps its URL
+        canonical = {url: self.photos.canonical(url, hashes[url]) for url in urls if url in hashes}
+        return rename_images(df, canonical)
+
+    def summary(self):
+        return (f"Image hashes: {self.downloaded} downloaded, {hash_index.hits} from the index, {self.failed} failed; "
+                f"{len(self.photos)} distinct photos")
+
+    async def close(self):
+        await self._downloader.close()
+        self._processes.shutdown()
+
+async def collapse_frame(df):
+    """ImageHasher.collapse() for one in-memory DataFrame with a hasher of its own; prints the summary."""
+    hasher = ImageHasher()
+    try:
+        df = await hasher.collapse(df)
+    finally:
+        await hasher.close()
+    print(hasher.summary())
+    return df
+
+async def collapse_file(input_file, output_file, chunk_size=None):
+    """ImageHasher.collapse() over a CSV, a chunk at a time; photos are matched across all chunks."""
+    hasher = ImageHasher()
+    try:
+        await rewrite_csv(input_file, output_file, hasher.collapse, chunk_size)
+    finally:
+        await hasher.close()
+    print(hasher.summary())
+
+def add_image_hash_args(parser):
+    """Register the --collapse-images/--hash-index-file flags."""
+    parser.add_argument('--collapse-images', action='store_true',
+                        help='After scraping, perceptual-hash every image: drop near-duplicates within a row '
+                             'and use one URL per photo across rows')
+    parser.add_argument('--hash-index-file', default=HASH_INDEX_FILE,
+                        help=f'SQLite index of image hashes, so images are downloaded once (default {HASH_INDEX_FILE})')
+
+def configure_image_hash(args):
+    """Apply the flags registered by add_image_hash_args()."""
+    if args.collapse_images and Image is None:
+        raise SystemExit("Error: --collapse-images needs httpx and pillow (pip install httpx pillow)")
+    hash_index.configure(path=args.hash_index_file)
+
+def main():
+    parser = argparse.ArgumentParser(description='Collapse near-duplicate images in a product CSV by perceptual hash.')
+    parser.add_argument('input_file')
+    parser.add_argument('output_file', nargs='?', default=None, help='Output CSV (default: overwrite input)')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Process the file this many rows at a time')
+    add_image_hash_args(parser)
+    add_capture_args(parser)
+    parser.set_defaults(collapse_images=True)
+    args = parser.parse_args()
+
+    configure_image_hash(args)
+    configure_capture(args, None)
+    asyncio.run(collapse_file(args.input_file, args.output_file or args.input_file, args.chunk_size))
+    hash_index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Local mirror of product images, so the app stops hotlinking Amazon's CDN.
+
+Every image URL in the Image and Additional Images columns is downloaded
+once into a content-addressed store (files are named by the SHA-256 of their
+bytes, so the same image behind several URLs is stored once) and a
+fixed-size JPEG thumbnail is made for it in a process pool:
+
+    mirror/images/ab/ab12...ef.jpg
+    mirror/thumbs/160/ab/ab12...ef.jpg
+    image_mirror.sqlite             URL -> (digest, extension)
+
+The index lives in the working directory like the other SQLite caches
+(--mirror-index), outside the store, which the app serves publicly.
+
+The store defaults to mirror/ next to this script (public/mirror in a
+checkout, which Next.js serves as /mirror/...). The app's scrape route runs
+the scripts from the directory above the app, so it passes --mirror-dir
+with the app's own public/mirror; it mirrors when SCRAPER_MIRROR_IMAGES=1
+(with the scraper daemon too, see scraper_daemon.py).
+The CSV columns are rewritten to those paths and the main image's thumbnail
+goes into an Image Thumbnail column for the table. URLs that cannot be
+downloaded stay remote. Runs on an existing export too:
+
+    python scraper_image_mirror.py export.csv export_mirrored.csv
+
+Needs `pip install httpx pillow`.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import hashlib
+import io
+import os
+import sqlite3
+import tempfile
+import time
+
+from scraper_common import add_capture_args, configure_capture, rewrite_csv, run_stats
+from scraper_image_hash import Image, ImageDownloader
+from scraper_images import IMAGE_COLUMN, image_positions, image_urls, rename_images
+
+MIRROR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mirror')
+MIRROR_URL_PREFIX = '/mirror'
+MIRROR_INDEX_FILE = 'image_mirror.sqlite'
+MIRROR_DOWNLOADS = 16  # Images downloading at once
+THUMBNAIL_SIZE = 160  # Pixels, longest side
+THUMBNAIL_COLUMN = 'Image Thumbnail'
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp', 'BMP': '.bmp'}
+
+def image_file(root, digest, ext):
+    return os.path.join(root, 'images', digest[:2], digest + ext)
+
+def thumbnail_file(root, digest, size=THUMBNAIL_SIZE):
+    return os.path.join(root, 'thumbs', str(size), digest[:2], digest + '.jpg')
+
+def write_file(path, write):
+    """Create path atomically through write(file object), so a crash never leaves half an image behind."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+def save_thumbnail(image, path, size):
+    thumbnail = image.convert('RGB')
+    thumbnail.thumbnail((size, size))
+    write_file(path, lambda f: thumbnail.save(f, 'JPEG', quality=80))
+
+def store_image(data, root, size):
+    """Store an image's bytes under root and make its thumbnail; returns (digest, ext), or None if not an image.
+
+    Runs in the worker processes. Files already in the store are left alone.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            ext = FORMAT_EXTENSIONS.get(image.format, '.jpg')
+            path = image_file(root, digest, ext)
+            if not os.path.exists(path):
+                write_file(path, lambda f: f.write(data))
+            thumbnail = thumbnail_file(root, digest, size)
+            if not os.path.exists(thumbnail):
+                save_thumbnail(image, thumbnail, size)
+    except Exception:
+        return None
+    return digest, ext
+
+def make_thumbnail(path, thumbnail, size):
+    """Make the thumbnail of a stored image that has none yet (e.g. after THUMBNAIL_SIZE changed)."""
+    try:
+        with Image.open(path) as image:
+            save_thumbnail(image, thumbnail, size)
+    except Exception:
+        pass
+
+class MirrorStore:
+    """Where the mirror lives, and its SQLite index of which URL holds which stored image."""
+
+    def __init__(self, root=MIRROR_DIR, url_prefix=MIRROR_URL_PREFIX, index_path=MIRROR_INDEX_FILE):
+        self.root = root
+        self.url_prefix = url_prefix
+        self.index_path = index_path
+        self._conn = None
+
+    def configure(self, root=None, url_prefix=None, index_path=None):
+        self.close()
+        if root is not None:
+            self.root = root
+        if url_prefix is not None:
+            self.url_prefix = url_prefix.rstrip('/')
+        if index_path is not None:
+            self.index_path = index_path
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.index_path, timeout=30)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS mirror ('
+                ' url TEXT PRIMARY KEY, digest TEXT NOT NULL, ext TEXT NOT NULL, stored_at REAL NOT NULL)'
+            )
+        return self._conn
+
+    def get_many(self, urls, batch=500):
+        """Return {url: (digest, ext)} for the URLs whose image is still in the store."""
+        found = {}
+        urls = list(urls)
+        for start in range(0, len(urls), batch):
+            part = urls[start:start + batch]
+            rows = self._connect().execute(
+                f"SELECT url, digest, ext FROM mirror WHERE url IN ({','.join('?' * len(part))})", part,
+            )
+            found.update(
+                (url, (digest, ext)) for url, digest, ext in rows
+                if os.path.exists(image_file(self.root, digest, ext))
+            )
+        return found
+
+    def set_many(self, stored):
+        if not stored:
+            return
+        now = time.time()
+        conn = self._connect()
+        conn.executemany(
+            'INSERT OR REPLACE INTO mirror (url, digest, ext, stored_at) VALUES (?, ?, ?, ?)',
+            [(url, digest, ext, now) for url, (digest, ext) in stored.items()],
+        )
+        conn.commit()
+
+    def public_url(self, path):
+        """The URL the app loads a file of the store from."""
+        return f"{self.url_prefix}/{os.path.relpath(path, self.root).replace(os.sep, '/')}"
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+mirror_store = MirrorStore()
+
+class ImageMirror:
+    """Downloads images in a bounded pool and stores them and their thumbnails in a process pool."""
+
+    def __init__(self, downloads=MIRROR_DOWNLOADS, processes=None, size=THUMBNAIL_SIZE):
+        self._downloader = ImageDownloader(downloads)
+        self._processes = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+        self.size = size
+        self.downloaded = 0
+        self.reused = 0
+        self.failed = 0
+
+    async def store(self, url):
+        data = await self._downloader.download(url)
+        stored = None
+        if data is not None:
+            stored = await asyncio.get_running_loop().run_in_executor(
+                self._processes, store_image, data, mirror_store.root, self.size)
+        if stored is None:
+            self.failed += 1
+        else:
+            self.downloaded += 1
+        return stored
+
+    async def mirror_all(self, urls):
+        """Return {url: (digest, ext)} for the urls in the store, downloading only those not mirrored yet."""
+        stored = mirror_store.get_many(urls)
+        self.reused += len(stored)
+        missing = [url for url in urls if url not in stored]
+        loop = asyncio.get_running_loop()
+        with run_stats.stage('image_mirror'):
+            thumbnails = {
+                digest: (image_file(mirror_store.root, digest, ext), thumbnail_file(mirror_store.root, digest, self.size))
+                for digest, ext in stored.values()
+            }
+            await asyncio.gather(*(
+                loop.run_in_executor(self._processes, make_thumbnail, path, thumbnail, self.size)
+                for path, thumbnail in thumbnails.values() if not os.path.exists(thumbnail)
+            ))
+            downloaded = await asyncio.gather(*(self.store(url) for url in missing))
+        downloaded = {url: result for url, result in zip(missing, downloaded) if result is not None}
+        mirror_store.set_many(downloaded)
+        stored.update(downloaded)
+        return stored
+
+    async def mirror(self, df):
+        """Mirror every image of df and point its image columns (and THUMBNAIL_COLUMN) at the store; returns df."""
+        stored = await self.mirror_all(image_urls(df))
+        if IMAGE_COLUMN in df.columns:
+            thumbnails = {
+                url: mirror_store.public_url(thumbnail_file(mirror_store.root, digest, self.size))
+                for url, (digest, _) in stored.items()
+            }
+            thumbnail = image_positions(df)[0].map(thumbnails)
+            if THUMBNAIL_COLUMN in df.columns:
+                thumbnail = thumbnail.where(thumbnail.notna(), df[THUMBNAIL_COLUMN])
+            df[THUMBNAIL_COLUMN] = thumbnail
+        return rename_images(df, {
+            url: mirror_store.public_url(image_file(mirror_store.root, digest, ext))
+            for url, (digest, ext) in stored.items()
+        })
+
+    def summary(self):
+        return (f"Image mirror: {self.downloaded} downloaded, {self.reused} already mirrored, {self.failed} failed "
+                f"(left remote) in {mirror_store.root}")
+
+    async def close(self):
+        await self._downloader.close()
+        self._processes.shutdown()
+
+async def mirror_frame(df):
+    """ImageMirror.mirror() for one in-memory DataFrame with a mirror of its own; prints the summary."""
+    mirror = ImageMirror()
+    try:
+        df = await mirror.mirror(df)
+    finally:
+        await mirror.close()
+    print(mirror.summary())
+    return df
+
+async def mirror_file(input_file, output_file, chunk_size=None):
+    """ImageMirror.mirror() over a CSV, a chunk at a time when chunk_size is given."""
+    mirror = ImageMirror()
+    try:
+        await rewrite_csv(input_file, output_file, mirror.mirror, chunk_size)
+    finally:
+        await mirror.close()
+    print(mirror.summary())
+
+def add_image_mirror_args(parser):
+    """Register the --mirror-images/--mirror-dir/--mirror-url-prefix/--mirror-index flags shared by both scrapers."""
+    parser.add_argument('--mirror-images', action='store_true',
+                        help='After scraping, download every image into a local store with thumbnails and point '
+                             'the image columns at it')
+    parser.add_argument('--mirror-dir', default=MIRROR_DIR, help=f'Image store directory (default {MIRROR_DIR})')
+    parser.add_argument('--mirror-url-prefix', default=MIRROR_URL_PREFIX,
+                        help=f'URL the app serves the store under (default {MIRROR_URL_PREFIX})')
+    parser.add_argument('--mirror-index', default=MIRROR_INDEX_FILE,
+                        help=f'SQLite index of the mirrored URLs, kept out of the served store (default {MIRROR_INDEX_FILE})')
+
+def configure_image_mirror(args):
+    """Apply the flags registered by add_image_mirror_args()."""
+    if args.mirror_images and Image is None:
+        raise SystemExit("Error: --mirror-images needs httpx and pillow (pip install httpx pillow)")
+    mirror_store.configure(root=args.mirror_dir, url_prefix=args.mirror_url_prefix, index_path=args.mirror_index)
+
+def main():
+    parser = argparse.ArgumentParser(description='Mirror the images of a product CSV into a local store.')
+    parser.add_argument('input_file')
+    parser.add_argument('output_file', nargs='?', default=None, help='Output CSV (default: overwrite input)')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Process the file this many rows at a time')
+    add_image_mirror_args(parser)
+    add_capture_args(parser)
+    parser.set_defaults(mirror_images=True)
+    args = parser.parse_args()
+
+    configure_image_mirror(args)
+    configure_capture(args, None)
+    asyncio.run(mirror_file(args.input_file, args.output_file or args.input_file, args.chunk_size))
+    mirror_store.close()
+
+if __name__ == "__main__":
+    main()
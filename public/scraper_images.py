@@ -0,0 +1,182 @@
+"""Image URL normalization shared by the scrapers, one URL or whole columns at a time.
+
+Amazon image URLs carry size parameters (71abc._AC_SX425_.jpg); the
+normalized form drops them, along with any query string or fragment, and
+always ends in an image extension. normalize_image_url() handles a single
+URL; normalize_image_column() / normalize_image_list_column() apply the
+same rule to pandas columns with vectorized string ops, so an existing
+export can be re-normalized without a Python loop per URL:
+
+    python scraper_images.py export.csv export_normalized.csv
+"""
+import argparse
+import re
+
+import pandas as pd
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.bmp']
+DEFAULT_EXTENSION = '.jpg'
+IMAGE_COLUMN = 'Image'
+IMAGE_LIST_COLUMN = 'Additional Images'
+IMAGE_LIST_SEPARATOR = '|'
+BLANK_VALUES = ['', 'nan', 'none']
+
+_EXTENSION_PATTERN = '|'.join(re.escape(ext[1:]) for ext in IMAGE_EXTENSIONS)
+# Size parameters run from '._' to the end of the file name; an extension there is kept
+SIZE_PARAMS_PATTERN = rf'\._(?:[^/]*(\.(?:{_EXTENSION_PATTERN}))$|[^/]*$)'
+_size_params_re = re.compile(SIZE_PARAMS_PATTERN, re.IGNORECASE)
+
+def normalize_image_url(url):
+    """Strip query string, fragment and Amazon size parameters; keep or add an image extension."""
+    if not url:
+        return None
+    url = re.split(r'[?#]', url.strip(), maxsplit=1)[0]
+    if '._' in url:
+        url = _size_params_re.sub(r'\1', url)
+    return url if url.lower().endswith(tuple(IMAGE_EXTENSIONS)) else url + DEFAULT_EXTENSION
+
+def is_blank_value(value):
+    """Single-cell version of is_blank()."""
+    return value is None or (isinstance(value, float) and value != value) or str(value).strip().lower() in BLANK_VALUES
+
+def is_blank(series):
+    """Mask of missing cells, including the 'nan'/'none' strings left behind by earlier exports."""
+    return series.isna() | series.astype(str).str.strip().str.lower().isin(BLANK_VALUES)
+
+def normalize_image_column(series):
+    """Vectorized normalize_image_url() over a column of single URLs; blank cells become None.
+
+    Plain substring checks pick out the cells that need a regex pass, so
+    already-clean URLs skip the regexes entirely.
+    """
+    blank = is_blank(series)
+    urls = series[~blank].astype(str).str.strip()
+    query = urls.str.contains('?', regex=False) | urls.str.contains('#', regex=False)
+    urls[query] = urls[query].str.replace(r'[?#].*$', '', regex=True)
+    sized = urls.str.contains('._', regex=False)
+    urls[sized] = urls[sized].str.replace(_size_params_re, r'\1', regex=True)
+    missing = ~urls.str.lower().str.endswith(tuple(IMAGE_EXTENSIONS))
+    urls[missing] = urls[missing] + DEFAULT_EXTENSION
+    result = series.astype(object).where(~blank, None)
+    result[~blank] = urls
+    return result
+
+def join_image_positions(positions, separator=IMAGE_LIST_SEPARATOR):
+    """Join a frame with one column per list position back into separator-joined cells.
+
+    None entries are skipped and each URL is kept only at its first position,
+    comparing whole columns at a time; rows left with no URLs become None.
+    """
+    joined = pd.Series('', index=positions.index, dtype=object)
+    kept = []
+    for position in positions.columns:
+        urls = positions[position]
+        for earlier in kept:
+            urls = urls.where(urls != earlier, None)
+        kept.append(urls)
+        present = urls.notna()
+        joined[present] = joined[present] + separator + urls[present]
+    return joined.str[len(separator):].where(joined != '', None)
+
+def split_image_list_column(series, separator=IMAGE_LIST_SEPARATOR):
+    """Split the non-blank cells of a URL list column into one column per position; returns (blank mask, positions)."""
+    blank = is_blank(series)
+    return blank, series[~blank].astype(str).str.split(separator, expand=True, regex=False)
+
+def image_list_positions(series, separator=IMAGE_LIST_SEPARATOR):
+    """split_image_list_column() with every entry stripped and blank entries None."""
+    blank, positions = split_image_list_column(series, separator)
+    return blank, positions.apply(lambda urls: urls.str.strip().where(~is_blank(urls), None))
+
+def image_positions(df, image_column=IMAGE_COLUMN, list_column=IMAGE_LIST_COLUMN):
+    """Every image URL of df in one frame: the main image, then one column per list position (None = no URL).
+
+    Columns are numbered from 0 (the main image, when df has image_column); missing columns are skipped.
+    """
+    frames = []
+    if image_column in df.columns:
+        images = df[image_column]
+        frames.append(images.astype(str).str.strip().where(~is_blank(images), None).rename('main'))
+    if list_column in df.columns:
+        frames.append(image_list_positions(df[list_column])[1].reindex(df.index))
+    positions = pd.concat(frames, axis=1) if frames else pd.DataFrame(index=df.index)
+    return positions.set_axis(range(positions.shape[1]), axis=1)
+
+def image_urls(df):
+    """The distinct http(s) image URLs of df, in order of first appearance (row by row)."""
+    urls = pd.unique(image_positions(df).stack().dropna())
+    return [url for url in urls if str(url).startswith(('http://', 'https://'))]
+
+def rename_images(df, mapping, image_column=IMAGE_COLUMN, list_column=IMAGE_LIST_COLUMN):
+    """Replace the image URLs of df that are keys of mapping by their values, in place; returns df.
+
+    Two URLs may now be the same, so list entries that repeat the main image
+    or an earlier entry are dropped afterwards.
+    """
+    def rename(urls):
+        renamed = urls.map(mapping)
+        return renamed.where(renamed.notna(), urls)
+
+    main = None
+    if image_column in df.columns:
+        images = df[image_column]
+        main = rename(images.astype(str).str.strip().where(~is_blank(images), None))
+        df[image_column] = images.astype(object).where(main.isna(), main)
+    if list_column in df.columns:
+        blank, positions = image_list_positions(df[list_column])
+        positions = positions.apply(rename)
+        if main is not None:
+            positions = positions.where(positions.ne(main[~blank], axis=0), None)
+        result = df[list_column].astype(object).where(~blank, None)
+        result[~blank] = join_image_positions(positions)
+        df[list_column] = result
+    return df
+
+def normalize_image_list_column(series, separator=IMAGE_LIST_SEPARATOR):
+    """Normalize a column of separator-joined URL lists (e.g. Additional Images).
+
+    The lists are split into one column per position and normalized column by
+    column. Blank entries are dropped and repeats removed in order (two sizes
+    of one image normalize to the same URL). Cells left with no URLs become None.
+    """
+    blank, positions = split_image_list_column(series, separator)
+    result = series.astype(object).where(~blank, None)
+    result[~blank] = join_image_positions(positions.apply(normalize_image_column), separator)
+    return result
+
+def dedupe_image_list_column(series, separator=IMAGE_LIST_SEPARATOR):
+    """Drop blank entries and repeated URLs from each cell of a URL list column, keeping the first of each.
+
+    Like normalize_image_list_column() but URLs are only compared, not rewritten.
+    """
+    blank, positions = image_list_positions(series, separator)
+    result = series.astype(object).where(~blank, None)
+    result[~blank] = join_image_positions(positions, separator)
+    return result
+
+def normalize_images(df, image_column=IMAGE_COLUMN, list_column=IMAGE_LIST_COLUMN):
+    """Normalize the image columns of a product DataFrame in place; missing columns are skipped."""
+    if image_column in df.columns:
+        df[image_column] = normalize_image_column(df[image_column])
+    if list_column in df.columns:
+        df[list_column] = normalize_image_list_column(df[list_column])
+    return df
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-normalize the image URL columns of a product CSV.')
+    parser.add_argument('input_file')
+    parser.add_argument('output_file', nargs='?', default=None, help='Output CSV (default: overwrite input)')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.input_file)
+    before = df.reindex(columns=[IMAGE_COLUMN, IMAGE_LIST_COLUMN]).copy()
+    normalize_images(df)
+    after = df.reindex(columns=[IMAGE_COLUMN, IMAGE_LIST_COLUMN])
+    changed = (before.fillna('') != after.fillna('')).sum()
+    output_file = args.output_file or args.input_file
+    df.to_csv(output_file, index=False)
+    print(f"Normalized {len(df)} rows: {changed[IMAGE_COLUMN]} {IMAGE_COLUMN} and "
+          f"{changed[IMAGE_LIST_COLUMN]} {IMAGE_LIST_COLUMN} cells changed. Saved to {output_file}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Sharded runs: one catalog split across processes or machines by a stable hash of each product.
+
+    python scraper_amazon.py products.csv out.csv --shards 4     # 4 processes on this machine, merged at the end
+    python scraper_amazon.py products.csv out.csv --shard 2/4    # part 2 of 4 only, e.g. on a second machine
+    python scraper_shard.py out.csv                              # merge out.shard-*-of-4.csv into out.csv
+
+A row goes to a shard by a hash of its normalized product name (its ID when
+the name is blank), so every process and machine agrees on the split and
+the rows of one product land in the same shard, where plan_duplicates()
+still scrapes them once. A shard scrapes its rows, tagged with their input
+row number in a Source Row column, into OUTPUT.shard-I-of-K.csv with a
+journal of its own for --resume; merging puts every row back in input order.
+
+Each process has its own browser and worker pool. --shards gives each one
+1/K of every host's rate limit (--rate-share), as they share one IP; shards
+on separate machines keep the full rate.
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import os
+import re
+import sys
+
+import pandas as pd
+
+from scraper_common import CORPUS_INPUT, DEFAULT_CHUNK_SIZE, ROW_ID_COLUMN, normalize_query
+from scraper_image_hash import add_image_hash_args, collapse_file, configure_image_hash, hash_index
+
+SOURCE_ROW_COLUMN = 'Source Row'
+SHARD_OUTPUT_LINE_LIMIT = 16 * 1024 * 1024  # Longest line read from a shard process's output
+
+def shard_spec(text):
+    """argparse type for --shard: 'I/K' -> (I, K) with 1 <= I <= K."""
+    match = re.fullmatch(r'(\d+)/(\d+)', text.strip())
+    if not match or not 1 <= int(match[1]) <= int(match[2]):
+        raise argparse.ArgumentTypeError(f"expected I/K with 1 <= I <= K, got {text!r}")
+    return int(match[1]), int(match[2])
+
+def shard_file(path, shard, shards, suffix=''):
+    """out.csv -> out.shard-2-of-4.csv; suffix goes before the extension (out.shard-2-of-4.input.csv)."""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.shard-{shard}-of-{shards}{suffix}{ext}"
+
+def shard_keys(df):
+    """The key each row of df is sharded by: its normalized Product name, or its ID when the name is blank."""
+    keys = df['Product'].map(normalize_query) if 'Product' in df.columns else pd.Series('', index=df.index)
+    if 'ID' in df.columns:
+        keys = keys.where(keys != '', 'id:' + df['ID'].astype(str))
+    return keys
+
+def shard_of(key, shards):
+    """Shard (1..shards) of a row key. A hash of its bytes, so every process and machine agrees."""
+    digest = hashlib.sha1(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shards + 1
+
+def split_input(input_file, path, shard, shards, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write the rows of input_file in shard (of shards) to path, numbered in SOURCE_ROW_COLUMN; returns their count.
+
+    Cells are copied as text, so the shard reads them back as they were.
+    """
+    rows = 0
+    with open(path, 'w', encoding='utf-8', newline='') as out:
+        header = True
+        for chunk in pd.read_csv(input_file, chunksize=chunk_size, dtype=str, keep_default_na=False):
+            part = chunk[shard_keys(chunk).map(lambda key: shard_of(key, shards)) == shard].copy()
+            part.insert(0, SOURCE_ROW_COLUMN, part.index)
+            part.to_csv(out, index=False, header=header)
+            header = False
+            rows += len(part)
+    return rows
+
+def shard_outputs(output_file, shards=None):
+    """{shard: path} of the shard outputs of output_file, for shards parts (taken from the file names when None)."""
+    stem, ext = os.path.splitext(output_file)
+    pattern = re.compile(re.escape(os.path.basename(stem)) + r'\.shard-(\d+)-of-(\d+)' + re.escape(ext))
+    found = {}
+    for path in glob.glob(f"{glob.escape(stem)}.shard-*-of-*{glob.escape(ext)}"):
+        match = pattern.fullmatch(os.path.basename(path))
+        if match:
+            found.setdefault(int(match[2]), {})[int(match[1])] = path
+    if shards is None:
+        if len(found) > 1:
+            raise SystemExit(f"Error: shard outputs of {output_file} for {', '.join(map(str, sorted(found)))} shards; "
+                             f"pick one with --shards")
+        shards = next(iter(found), None)
+    paths = found.get(shards, {})
+    if not paths:
+        raise SystemExit(f"Error: no shard outputs of {output_file} found" + (f" for {shards} shards" if shards else ''))
+    missing = [shard for shard in range(1, shards + 1) if shard not in paths]
+    if missing:
+        raise SystemExit(f"Error: shards {', '.join(map(str, missing))} of {shards} have no output yet "
+                         f"(run them with --shard I/{shards})")
+    return dict(sorted(paths.items()))
+
+def merge_shards(output_file, shards=None):
+    """Merge the shard outputs of output_file into output_file in input row order; returns the rows written."""
+    paths = shard_outputs(output_file, shards)
+    df = pd.concat([pd.read_csv(path, dtype=str, keep_default_na=False) for path in paths.values()],
+                   ignore_index=True)
+    if SOURCE_ROW_COLUMN not in df.columns:
+        raise SystemExit(f"Error: the shard outputs of {output_file} have no {SOURCE_ROW_COLUMN} column")
+    order = df[SOURCE_ROW_COLUMN].astype(int)
+    gaps = order.max() + 1 - order.nunique() if len(order) else 0
+    if gaps:
+        print(f"Warning: {gaps} input rows are in no shard output")
+    drop = [SOURCE_ROW_COLUMN]
+    if list(df.columns[:2]) == [ROW_ID_COLUMN, SOURCE_ROW_COLUMN]:
+        drop.append(ROW_ID_COLUMN)  # Shard-local row numbers from --stream --unordered
+    df = df.iloc[order.argsort(kind='stable')].drop(columns=drop)
+    df.to_csv(output_file, index=False, encoding='utf-8-sig')
+    print(f"Merged {len(paths)} shards: {len(df)} rows into {output_file}")
+    return len(df)
+
+def merge_shard_inputs(snapshot_dir, path):
+    """Put the shard inputs a sharded run kept in snapshot_dir back into one CSV at path, in input row order.
+
+    Returns the number of shards found (0 when there are none). Only shards
+    recorded into this store are included.
+    """
+    stem, ext = os.path.splitext(CORPUS_INPUT)
+    pattern = re.compile(re.escape(stem) + r'\.shard-(\d+)-of-(\d+)' + re.escape(ext))
+    found = {}
+    for name in os.listdir(snapshot_dir):
+        match = pattern.fullmatch(name)
+        if match:
+            found.setdefault(int(match[2]), []).append(os.path.join(snapshot_dir, name))
+    if not found:
+        return 0
+    if len(found) > 1:
+        raise SystemExit(f"Error: {snapshot_dir} has shard inputs for {', '.join(map(str, sorted(found)))} shards; "
+                         f"pick one with --input")
+    paths = sorted(next(iter(found.values())))
+    df = pd.concat([pd.read_csv(shard_input, dtype=str, keep_default_na=False) for shard_input in paths],
+                   ignore_index=True)
+    df = df.iloc[df[SOURCE_ROW_COLUMN].astype(int).argsort(kind='stable')].drop(columns=[SOURCE_ROW_COLUMN])
+    df.to_csv(path, index=False)
+    return len(paths)
+
+def without_flag(argv, flag):
+    """argv without `flag VALUE` and `flag=VALUE`."""
+    kept = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == flag:
+            skip = True
+        elif not arg.startswith(flag + '='):
+            kept.append(arg)
+    return kept
+
+async def run_shards(script, args):
+    """--shards: run script once per shard at once, with this run's arguments plus --shard I/K, then merge.
+
+    Each process gets 1/K of the rate limits. Their output is printed as it
+    comes, prefixed with the shard. Returns the rows merged.
+    """
+    if not os.path.exists(args.input_file):
+        raise SystemExit(f"Error: {args.input_file} not found.")
+    shards = args.shards
+    argv = without_flag(sys.argv[1:], '--shards')
+    share = args.rate_share / shards
+
+    async def run(shard):
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, script, *argv, '--shard', f'{shard}/{shards}', '--rate-share', f'{share:g}',
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, limit=SHARD_OUTPUT_LINE_LIMIT,
+        )
+        async for line in process.stdout:
+            print(f"[shard {shard}] {line.decode('utf-8', 'replace').rstrip()}", flush=True)
+        return await process.wait()
+
+    print(f"Running {shards} shards of {args.input_file} ({args.workers} workers each)")
+    codes = await asyncio.gather(*(run(shard) for shard in range(1, shards + 1)))
+    failed = [shard for shard, code in enumerate(codes, 1) if code]
+    if failed:
+        raise SystemExit(f"Error: shards {', '.join(map(str, failed))} failed. Run them again with "
+                         f"--shard I/{shards} --resume, then merge with scraper_shard.py {args.output_file}")
+    return merge_shards(args.output_file, shards)
+
+def add_shard_args(parser):
+    """Register the --shards/--shard flags shared by both scrapers."""
+    parser.add_argument('--shards', type=int, default=1, metavar='K',
+                        help='Split the input into K parts by a hash of each product and scrape them in K processes '
+                             'at once, each with its own browser and 1/K of the rate limits; merged at the end')
+    parser.add_argument('--shard', type=shard_spec, default=None, metavar='I/K',
+                        help='Scrape only part I of K (e.g. one per machine) into OUTPUT.shard-I-of-K.csv; '
+                             'merge the parts with scraper_shard.py OUTPUT')
+
+def configure_shard(args):
+    """Apply the flags registered by add_shard_args().
+
+    A --shard run writes its own output, journal, stats, events and profile
+    files, and reads its rows from args.shard_input (see split_input()).
+    With --snapshot-dir its rows are kept as args.corpus_input
+    (input.shard-I-of-K.csv; see merge_shard_inputs()).
+    """
+    if args.shards < 1:
+        raise SystemExit("Error: --shards must be at least 1")
+    if args.shards > 1 and args.shard:
+        raise SystemExit("Error: use either --shards or --shard, not both")
+    if args.shards > 1 and args.events == '-':
+        raise SystemExit("Error: --events - cannot be used with --shards (give the shards an events file)")
+    args.corpus_input = CORPUS_INPUT
+    if not args.shard:
+        return
+    shard, shards = args.shard
+    args.corpus_input = shard_file(CORPUS_INPUT, shard, shards)
+    args.shard_input = shard_file(args.output_file, shard, shards, '.input')
+    args.output_file = shard_file(args.output_file, shard, shards)
+    for name in ('journal', 'stats_file', 'profile'):
+        if getattr(args, name):
+            setattr(args, name, shard_file(getattr(args, name), shard, shards))
+    if args.events and args.events != '-':
+        args.events = shard_file(args.events, shard, shards)
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge the shard outputs of a sharded scraper run into one CSV.')
+    parser.add_argument('output_file', help='Output CSV the shards were run with; OUTPUT.shard-I-of-K.csv are merged into it')
+    parser.add_argument('--shards', type=int, default=None, help='Number of shards K (default: from the file names)')
+    add_image_hash_args(parser)
+    args = parser.parse_args()
+
+    configure_image_hash(args)
+    merge_shards(args.output_file, args.shards)
+    if args.collapse_images:
+        # Shards only matched photos among their own rows
+        asyncio.run(collapse_file(args.output_file, args.output_file))
+        hash_index.close()
+
+if __name__ == "__main__":
+    main()